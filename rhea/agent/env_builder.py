@@ -0,0 +1,133 @@
+"""
+Builders for cold Conda environments.
+
+A build runs in phases, each timed and recorded in the Redis hash `conda_env_build_stats`:
+
+- solve: resolve the package specs without touching the prefix (`--dry-run`). Candidate
+  spec lists (e.g. strict, then relaxed `>=` versions) are tried in order.
+- fetch: download the solved packages into the shared package cache (`--download-only`).
+- link: create the prefix from the package cache (`--offline`).
+- pack: pack the environment with conda_pack (recorded by the caller).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from asyncio.subprocess import PIPE
+from typing import List, Literal, Tuple
+
+from redis import StrictRedis
+
+
+logger = logging.getLogger(__name__)
+
+EnvBuilderBackend = Literal["conda", "libmamba", "mamba", "micromamba"]
+
+# Solver/installer used for cold builds
+ENV_BUILDER = os.environ.get("RHEA_ENV_BUILDER", "libmamba")
+
+# Package cache shared by all agents on a node
+PKGS_DIR = os.environ.get("RHEA_PKGS_DIR", "/tmp/rhea/pkgs")
+
+# Number of parallel package downloads
+FETCH_THREADS = int(os.environ.get("RHEA_FETCH_THREADS", 8))
+
+# Redis hash aggregating build phase timings
+BUILD_STATS_KEY = "conda_env_build_stats"
+
+
+def record_build_phase(r: StrictRedis, phase: str, seconds: float) -> None:
+    """Add the duration of a build phase to the aggregated timings."""
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrbyfloat(BUILD_STATS_KEY, f"{phase}_seconds", seconds)
+    pipe.hincrby(BUILD_STATS_KEY, f"{phase}_count", 1)
+    pipe.execute()
+
+
+class EnvBuilder:
+    """
+    Builds Conda environments with a configurable backend (`conda`, `conda --solver=libmamba`,
+    `mamba` or `micromamba`), sharing one package cache between all builds on a node.
+    """
+
+    def __init__(
+        self,
+        r: StrictRedis | None = None,
+        backend: EnvBuilderBackend = ENV_BUILDER,  # type: ignore
+        pkgs_dir: str = PKGS_DIR,
+        fetch_threads: int = FETCH_THREADS,
+    ):
+        if backend not in ("conda", "libmamba", "mamba", "micromamba"):
+            raise ValueError(f"Unknown environment builder backend '{backend}'")
+        self.r = r
+        self.backend = backend
+        self.pkgs_dir = pkgs_dir
+        self.fetch_threads = fetch_threads
+
+    def command(self, prefix: str, packages: List[str], *flags: str) -> List[str]:
+        if self.backend in ("conda", "libmamba"):
+            cmd = ["conda", "create"]
+            if self.backend == "libmamba":
+                cmd.append("--solver=libmamba")
+        else:
+            cmd = [self.backend, "create"]
+        return [*cmd, "-p", prefix, "-y", *flags, *packages]
+
+    def environ(self) -> dict[str, str]:
+        env = os.environ.copy()
+        env["CONDA_PKGS_DIRS"] = self.pkgs_dir
+        env["CONDA_FETCH_THREADS"] = str(self.fetch_threads)
+        env["MAMBA_DOWNLOAD_THREADS"] = str(self.fetch_threads)
+        env["MAMBA_EXTRACT_THREADS"] = str(self.fetch_threads)
+        return env
+
+    async def _run(self, cmd: List[str]) -> Tuple[int, str, str]:
+        logger.debug(f"Running {' '.join(cmd)}")
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=PIPE, stderr=PIPE, env=self.environ()
+        )
+        stdout, stderr = await proc.communicate()
+        return proc.returncode or 0, stdout.decode(), stderr.decode()
+
+    async def _phase(self, phase: str, cmd: List[str]) -> Tuple[int, str, str]:
+        start = time.perf_counter()
+        result = await self._run(cmd)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Environment build phase '{phase}' took {elapsed:.1f}s")
+        if self.r is not None:
+            await asyncio.to_thread(record_build_phase, self.r, phase, elapsed)
+        return result
+
+    async def solve(self, prefix: str, candidates: List[List[str]]) -> List[str]:
+        """
+        Find the first list of package specs that can be solved, e.g. strict then relaxed.
+        Returns: The solvable package specs.
+        """
+        stdout = stderr = ""
+        for packages in candidates:
+            rc, stdout, stderr = await self._phase(
+                "solve", self.command(prefix, packages, "--dry-run", "--json")
+            )
+            if rc == 0:
+                return packages
+            logger.info(f"Failed to solve {packages}")
+        raise RuntimeError(stdout.strip() + "\n" + stderr.strip())
+
+    async def build(self, prefix: str, candidates: List[List[str]]) -> List[str]:
+        """
+        Create an environment at `prefix` from the first solvable list of package specs.
+        Returns: The package specs the environment was created from.
+        """
+        os.makedirs(self.pkgs_dir, exist_ok=True)
+        packages = await self.solve(prefix, candidates)
+
+        for phase, flag in (("fetch", "--download-only"), ("link", "--offline")):
+            rc, stdout, stderr = await self._phase(
+                phase, self.command(prefix, packages, flag)
+            )
+            if rc != 0:
+                raise RuntimeError(stdout.strip() + "\n" + stderr.strip())
+        return packages
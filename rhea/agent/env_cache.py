@@ -0,0 +1,182 @@
+"""
+Node-local cache of unpacked Conda environments.
+
+Environments are unpacked once per node into `{root}/{key}` and shared read-only by every
+agent on the node. A per-environment file lock makes sure only one agent populates an
+environment, and agents hold a lease file while they use one. Environments without leases
+are evicted least-recently-used first when the cache grows beyond its size budget.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List
+
+from rhea.agent.node_cache import (
+    NODE_CACHE_ROOT,
+    async_file_lock,
+    create_lease,
+    file_lock,
+    has_live_leases,
+    release_lease,
+    touch_lease,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Root of the node-local environment cache
+ENV_ROOT = os.environ.get("RHEA_ENV_ROOT", os.path.join(NODE_CACHE_ROOT, "envs"))
+
+# Total size of unpacked environments kept on a node in bytes
+ENV_ROOT_MAX_BYTES = int(os.environ.get("RHEA_ENV_ROOT_MAX_BYTES", 100 * 1024**3))
+
+# Marker written once an environment is fully populated
+READY_MARKER = ".rhea-ready"
+
+
+def directory_size(path: str) -> int:
+    """Disk usage of a directory, counting hardlinked files once."""
+    seen = set()
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_blocks * 512
+    return total
+
+
+@dataclass
+class EnvLease:
+    key: str
+    path: str
+    lease_path: str
+
+
+class NodeEnvCache:
+    """
+    Unpacked Conda environments shared by the agents on a node, stored at `{root}/{key}`.
+    Environments are populated in place, since `conda-unpack` fixes prefixes to their path.
+    """
+
+    def __init__(self, root: str = ENV_ROOT, max_bytes: int = ENV_ROOT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.root, ".locks", f"{key}.lock")
+
+    def _lease_dir(self, key: str) -> str:
+        return os.path.join(self.root, ".leases", key)
+
+    def is_ready(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), READY_MARKER))
+
+    def _mark_ready(self, key: str) -> None:
+        size = directory_size(self.path(key))
+        with open(os.path.join(self.path(key), READY_MARKER), "w") as f:
+            json.dump({"size": size, "created": time.time()}, f)
+
+    def _create_lease(self, key: str) -> EnvLease:
+        lease_path = create_lease(self._lease_dir(key))
+        try:
+            os.utime(os.path.join(self.path(key), READY_MARKER))  # LRU bookkeeping
+        except FileNotFoundError:
+            pass
+        return EnvLease(key=key, path=self.path(key), lease_path=lease_path)
+
+    def _lease_if_ready(self, key: str) -> EnvLease | None:
+        # A shared lock keeps eviction from removing the environment while it is leased
+        with file_lock(self._lock_path(key), shared=True):
+            if not self.is_ready(key):
+                return None
+            return self._create_lease(key)
+
+    async def acquire(
+        self, key: str, populate: Callable[[str], Awaitable[None]]
+    ) -> EnvLease:
+        """
+        Lease the environment `key`, calling `populate(path)` to create it if it is not cached.
+        Concurrent agents block on the environment lock instead of populating it again.
+        """
+        lease = await asyncio.to_thread(self._lease_if_ready, key)
+        if lease is not None:
+            logger.info(f"Environment cache hit for {key}")
+            return lease
+
+        path = self.path(key)
+        async with async_file_lock(self._lock_path(key)):
+            if self.is_ready(key):
+                logger.info(f"Environment {key} populated by another agent")
+            else:
+                # Remains of an agent that died while populating
+                await asyncio.to_thread(shutil.rmtree, path, True)
+                logger.info(f"Populating environment {key} at {path}")
+                try:
+                    await populate(path)
+                except BaseException:
+                    await asyncio.to_thread(shutil.rmtree, path, True)
+                    raise
+                await asyncio.to_thread(self._mark_ready, key)
+            lease = await asyncio.to_thread(self._create_lease, key)
+
+        await asyncio.to_thread(self.evict)
+        return lease
+
+    def touch(self, lease: EnvLease) -> None:
+        """Refresh a lease, e.g. whenever the environment is used."""
+        touch_lease(lease.lease_path)
+
+    def release(self, lease: EnvLease) -> None:
+        """Release a lease. The environment stays cached until it is evicted."""
+        release_lease(lease.lease_path)
+
+    def _entries(self) -> List[tuple[str, int, float]]:
+        entries = []
+        try:
+            scanned = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return entries
+        for entry in scanned:
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            marker = os.path.join(entry.path, READY_MARKER)
+            try:
+                with open(marker) as f:
+                    size = json.load(f)["size"]
+                last_used = os.stat(marker).st_mtime
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            entries.append((entry.name, size, last_used))
+        return entries
+
+    def evict(self) -> None:
+        """Remove least recently used environments without leases until under budget."""
+        entries = self._entries()
+        used = sum(size for _, size, _ in entries)
+        for key, size, _ in sorted(entries, key=lambda e: e[2]):
+            if used <= self.max_bytes:
+                break
+            with file_lock(self._lock_path(key), blocking=False) as locked:
+                if not locked or has_live_leases(self._lease_dir(key)):
+                    continue
+                # Drop the marker first, so nobody leases a half-removed environment
+                os.remove(os.path.join(self.path(key), READY_MARKER))
+                shutil.rmtree(self.path(key), ignore_errors=True)
+            used -= size
+            logger.info(f"Evicted environment {key} ({size} bytes)")
@@ -0,0 +1,532 @@
+"""
+Storage for packed Conda environments.
+
+Packed environments (conda_pack tar.zst) are stored as objects in MinIO/S3 and cached on
+the node-local disk, while Redis only holds a small JSON metadata record per environment in
+the hash `conda_envs`. Environments packed before this store existed were kept as raw blobs
+in the same hash, and are still readable.
+"""
+
+from __future__ import annotations
+
+import os
+import io
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+import uuid
+from dataclasses import dataclass, asdict
+from contextlib import contextmanager
+from tempfile import mkstemp
+from typing import BinaryIO, Generator, Iterator
+
+from minio import Minio
+from minio.commonconfig import ComposeSource
+from minio.error import S3Error
+from redis import StrictRedis
+from redis.exceptions import WatchError
+
+from rhea.agent.node_cache import NODE_CACHE_ROOT
+
+
+logger = logging.getLogger(__name__)
+
+# Redis hash holding one metadata record per environment
+ENV_METADATA_KEY = "conda_envs"
+
+# Redis hash mapping tool ids to the key of their environment
+ENV_INDEX_KEY = "conda_env_index"
+
+# Redis hash recording environments that failed to build
+ENV_FAILURES_KEY = "conda_env_failures"
+
+# Redis hash holding the packed size of every environment, for metrics
+ENV_SIZES_KEY = "conda_env_sizes"
+
+# Prefix of the lease held by the agent packing an environment
+PACK_LEASE_PREFIX = "conda_env_pack:"
+
+# Lifetime of a pack lease in seconds, renewed while packing
+PACK_LEASE_TTL = 120
+
+# Length of build errors kept in failure records
+MAX_FAILURE_LENGTH = 4096
+
+# Bucket holding the packed environments
+ENV_BUCKET = os.environ.get("RHEA_ENV_BUCKET", "conda-envs")
+
+# Node-local cache of packed environments
+ENV_CACHE_ROOT = os.environ.get(
+    "RHEA_ENV_CACHE", os.path.join(NODE_CACHE_ROOT, "env-artifacts")
+)
+
+# Total size of the node-local cache in bytes
+ENV_CACHE_MAX_BYTES = int(os.environ.get("RHEA_ENV_CACHE_MAX_BYTES", 20 * 1024**3))
+
+# Artifacts larger than this are streamed from object storage instead of cached locally
+ENV_CACHE_MAX_ARTIFACT_BYTES = int(
+    os.environ.get("RHEA_ENV_CACHE_MAX_ARTIFACT_BYTES", 4 * 1024**3)
+)
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_CHUNK_SIZE = 1 << 20
+
+# Number of chunks buffered between the download and the consumer
+PREFETCH_CHUNKS = 8
+
+
+@dataclass
+class EnvArtifact:
+    """Metadata record of a packed environment."""
+
+    name: str
+    object_name: str
+    size: int
+    sha256: str
+    created: float
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> EnvArtifact:
+        return cls(**json.loads(raw))
+
+
+def get_env_failure(r: StrictRedis, env_name: str) -> dict | None:
+    """The recorded build failure of an environment, if any."""
+    raw = r.hget(ENV_FAILURES_KEY, env_name)
+    return json.loads(raw) if raw is not None else None  # type: ignore
+
+
+class PackLease:
+    """
+    Exclusive right to pack an environment, held as a Redis key with a TTL.
+    While held, the lease is renewed from a background thread, so it only expires if the
+    holder dies.
+    """
+
+    def __init__(self, r: StrictRedis, env_name: str, ttl: int = PACK_LEASE_TTL):
+        self.r = r
+        self.key = f"{PACK_LEASE_PREFIX}{env_name}"
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def acquire(self) -> bool:
+        if not self.r.set(self.key, self.token, nx=True, px=self.ttl * 1000):
+            return False
+        self._thread = threading.Thread(target=self._renew, daemon=True)
+        self._thread.start()
+        return True
+
+    def _if_held(self, command: str, *args) -> bool:
+        """Run `command` on the lease key only while it still holds our token."""
+        with self.r.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                held = pipe.get(self.key)
+                if isinstance(held, bytes):
+                    held = held.decode()
+                if held != self.token:
+                    return False
+                pipe.multi()
+                pipe.execute_command(command, self.key, *args)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            if not self._if_held("PEXPIRE", self.ttl * 1000):
+                logger.warning(f"Lost pack lease {self.key}")
+                return
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._if_held("DEL")
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_EOF = object()
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    Read-only file object over an iterator of chunks.
+
+    A background thread pulls chunks into a bounded queue, so producing the next chunks
+    (e.g. downloading) overlaps with consuming the current one while memory stays bounded
+    by `max_chunks` chunks.
+    """
+
+    def __init__(self, chunks: Iterator[bytes], max_chunks: int = PREFETCH_CHUNKS):
+        super().__init__()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._stop = threading.Event()
+        self._buf = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, chunks: Iterator[bytes]) -> None:
+        try:
+            for chunk in chunks:
+                if chunk and not self._put(chunk):
+                    break
+            else:
+                self._put(_EOF)
+        except BaseException as e:
+            self._put(e)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buf:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is _EOF:
+                self._eof = True
+                return 0
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            self._buf = memoryview(item)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def drain(self) -> None:
+        """Consume the remaining chunks, e.g. to let a tee of the stream complete."""
+        while self.readinto(bytearray(_CHUNK_SIZE)):
+            pass
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        super().close()
+
+
+class LocalArtifactCache:
+    """
+    Size-bounded, least-recently-used cache of artifacts on the local disk.
+    Files are written to a temporary sibling and renamed into place.
+    """
+
+    def __init__(
+        self, root: str = ENV_CACHE_ROOT, max_bytes: int = ENV_CACHE_MAX_BYTES
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, object_name: str) -> str:
+        return os.path.join(self.root, object_name)
+
+    def get(self, artifact: EnvArtifact) -> str | None:
+        """Path of the cached artifact, or None if it is missing or incomplete."""
+        path = self.path(artifact.object_name)
+        try:
+            if os.path.getsize(path) != artifact.size:
+                return None
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, artifact: EnvArtifact, chunks: Iterator[bytes]) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        self.evict(artifact.size)
+        fd, tmp_path = mkstemp(dir=self.root, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path(artifact.object_name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.path(artifact.object_name)
+
+    def tee(
+        self, artifact: EnvArtifact, chunks: Iterator[bytes]
+    ) -> Generator[bytes, None, None]:
+        """
+        Pass chunks through while writing them to the cache. The artifact is only put in place
+        once the stream is complete.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        self.evict(artifact.size)
+        fd, tmp_path = mkstemp(dir=self.root, prefix=".partial-")
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            if written == artifact.size:
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path(artifact.object_name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self, incoming: int = 0) -> None:
+        """Remove least recently used artifacts until `incoming` bytes fit in the budget."""
+        try:
+            entries = [
+                e
+                for e in os.scandir(self.root)
+                if e.is_file() and not e.name.startswith(".partial-")
+            ]
+        except FileNotFoundError:
+            return
+        used = sum(e.stat().st_size for e in entries)
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if used + incoming <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                used -= size
+                logger.info(f"Evicted {entry.name} from local environment cache")
+            except FileNotFoundError:
+                pass
+
+
+class EnvArtifactStore:
+    """
+    Tiered store for packed Conda environments.
+
+    Reads are served from the node-local cache first, then streamed from object storage.
+    Artifacts up to `max_cached_artifact` bytes are placed in the local cache on their way
+    through, larger artifacts are always streamed. Redis only holds metadata, written once
+    the artifact is fully uploaded.
+    """
+
+    def __init__(
+        self,
+        r: StrictRedis,
+        minio: Minio,
+        bucket: str = ENV_BUCKET,
+        local: LocalArtifactCache | None = None,
+        max_cached_artifact: int = ENV_CACHE_MAX_ARTIFACT_BYTES,
+    ):
+        self.r = r
+        self.minio = minio
+        self.bucket = bucket
+        self.local = local if local is not None else LocalArtifactCache()
+        self.max_cached_artifact = max_cached_artifact
+        self._bucket_ready = False
+
+    def _ensure_bucket(self) -> None:
+        if self._bucket_ready:
+            return
+        try:
+            if not self.minio.bucket_exists(self.bucket):
+                self.minio.make_bucket(self.bucket)
+        except S3Error as e:
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+        self._bucket_ready = True
+
+    def set_tool_env(self, tool_id: str, env_name: str) -> None:
+        self.r.hset(ENV_INDEX_KEY, tool_id, env_name)
+
+    def get_tool_env(self, tool_id: str) -> str | None:
+        env_name = self.r.hget(ENV_INDEX_KEY, tool_id)
+        if isinstance(env_name, bytes):
+            return env_name.decode()
+        return env_name  # type: ignore
+
+    def record_failure(self, env_name: str, tool_id: str, error: str) -> None:
+        record = {
+            "tool_id": tool_id,
+            "error": error[-MAX_FAILURE_LENGTH:],
+            "time": time.time(),
+        }
+        self.r.hset(ENV_FAILURES_KEY, env_name, json.dumps(record))
+
+    def get_failure(self, env_name: str) -> dict | None:
+        return get_env_failure(self.r, env_name)
+
+    def clear_failure(self, env_name: str) -> None:
+        self.r.hdel(ENV_FAILURES_KEY, env_name)
+
+    def exists(self, env_name: str) -> bool:
+        return bool(self.r.hexists(ENV_METADATA_KEY, env_name))
+
+    def pack_lease(self, env_name: str) -> PackLease:
+        return PackLease(self.r, env_name)
+
+    def pack_in_progress(self, env_name: str) -> bool:
+        return bool(self.r.exists(f"{PACK_LEASE_PREFIX}{env_name}"))
+
+    def wait_for(
+        self, env_name: str, timeout: float, poll_interval: float = 2.0
+    ) -> bool:
+        """
+        Wait for an in-progress pack of `env_name` by another agent to finish.
+        Returns: True if the environment is stored.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.exists(env_name):
+                return True
+            if not self.pack_in_progress(env_name):
+                break
+            time.sleep(poll_interval)
+        return self.exists(env_name)
+
+    def get_metadata(self, env_name: str) -> EnvArtifact | bytes | None:
+        """
+        Metadata of an environment, the raw blob for environments stored inline in Redis
+        by older agents, or None if the environment is not stored.
+        """
+        raw: bytes | None = self.r.hget(ENV_METADATA_KEY, env_name)  # type: ignore
+        if raw is None:
+            return None
+        if raw.startswith(_ZSTD_MAGIC):
+            return raw
+        return EnvArtifact.from_json(raw)
+
+    def put(self, env_name: str, path: str) -> EnvArtifact:
+        """
+        Upload a packed environment from a local file and register its metadata.
+        """
+        size = os.path.getsize(path)
+        if size <= 0:
+            raise RuntimeError("Length of packaged environment <=0!")
+
+        artifact = EnvArtifact(
+            name=env_name,
+            object_name=f"{env_name}.tar.zst",
+            size=size,
+            sha256=_file_digest(path),
+            created=time.time(),
+        )
+
+        # Upload under a temporary name, then move into place with a server-side copy,
+        # so the final object is never partially written
+        self._ensure_bucket()
+        tmp_name = f"_partial/{artifact.object_name}.{uuid.uuid4().hex}"
+        self.minio.fput_object(
+            self.bucket,
+            tmp_name,
+            path,
+            content_type="application/zstd",
+            metadata={"sha256": artifact.sha256},
+        )
+        try:
+            self.minio.compose_object(
+                self.bucket,
+                artifact.object_name,
+                [ComposeSource(self.bucket, tmp_name)],
+            )
+        finally:
+            self.minio.remove_object(self.bucket, tmp_name)
+
+        if size <= self.max_cached_artifact:
+            with open(path, "rb") as f:
+                self.local.put(artifact, iter(lambda: f.read(_CHUNK_SIZE), b""))
+
+        # Metadata last, so readers never see an environment that is not fully stored
+        pipe = self.r.pipeline(transaction=True)
+        pipe.hset(ENV_METADATA_KEY, env_name, artifact.to_json())
+        pipe.hset(ENV_SIZES_KEY, env_name, str(size))
+        pipe.execute()
+        logger.info(f"Environment '{env_name}' stored in bucket '{self.bucket}'")
+        return artifact
+
+    def _stream_remote(self, artifact: EnvArtifact) -> Iterator[bytes]:
+        resp = self.minio.get_object(self.bucket, artifact.object_name)
+        try:
+            yield from resp.stream(_CHUNK_SIZE)
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    @contextmanager
+    def open(self, env_name: str) -> Iterator[BinaryIO]:
+        """
+        Open a packed environment for streaming reads.
+        Raises KeyError if the environment is not stored.
+        """
+        metadata = self.get_metadata(env_name)
+        if metadata is None:
+            raise KeyError(
+                f"No entry for '{env_name}' in Redis hash '{ENV_METADATA_KEY}'"
+            )
+
+        if isinstance(metadata, bytes):
+            logger.info(f"Reading legacy environment '{env_name}' from Redis")
+            yield io.BytesIO(metadata)
+            return
+
+        path = self.local.get(metadata)
+        if path is not None:
+            with open(path, "rb") as f:
+                yield f
+            return
+
+        # Download in the background while the caller consumes the stream, caching small
+        # enough artifacts on the local disk on the way through
+        chunks = self._stream_remote(metadata)
+        if metadata.size <= self.max_cached_artifact:
+            logger.info(f"Streaming and caching environment '{env_name}'")
+            chunks = self.local.tee(metadata, chunks)
+        else:
+            logger.info(f"Streaming environment '{env_name}' from '{self.bucket}'")
+
+        reader = PrefetchReader(chunks)
+        try:
+            yield reader  # type: ignore
+            reader.drain()
+        finally:
+            reader.close()
+
+    def delete(self, env_name: str) -> None:
+        metadata = self.get_metadata(env_name)
+        self.r.hdel(ENV_METADATA_KEY, env_name)
+        self.r.hdel(ENV_SIZES_KEY, env_name)
+        if isinstance(metadata, EnvArtifact):
+            try:
+                self.minio.remove_object(self.bucket, metadata.object_name)
+            except S3Error as e:
+                logger.warning(f"Failed to remove {metadata.object_name}: {e}")
+            path = self.local.path(metadata.object_name)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,192 @@
+"""
+Node-local container image cache.
+
+Images pulled for agents stay on the node after the agent shuts down. Agents take a lease on
+the image they run, pulls of the same image are serialised with a file lock (and skipped when
+the image is present and its tag still points at the same digest), and images without leases are removed least-recently-used
+first once the images pulled through the cache exceed the disk budget.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import uuid
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import List, Literal
+
+from rhea.agent.node_cache import (
+    NODE_CACHE_ROOT,
+    async_file_lock,
+    create_lease,
+    file_lock,
+    has_live_leases,
+    release_lease,
+    touch_lease,
+)
+from rhea.agent.utils import (
+    inspect_image,
+    pull_image,
+    remote_image_digest,
+    remove_image,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Cache state (locks, leases, usage records)
+IMAGE_CACHE_ROOT = os.environ.get(
+    "RHEA_IMAGE_CACHE", os.path.join(NODE_CACHE_ROOT, "images")
+)
+
+# Total size of the images pulled through the cache in bytes
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("RHEA_IMAGE_CACHE_MAX_BYTES", 50 * 1024**3))
+
+
+def image_slug(image: str) -> str:
+    return hashlib.sha256(image.encode()).hexdigest()[:16]
+
+
+@dataclass
+class ImageLease:
+    image: str
+    lease_path: str
+
+
+class ImageCache:
+    def __init__(
+        self,
+        engine: Literal["docker", "podman"],
+        root: str = IMAGE_CACHE_ROOT,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+    ):
+        self.engine: Literal["docker", "podman"] = engine
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, kind: str, name: str) -> str:
+        path = os.path.join(self.root, kind, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _record_path(self, image: str) -> str:
+        return self._path("records", f"{image_slug(image)}.json")
+
+    def _lease_dir(self, image: str) -> str:
+        return os.path.join(self.root, "leases", image_slug(image))
+
+    def _lock_path(self, name: str) -> str:
+        return os.path.join(self.root, "locks", f"{name}.lock")
+
+    def _write_record(self, image: str, size: int) -> None:
+        path = self._record_path(image)
+        tmp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp_path, "w") as f:
+            json.dump({"image": image, "size": size}, f)
+        os.replace(tmp_path, path)
+
+    def _create_lease(self, image: str) -> ImageLease:
+        lease_path = create_lease(self._lease_dir(image))
+        self._touch_record(image)
+        return ImageLease(image=image, lease_path=lease_path)
+
+    def _touch_record(self, image: str) -> None:
+        try:
+            os.utime(self._record_path(image))  # LRU bookkeeping
+        except FileNotFoundError:
+            pass
+
+    async def _is_current(self, image: str) -> bool:
+        """
+        Whether the image is present on the node, and its tag still points at the pulled
+        digest. The local copy is trusted when the registry cannot be reached.
+        """
+        raw = await inspect_image(image, self.engine, "{{json .RepoDigests}}")
+        if raw is None:
+            return False
+        if "@" in image:  # Pinned by digest
+            return True
+        remote = await remote_image_digest(image)
+        if remote is None:
+            return True
+        local = {d.rpartition("@")[2] for d in json.loads(raw) or []}
+        return remote in local
+
+    async def acquire(self, image: str) -> ImageLease:
+        """
+        Lease an image, pulling it unless it is already present on the node and up to date.
+        Concurrent agents wait for an in-progress pull of the same image.
+        """
+        async with async_file_lock(self._lock_path(image_slug(image))):
+            pulled = False
+            if await self._is_current(image):
+                logger.info(f"Image {image} already present")
+            else:
+                logger.info(f"Pulling image {image}")
+                await pull_image(image, self.engine)
+                pulled = True
+            if pulled or not os.path.exists(self._record_path(image)):
+                size = await inspect_image(image, self.engine, "{{.Size}}")
+                self._write_record(image, int(size or 0))
+            lease = self._create_lease(image)
+
+        await self.evict()
+        return lease
+
+    def touch(self, lease: ImageLease) -> None:
+        """Refresh a lease, e.g. whenever the image is used."""
+        touch_lease(lease.lease_path)
+        self._touch_record(lease.image)
+
+    def release(self, lease: ImageLease) -> None:
+        """Release a lease. The image stays on the node until it is evicted."""
+        release_lease(lease.lease_path)
+        self._touch_record(lease.image)
+
+    def _records(self) -> List[tuple[str, int, float, str]]:
+        records = []
+        try:
+            entries = list(os.scandir(os.path.join(self.root, "records")))
+        except FileNotFoundError:
+            return records
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    record = json.load(f)
+                records.append(
+                    (record["image"], record["size"], entry.stat().st_mtime, entry.path)
+                )
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+        return records
+
+    async def evict(self) -> None:
+        """Remove least recently used images without leases until under budget."""
+        with file_lock(self._lock_path("evict"), blocking=False) as locked:
+            if not locked:
+                return  # Another agent is evicting
+
+            records = self._records()
+            used = sum(size for _, size, _, _ in records)
+            for image, size, _, record_path in sorted(records, key=lambda r: r[2]):
+                if used <= self.max_bytes:
+                    break
+                with file_lock(
+                    self._lock_path(image_slug(image)), blocking=False
+                ) as image_locked:
+                    if not image_locked:
+                        continue  # Being pulled or leased right now
+                    if has_live_leases(self._lease_dir(image)):
+                        continue
+                    try:
+                        await remove_image(image, self.engine)
+                    except RuntimeError:
+                        # e.g. still used by a container outside of the cache
+                        continue
+                    os.remove(record_path)
+                    used -= size
+                    logger.info(f"Evicted image {image} ({size} bytes)")
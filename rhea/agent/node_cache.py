@@ -0,0 +1,99 @@
+"""
+Building blocks of the node-local caches (tool directories, packed and unpacked
+environments, container images).
+
+Cache state lives under the `/tmp` mount shared by all agents on a node. Agents coordinate
+with file locks, and hold a lease file while they use a cached entry, so entries in use are
+never evicted. Lease files are refreshed on use, and those not refreshed for `LEASE_TTL`
+are considered abandoned by a crashed agent.
+"""
+
+import os
+import time
+import uuid
+import fcntl
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+# Root of the node-local caches
+NODE_CACHE_ROOT = os.environ.get("RHEA_NODE_CACHE", "/tmp/rhea")
+
+# Leases not refreshed for this long (seconds) are considered abandoned by a crashed agent
+LEASE_TTL = 24 * 3600
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+    """
+    Hold a lock on `path` (created if needed).
+    Yields: Whether the lock was taken, always True when `blocking`.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(f, mode | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def async_file_lock(path: str) -> AsyncIterator[None]:
+    """Hold an exclusive lock on `path`, waiting for it without blocking the event loop."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "a")
+    try:
+        await asyncio.to_thread(fcntl.flock, f, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+def create_lease(lease_dir: str) -> str:
+    """Returns: The path of a new lease file in `lease_dir`."""
+    os.makedirs(lease_dir, exist_ok=True)
+    lease_path = os.path.join(lease_dir, f"{os.getpid()}-{uuid.uuid4().hex}")
+    with open(lease_path, "w"):
+        pass
+    return lease_path
+
+
+def touch_lease(lease_path: str) -> None:
+    try:
+        os.utime(lease_path)
+    except FileNotFoundError:
+        with open(lease_path, "w"):
+            pass
+
+
+def release_lease(lease_path: str) -> None:
+    try:
+        os.remove(lease_path)
+    except FileNotFoundError:
+        pass
+
+
+def has_live_leases(lease_dir: str, ttl: float = LEASE_TTL) -> bool:
+    """Whether `lease_dir` holds leases refreshed within `ttl`. Abandoned ones are removed."""
+    now = time.time()
+    try:
+        entries = list(os.scandir(lease_dir))
+    except FileNotFoundError:
+        return False
+    live = False
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime < ttl:
+                live = True
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return live
@@ -7,6 +7,7 @@ from dataclasses import dataclass
 
 from rhea.utils.schema import Param, CollectionOutput
 from rhea.utils.proxy import RheaFileProxy
+from rhea.utils.lifecycle import DEFAULT_FILE_TTL
 
 from proxystore.connectors.redis import RedisKey, RedisConnector
 from proxystore.store import Store
@@ -525,6 +526,7 @@ class RheaDataOutput:
         store: Store[RedisConnector],
         name: Optional[str] = None,
         format: Optional[str] = None,
+        ttl: int = DEFAULT_FILE_TTL,
     ) -> RheaDataOutput:
         proxy: RheaFileProxy = RheaFileProxy.from_file(
             filepath, r=store.connector._redis_client
@@ -535,7 +537,7 @@ class RheaDataOutput:
         if format is not None:
             proxy.format = format
 
-        key = proxy.to_proxy(store)
+        key = proxy.to_proxy(store, ttl=ttl)
 
         return cls(
             key=RedisKey(redis_key=key),
@@ -593,7 +595,12 @@ class RheaCollectionOuput(RheaOutput):
 
     __repr__ = __str__
 
-    def resolve(self, output_dir: str, store: Store[RedisConnector]) -> None:
+    def resolve(
+        self,
+        output_dir: str,
+        store: Store[RedisConnector],
+        ttl: int = DEFAULT_FILE_TTL,
+    ) -> None:
         for collection in self.collections:
             if collection.type == "list":
                 if collection.discover_datasets is None:
@@ -625,7 +632,9 @@ class RheaCollectionOuput(RheaOutput):
                             else:
                                 name = None
                             self.files.append(
-                                RheaDataOutput.from_file(file, store, name=name)
+                                RheaDataOutput.from_file(
+                                    file, store, name=name, ttl=ttl
+                                )
                             )
                 else:
                     raise NotImplementedError(
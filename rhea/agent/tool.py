@@ -2,6 +2,7 @@ import os
 import subprocess
 import json
 import re
+import uuid
 import asyncio
 import logging
 import builtins
@@ -11,15 +12,25 @@ from typing import List, Optional, Literal
 
 from rhea.utils.schema import Tool, Param, ConfigFile
 from rhea.utils.proxy import RheaFileProxy, RheaFileHandle
+from rhea.utils.lifecycle import DEFAULT_FILE_TTL
 from rhea.agent.schema import *
 from rhea.agent.utils import (
     install_conda_env,
+    conda_env_key,
+    wait_for_pending_packs,
     configure_tool_directory,
-    pull_image,
-    remove_image,
     run_command_w_conda,
     run_command_in_container,
+    start_container,
+    exec_in_container,
+    stop_container,
+    PERSISTENT_CONTAINERS,
+    tool_environment,
 )
+from rhea.agent.env_cache import NodeEnvCache, EnvLease
+from rhea.agent.env_store import EnvArtifactStore
+from rhea.agent.image_cache import ImageCache, ImageLease
+from rhea.agent.tool_directory import ToolDirectoryCache, referenced_tool_paths
 
 from proxystore.connectors.redis import RedisConnector
 from proxystore.store import StoreConfig, get_or_create_store
@@ -32,6 +43,9 @@ from urllib3 import PoolManager
 from urllib3.util.retry import Retry
 from Cheetah.Template import Template
 
+# Maximum time (seconds) shutdown waits for background environment packing
+PACK_SHUTDOWN_TIMEOUT = 600
+
 
 class RheaToolAgent(Agent):
     def __init__(
@@ -44,11 +58,18 @@ class RheaToolAgent(Agent):
         minio_access_key: str,
         minio_secret_key: str,
         minio_secure: bool,
+        file_ttl: int = DEFAULT_FILE_TTL,
     ) -> None:
         super().__init__()
         self.tool: Tool = tool
+        self.file_ttl = file_ttl
         self.container_runtime: Literal["docker", "podman"] = container_runtime
-        self.installed_packages: List[str]
+        self.installed_packages: List[str] = []
+        self.env_cache = NodeEnvCache()
+        self.env_lease: EnvLease | None = None
+        self.image_cache = ImageCache(container_runtime)
+        self.image_lease: ImageLease | None = None
+        self.container: str | None = None
         self.tool_directory: str | None = None
         self.extra_preferences: dict = {}
         self.connector = RedisConnector(redis_host, redis_port)
@@ -77,6 +98,7 @@ class RheaToolAgent(Agent):
                 ),
             ),
         )
+        self.tool_directory_cache = ToolDirectoryCache(self.minio)
         self.logger = init_logging(level=logging.DEBUG)
         self._startup_done = asyncio.Event()
 
@@ -113,7 +135,9 @@ class RheaToolAgent(Agent):
         )
 
         # Create coroutine to pull the tool files and configure tool directory
-        dir_coro = configure_tool_directory(self.tool.id, self.minio)
+        dir_coro = configure_tool_directory(
+            self.tool.id, self.minio, tool=self.tool, cache=self.tool_directory_cache
+        )
 
         # If there are containers present in the requirements, pull the first one
         if len(self.tool.requirements.containers) > 0:
@@ -124,50 +148,80 @@ class RheaToolAgent(Agent):
                 )
             image = self.tool.requirements.containers[0].value
 
-            # Create a coroutine to pull docker image
-            pull_image_coro = pull_image(image, self.container_runtime)
+            # Lease the image from the node cache, pulling it only if it is not present
+            image_coro = self.image_cache.acquire(image)
 
             # Run coroutines
-            _, self.tool_directory = await asyncio.gather(pull_image_coro, dir_coro)
-            self.logger.debug(f"Pulled image {image} using {self.container_runtime}")
+            self.image_lease, self.tool_directory = await asyncio.gather(
+                image_coro, dir_coro
+            )
+            self.logger.debug(f"Leased image {image} using {self.container_runtime}")
 
-        # Otherwise, build Conda environment
+            # Start the container tool calls are executed in
+            if PERSISTENT_CONTAINERS:
+                self.container = await start_container(
+                    image, self.container_runtime, f"rhea-{uuid.uuid4().hex[:12]}"
+                )
+                self.logger.debug(f"Started container {self.container}")
+
+        # Otherwise, lease the Conda environment from the node cache, building it if needed
         else:
-            # Create coroutine to create Conda environment and install Conda packages
-            conda_coro = install_conda_env(
-                env_name=self.tool.id,
-                requirements=self.tool.requirements.requirements,
-                r=self.connector._redis_client,
-                target_path=f"/home/rhea/conda/envs/{self.tool.id}",
-            )
+            store = EnvArtifactStore(self.connector._redis_client, self.minio)
+            # Tools with the same requirements share one environment
+            key = conda_env_key(self.tool.requirements.requirements)
+
+            async def populate(path: str) -> None:
+                # Create Conda environment and install Conda packages
+                self.installed_packages = await install_conda_env(
+                    env_name=key,
+                    requirements=self.tool.requirements.requirements,
+                    store=store,
+                    target_path=path,
+                )
+
+            conda_coro = self.env_cache.acquire(key, populate)
 
             # Populate results
-            self.installed_packages, self.tool_directory = await asyncio.gather(
+            self.env_lease, self.tool_directory = await asyncio.gather(
                 conda_coro, dir_coro
             )
+            await asyncio.to_thread(store.set_tool_env, self.tool.id, key)
+            self.logger.debug(f"self.env_lease: {self.env_lease}")
             self.logger.debug(f"self.installed_packages: {self.installed_packages}")
 
         self.logger.debug(f"self.tool_directory: {self.tool_directory}")
         self._startup_done.set()  # Signal completion
 
     async def agent_on_shutdown(self) -> None:
-        # Cleanup container image
-        if len(self.tool.requirements.containers) > 0:
-            image = self.tool.requirements.containers[0].value
-            self.logger.info(f"Removing container image {image}")
-            await remove_image(image, engine=self.container_runtime)
-
-        # Delete Conda environment
-        else:
-            self.logger.info(f"Deleting Conda environment {self.tool.id}")
-            cmd = ["conda", "env", "remove", "-n", self.tool.id]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                raise Exception(f"Error deleting Conda environment: {result.stdout}")
+        # Tear down the persistent container
+        if self.container is not None:
+            self.logger.info(f"Removing container {self.container}")
+            await stop_container(self.container, self.container_runtime)
+            self.container = None
+
+        # Release the container image, it stays cached on the node until evicted
+        if self.image_lease is not None:
+            self.logger.info(f"Releasing container image {self.image_lease.image}")
+            self.image_cache.release(self.image_lease)
+            self.image_lease = None
+
+        # Release the Conda environment, it stays cached on the node for other agents
+        elif self.env_lease is not None:
+            # Finish storing a freshly built environment before giving it up
+            await wait_for_pending_packs(timeout=PACK_SHUTDOWN_TIMEOUT)
+            self.logger.info(f"Releasing Conda environment {self.env_lease.path}")
+            self.env_cache.release(self.env_lease)
+            self.env_lease = None
+
+    @property
+    def conda_prefix(self) -> str:
+        if self.env_lease is None:
+            raise RuntimeError("No Conda environment leased.")
+        return self.env_lease.path
 
     @action
     async def get_installed_packages(self) -> List[str]:
-        cmd = ["conda", "list", "-n", self.tool.id, "--json"]
+        cmd = ["conda", "list", "-p", self.conda_prefix, "--json"]
         result = subprocess.run(cmd, capture_output=True, text=True)
         if result.returncode != 0:
             raise Exception(f"Error listing Conda packages: {result.stdout}")
@@ -186,8 +240,8 @@ class RheaToolAgent(Agent):
             cmd = [
                 "conda",
                 "run",
-                "-n",
-                self.tool.id,
+                "-p",
+                self.conda_prefix,
                 "--no-capture-output",
                 "bash",
                 "-c",
@@ -361,14 +415,14 @@ class RheaToolAgent(Agent):
             if isinstance(param, RheaFileParam):
                 # Get RheaFileProxy object from Store
                 proxy_obj: RheaFileProxy = RheaFileProxy.from_proxy(
-                    RedisKey(param.value.redis_key), input_store
+                    RedisKey(param.value.redis_key), input_store, ttl=self.file_ttl
                 )
 
                 # Write content to a local temporary file
                 tmp_file_path = os.path.join(input_dir, proxy_obj.filename)
                 with open(tmp_file_path, "wb") as f:
                     file_object: RheaFileHandle = proxy_obj.open(
-                        r=input_store.connector._redis_client
+                        r=input_store.connector._redis_client, ttl=self.file_ttl
                     )
                     file_object.seek(0)
 
@@ -441,6 +495,20 @@ class RheaToolAgent(Agent):
             env[configfile.name] = script_path
             return script_path
 
+    async def fetch_referenced_files(self, paths: List[str]) -> None:
+        """
+        Fetch tool directory files referenced by the rendered scripts that were not staged.
+        """
+        if self.tool_directory is None:
+            return
+        referenced = set()
+        for path in paths:
+            with open(path, "r") as f:
+                referenced |= referenced_tool_paths(f.read(), self.tool_directory)
+        await self.tool_directory_cache.fetch_missing(
+            self.tool.id, self.tool_directory, referenced
+        )
+
     @action
     async def run_tool(self, params: List[RheaParam]) -> RheaOutput:
         await self._startup_done.wait()  # Wait until startup is complete.
@@ -470,12 +538,13 @@ class RheaToolAgent(Agent):
                 self.build_output_env_parameters(env, output)
 
                 # Configure configfiles (if any)
+                configfile_paths = []
                 if (
                     self.tool.configfiles is not None
                     and self.tool.configfiles.configfiles is not None
                 ):
                     for configfile in self.tool.configfiles.configfiles:
-                        self.build_configfile(env, configfile)
+                        configfile_paths.append(self.build_configfile(env, configfile))
 
                 # Configure command script
                 cmd = self.apply_interpreter_command()
@@ -492,6 +561,9 @@ class RheaToolAgent(Agent):
                     tf.write(cmd + "\n")
                     os.chmod(script_path, 0o755)
 
+                # Fetch anything from the tool directory that was not staged up front
+                await self.fetch_referenced_files([script_path, *configfile_paths])
+
                 # Remove any objects from environment
                 env["__user__"] = ""  # Clear __user__
                 for k in list(env.keys()):
@@ -501,15 +573,33 @@ class RheaToolAgent(Agent):
                     elif v is None:
                         env.pop(k)
 
-                if len(self.tool.requirements.containers) > 0:
+                # Only pass what the rendered scripts reference, plus an allowlist
+                container = len(self.tool.requirements.containers) > 0
+                tool_env = tool_environment(
+                    env, [script_path, *configfile_paths], container=container
+                )
+
+                if container:
                     # Run tool in container
                     image = self.tool.requirements.containers[0].value
-                    result = await run_command_in_container(
-                        image, self.container_runtime, script_path, env
-                    )
+                    if self.image_lease is not None:
+                        self.image_cache.touch(self.image_lease)
+                    if self.container is not None:
+                        result = await exec_in_container(
+                            self.container,
+                            self.container_runtime,
+                            script_path,
+                            tool_env,
+                        )
+                    else:
+                        result = await run_command_in_container(
+                            image, self.container_runtime, script_path, tool_env
+                        )
                 else:
                     # Run tool with Conda
-                    result = await run_command_w_conda(self.tool.id, script_path, env)
+                    prefix = self.conda_prefix
+                    self.env_cache.touch(self.env_lease)  # type: ignore
+                    result = await run_command_w_conda(prefix, script_path, tool_env)
                 # Get outputs
                 outputs = RheaOutput(
                     return_code=result.returncode,
@@ -531,6 +621,7 @@ class RheaToolAgent(Agent):
                                             self.output_store,
                                             name=out.name,
                                             format=out.format,
+                                            ttl=self.file_ttl,
                                         )
                                     )
                                 except Exception:
@@ -542,6 +633,7 @@ class RheaToolAgent(Agent):
                                         self.output_store,
                                         name=out.name,
                                         format=out.format,
+                                        ttl=self.file_ttl,
                                     )
                                 )
 
@@ -554,7 +646,7 @@ class RheaToolAgent(Agent):
                     )
                     if outputs.files is None:
                         outputs.files = []
-                        outputs.resolve(output, self.output_store)
+                        outputs.resolve(output, self.output_store, ttl=self.file_ttl)
 
                 self.logger.info(f"Finished tool execution with results: {outputs}")
                 return outputs
@@ -0,0 +1,311 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+from tempfile import mkdtemp
+from typing import Iterable, List, Set
+
+from minio import Minio
+from minio.datatypes import Object
+from minio.error import S3Error
+
+from rhea.agent.node_cache import NODE_CACHE_ROOT
+from rhea.utils.schema import Tool
+from rhea.utils.tool_archive import (
+    archive_object_name,
+    extract_archive,
+    is_hg_path,
+    is_test_data_path,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Node-local cache of tool directories
+TOOL_CACHE_ROOT = os.environ.get(
+    "RHEA_TOOL_CACHE", os.path.join(NODE_CACHE_ROOT, "tools")
+)
+
+# Maximum number of concurrent object downloads per tool directory
+DOWNLOAD_CONCURRENCY = 8
+
+# Superseded versions are kept this long (seconds) in case an agent is still copying from them
+STALE_VERSION_GRACE = 600
+
+# Staging directories left behind by crashed agents are removed after this long (seconds)
+STALE_STAGING_GRACE = 24 * 3600
+
+
+# Characters that terminate a path inside a shell command
+_PATH_CHARS = r"[^\s'\"`;|&<>()$]+"
+
+
+def referenced_tool_paths(text: str, tool_directory: str | None = None) -> Set[str]:
+    """
+    Find paths relative to the tool directory referenced in a command or configfile, either
+    through `$__tool_directory__` or through the expanded absolute `tool_directory`.
+    """
+    roots = [r"__tool_directory__\}?"]
+    if tool_directory is not None:
+        roots.append(re.escape(tool_directory.rstrip("/")))
+    pattern = re.compile(rf"(?:{'|'.join(roots)})[\"']?/({_PATH_CHARS})")
+    return {
+        os.path.normpath(m.group(1)).rstrip("/")
+        for m in pattern.finditer(text)
+        if not os.path.normpath(m.group(1)).startswith("..")
+    }
+
+
+def tool_referenced_paths(tool: Tool) -> Set[str]:
+    """
+    Paths within the tool directory that the tool definition references explicitly.
+    """
+    texts = [tool.command.command]
+    if tool.configfiles is not None and tool.configfiles.configfiles is not None:
+        texts += [c.text for c in tool.configfiles.configfiles]
+
+    paths: Set[str] = set()
+    for text in texts:
+        paths |= referenced_tool_paths(text)
+
+    # With an interpreter, the command starts with a script relative to the tool directory
+    if tool.command.interpreter and (tokens := tool.command.command.split()):
+        paths.add(os.path.normpath(tokens[0]))
+
+    return paths
+
+
+def select_objects(
+    objs: List[Object], prefix: str, referenced: Set[str] | None = None
+) -> List[Object]:
+    """
+    Select the objects to stage for a tool directory.
+    Mercurial metadata is always skipped. Test data is skipped unless the tool references it.
+    """
+    referenced = referenced or set()
+    selected = []
+    for obj in objs:
+        if not obj.object_name:
+            continue
+        relpath = obj.object_name[len(prefix) :]
+        if is_hg_path(relpath):
+            continue
+        if is_test_data_path(relpath) and not any(
+            relpath == ref or relpath.startswith(f"{ref}/") for ref in referenced
+        ):
+            continue
+        selected.append(obj)
+    return selected
+
+
+def directory_version(objs: List[Object]) -> str:
+    """
+    Content version of a tool directory, derived from the names and ETags of its objects.
+    """
+    h = hashlib.sha256()
+    for obj in sorted(objs, key=lambda o: o.object_name or ""):
+        h.update(f"{obj.object_name}\0{obj.etag}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def clone_directory(src: str, dst: str) -> None:
+    """
+    Create a private working copy of a cached directory.
+    Files are copied rather than hardlinked: hardlinks share their inode with the cache, so a
+    tool writing to or changing the mode of a file in its working copy would change it for
+    every agent on the node. Tool directories are small once test data is left out.
+    """
+    shutil.copytree(src, dst, dirs_exist_ok=True)
+
+
+class ToolDirectoryCache:
+    """
+    A node-local, content-versioned cache of tool directories pulled from object storage.
+
+    Each tool directory is stored at `{root}/{tool_id}/{version}`, where the version is derived
+    from the object ETags. Directories are staged into a temporary sibling and moved into
+    place with an atomic rename, so concurrent agents either see a complete directory or none.
+    """
+
+    def __init__(
+        self,
+        minio: Minio,
+        bucket: str = "dev",
+        root: str = TOOL_CACHE_ROOT,
+        concurrency: int = DOWNLOAD_CONCURRENCY,
+    ):
+        self.minio = minio
+        self.bucket = bucket
+        self.root = root
+        self.concurrency = concurrency
+
+    async def list_objects(self, tool_id: str) -> List[Object]:
+        prefix = f"{tool_id}/"
+        return await asyncio.to_thread(
+            lambda: list(
+                self.minio.list_objects(self.bucket, prefix=prefix, recursive=True)
+            )
+        )
+
+    async def _list_path(self, tool_id: str, relpath: str) -> List[Object]:
+        """
+        List the objects of a single file or directory within a tool directory.
+        """
+        prefix = f"{tool_id}/"
+        name = f"{prefix}{relpath}"
+        listing = await asyncio.to_thread(
+            lambda: list(
+                self.minio.list_objects(self.bucket, prefix=name, recursive=True)
+            )
+        )
+        return [
+            obj
+            for obj in listing
+            if obj.object_name
+            and not is_hg_path(obj.object_name[len(prefix) :])
+            and (obj.object_name == name or obj.object_name.startswith(f"{name}/"))
+        ]
+
+    def _download(self, object_name: str, local_path: str) -> None:
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        resp = self.minio.get_object(self.bucket, object_name)
+        try:
+            with open(local_path, "wb") as f:
+                for chunk in resp.stream(1 << 20):
+                    f.write(chunk)
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    async def _download_all(self, objs: List[Object], dest_dir: str, prefix: str):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _fetch(obj: Object):
+            name = obj.object_name
+            if not name:
+                return
+            local_path = os.path.join(dest_dir, os.path.relpath(name, prefix))
+            async with semaphore:
+                await asyncio.to_thread(self._download, name, local_path)
+
+        await asyncio.gather(*(_fetch(obj) for obj in objs))
+
+    def _remove_stale_versions(self, tool_dir: str, current: str) -> None:
+        now = time.time()
+        for entry in os.scandir(tool_dir):
+            if entry.name == current or not entry.is_dir():
+                continue
+            grace = (
+                STALE_STAGING_GRACE
+                if entry.name.startswith(".staging-")
+                else STALE_VERSION_GRACE
+            )
+            try:
+                if now - entry.stat().st_mtime > grace:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    async def stat_archive(self, tool_id: str, version: str) -> Object | None:
+        try:
+            return await asyncio.to_thread(
+                self.minio.stat_object,
+                self.bucket,
+                archive_object_name(tool_id, version),
+            )
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return None
+            raise
+
+    def _extract(self, object_name: str, dest_dir: str) -> None:
+        resp = self.minio.get_object(self.bucket, object_name)
+        try:
+            n = extract_archive(resp, dest_dir)
+        finally:
+            resp.close()
+            resp.release_conn()
+        logger.info(f"Extracted {n} archive members from {object_name}")
+
+    async def get(
+        self,
+        tool_id: str,
+        referenced: Set[str] | None = None,
+        version: str | None = None,
+    ) -> str:
+        """
+        Get the cached directory for a tool, populating the cache if necessary.
+        If a packed archive exists for the tool `version` it is extracted with a single request,
+        otherwise the per-file layout is pulled object by object.
+        Test data and Mercurial metadata are not staged unless listed in `referenced`.
+        Returns: Path to the cached directory. Must be treated as read-only.
+        """
+        prefix = f"{tool_id}/"
+        archive = (
+            await self.stat_archive(tool_id, version) if version is not None else None
+        )
+        if archive is not None:
+            # Archives never contain test data, referenced test data is pulled per-file
+            wanted = sorted(p for p in (referenced or ()) if is_test_data_path(p))
+            objs = []
+            for relpath in wanted:
+                objs += await self._list_path(tool_id, relpath)
+            cache_version = directory_version([archive, *objs])
+        else:
+            objs = select_objects(await self.list_objects(tool_id), prefix, referenced)
+            cache_version = directory_version(objs)
+
+        tool_dir = os.path.join(self.root, tool_id)
+        cached = os.path.join(tool_dir, cache_version)
+        if os.path.isdir(cached):
+            logger.info(f"Tool directory cache hit for {tool_id} ({cache_version})")
+            try:
+                os.utime(cached)
+            except OSError:
+                pass
+            return cached
+
+        os.makedirs(tool_dir, exist_ok=True)
+        staging = mkdtemp(dir=tool_dir, prefix=".staging-")
+        os.chmod(staging, 0o755)  # Readable by agents running as other users
+        try:
+            if archive is not None and archive.object_name:
+                logger.info(f"Extracting {archive.object_name} into {staging}")
+                await asyncio.to_thread(self._extract, archive.object_name, staging)
+            logger.info(f"Pulling {len(objs)} objects into {staging}")
+            await self._download_all(objs, staging, prefix)
+            os.rename(staging, cached)
+        except OSError:
+            # Another agent swapped in the same version first
+            if not os.path.isdir(cached):
+                raise
+            logger.info(f"Tool directory {cached} populated concurrently")
+        finally:
+            if os.path.isdir(staging):
+                await asyncio.to_thread(shutil.rmtree, staging, True)
+
+        await asyncio.to_thread(self._remove_stale_versions, tool_dir, cache_version)
+        logger.info(f"Objects pulled into {cached}")
+        return cached
+
+    async def fetch_missing(
+        self, tool_id: str, dest_dir: str, relpaths: Iterable[str]
+    ) -> None:
+        """
+        Fetch files (or whole directories) that were not staged into `dest_dir`.
+        Used to lazily fetch anything the rendered command turns out to need.
+        """
+        prefix = f"{tool_id}/"
+        missing = [p for p in relpaths if not os.path.exists(os.path.join(dest_dir, p))]
+        if not missing:
+            return
+
+        objs: List[Object] = []
+        for relpath in missing:
+            objs += await self._list_path(tool_id, relpath)
+
+        logger.info(f"Fetching {len(objs)} objects on demand into {dest_dir}")
+        await self._download_all(objs, dest_dir, prefix)
@@ -1,7 +1,8 @@
 import os
+import re
+import time
 import asyncio
-from asyncio.subprocess import PIPE
-import aiofiles
+import hashlib
 import logging
 import subprocess
 from subprocess import CompletedProcess
@@ -9,12 +10,17 @@ import conda_pack
 import zstandard
 import tarfile
 import shutil
-from rhea.utils.schema import Requirement
-from typing import List, Literal
-from tempfile import mkdtemp, mktemp
-from io import BytesIO
+from rhea.utils.schema import Requirement, Tool
+from rhea.agent.env_builder import EnvBuilder, record_build_phase
+from rhea.agent.env_store import EnvArtifactStore
+from rhea.agent.tool_directory import (
+    ToolDirectoryCache,
+    clone_directory,
+    tool_referenced_paths,
+)
+from typing import List, Literal, Set
+from tempfile import NamedTemporaryFile, mkdtemp, mktemp
 from minio import Minio
-from redis import StrictRedis
 
 
 logger = logging.getLogger(__name__)
@@ -48,47 +54,45 @@ def requirements_to_package_list(
     return packages
 
 
-async def configure_tool_directory(tool_id: str, minio: Minio) -> str:
+def conda_env_key(requirements: List[Requirement]) -> str:
+    """
+    Content-addressed key of the Conda environment for a set of requirements.
+    Derived from the canonical (sorted, deduplicated, lower-cased) strict package specs, so
+    tools with the same requirements share one environment.
+    """
+    specs = sorted(
+        {p.strip().lower() for p in requirements_to_package_list(requirements)}
+    )
+    digest = hashlib.sha256("\n".join(specs).encode()).hexdigest()
+    return f"env-{digest[:32]}"
+
+
+async def configure_tool_directory(
+    tool_id: str,
+    minio: Minio,
+    bucket: str = "dev",
+    tool: Tool | None = None,
+    cache: ToolDirectoryCache | None = None,
+) -> str:
     """
     Configure the scripts required for the tool.
-    Pulls all objects from the repo from object store and places them into a temporary directory
+    Pulls the repo from object store into the node-local tool directory cache (if not already
+    cached) and copies it into a temporary directory. The packed archive of the tool version
+    is preferred over the per-file layout when it exists.
+    Test data is only staged if referenced by `tool`, use `ToolDirectoryCache.fetch_missing`
+    to fetch anything else on demand, through the same `cache` so it reads the same bucket.
     Returns: A path to the temporary directory containing scripts
     NOTE: Must cleanup after yourself!
     """
-
-    async def _fetch_and_write(
-        minio: Minio, bucket: str, obj, dest_dir: str, prefix: str
-    ):
-        name = obj.object_name
-        if not name:
-            return
-
-        resp = await asyncio.to_thread(minio.get_object, bucket, name)
-        data = await asyncio.to_thread(resp.read)
-        await asyncio.to_thread(resp.close)
-        await asyncio.to_thread(resp.release_conn)
-
-        local_path = os.path.join(dest_dir, os.path.relpath(name, prefix))
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-
-        async with aiofiles.open(local_path, "wb") as f:
-            await f.write(data)
+    if cache is None:
+        cache = ToolDirectoryCache(minio, bucket=bucket)
+    referenced = tool_referenced_paths(tool) if tool is not None else None
+    version = tool.version if tool is not None else None
+    cached_dir = await cache.get(tool_id, referenced, version)
 
     dest_dir = mkdtemp()
-    prefix = f"{tool_id}/"
-
-    objs = await asyncio.to_thread(
-        lambda: list(minio.list_objects("dev", prefix=prefix, recursive=True))
-    )
-    logger.info(f"Pulling {len(objs)} objects.")
-
-    tasks = [
-        asyncio.create_task(_fetch_and_write(minio, "dev", obj, dest_dir, prefix))
-        for obj in objs
-    ]
-
-    await asyncio.gather(*tasks)
-    logger.info(f"Objects pulled into {dest_dir}")
+    await asyncio.to_thread(clone_directory, cached_dir, dest_dir)
+    logger.info(f"Tool directory {cached_dir} cloned into {dest_dir}")
     return dest_dir
 
 
@@ -103,89 +107,152 @@ async def cleanup_tool_directory(dir_path: str) -> None:
         logger.warning(f"Failed to clean up {dir_path}: {e}")
 
 
+# Background pack jobs of this process, awaited on shutdown
+_pack_tasks: Set[asyncio.Task] = set()
+
+# Maximum time (seconds) to wait for another agent to finish packing an environment
+PACK_WAIT_TIMEOUT = int(os.environ.get("RHEA_PACK_WAIT_TIMEOUT", 900))
+
+
 async def install_conda_env(
     env_name: str,
     requirements: List[Requirement],
-    r: StrictRedis,
+    store: EnvArtifactStore,
     target_path: str,
     n_threads: int = -1,
+    builder: EnvBuilder | None = None,
+    wait_for_pack: bool = False,
 ) -> List[str]:
     loop = asyncio.get_running_loop()
 
+    # Another agent is packing this environment, wait for it instead of rebuilding
+    if not await loop.run_in_executor(None, store.exists, env_name):
+        if await loop.run_in_executor(None, store.pack_in_progress, env_name):
+            logger.info(f"Waiting for environment '{env_name}' to be packed")
+            await loop.run_in_executor(
+                None, store.wait_for, env_name, PACK_WAIT_TIMEOUT
+            )
+
     # If Conda environment is cached, unpack and return immediately
-    exists = await loop.run_in_executor(None, r.hexists, "conda_envs", env_name)
+    exists = await loop.run_in_executor(None, store.exists, env_name)
     if exists:
-        await loop.run_in_executor(None, unpack_conda_env, env_name, r, target_path)
+        await loop.run_in_executor(None, unpack_conda_env, env_name, store, target_path)
         return []
 
-    # Create a new environment
-    packages: List[str] = []
-    for strict in (True, False):
-        packages = requirements_to_package_list(requirements, strict=strict)
-        proc = await asyncio.create_subprocess_exec(
-            "conda", "create", "-n", env_name, "-y", *packages, stdout=PIPE, stderr=PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        if proc.returncode == 0:
-            break
-        if not strict:
-            raise RuntimeError(stdout.decode().strip() + "\n" + stderr.decode().strip())
+    # Create a new environment, relaxing versions if the strict specs can't be solved
+    if builder is None:
+        builder = EnvBuilder(store.r)
+    packages = await builder.build(
+        target_path,
+        [
+            requirements_to_package_list(requirements, strict=True),
+            requirements_to_package_list(requirements, strict=False),
+        ],
+    )
 
-    # Pack the environment in another thread
-    future = loop.run_in_executor(None, pack_conda_env, env_name, r, n_threads)
-    asyncio.ensure_future(future)
+    # Pack the environment in the background
+    task = schedule_pack(env_name, target_path, store, n_threads)
+    if wait_for_pack:
+        await task
 
     return packages
 
 
-def pack_conda_env(env_name: str, r: StrictRedis, n_threads: int = -1) -> None:
+def schedule_pack(
+    env_name: str, prefix: str, store: EnvArtifactStore, n_threads: int = -1
+) -> asyncio.Task:
     """
-    Packages the generated Conda enviroment, compresses w/ zstd, and pushes to Redis.
+    Pack an environment in a worker thread. The job is tracked until it finishes, see
+    `wait_for_pending_packs`.
     """
-    out_path = mktemp(suffix=".tar.zst")
-    logger.info(f"Packing environment '{env_name}' into {out_path}")
-    # Pack Conda environment to buffer
-    conda_pack.pack(name=env_name, output=out_path, n_threads=n_threads)
-    with open(out_path, mode="rb") as f:
-        buff = f.read()
-        logger.debug(f"Resulting size of packed environment '{env_name}': {len(buff)}")
 
-        if len(buff) <= 0:
-            raise RuntimeError("Length of packaged environment <=0!")
+    async def _pack():
+        try:
+            await asyncio.to_thread(pack_conda_env, env_name, prefix, store, n_threads)
+        except Exception:
+            logger.exception(f"Failed to pack environment '{env_name}'")
+
+    task = asyncio.create_task(_pack())
+    _pack_tasks.add(task)
+    task.add_done_callback(_pack_tasks.discard)
+    return task
 
-        # Create Redis transaction and add buffer
-        pipe = r.pipeline(transaction=True)
-        pipe.hset("conda_envs", mapping={env_name: buff})
-        pipe.execute()
-        logger.info(f"Environment '{env_name}' stored in Redis.")
-    os.remove(out_path)
 
+async def wait_for_pending_packs(timeout: float | None = None) -> None:
+    """Wait for the background pack jobs of this process to finish."""
+    if not _pack_tasks:
+        return
+    logger.info(f"Waiting for {len(_pack_tasks)} environment pack jobs")
+    _, pending = await asyncio.wait(set(_pack_tasks), timeout=timeout)
+    if pending:
+        logger.warning(f"{len(pending)} environment pack jobs did not finish")
 
-def unpack_conda_env(env_name: str, r: StrictRedis, target_path: str) -> None:
+
+def pack_conda_env(
+    env_name: str, prefix: str, store: EnvArtifactStore, n_threads: int = -1
+) -> None:
     """
-    Get packaged Conda environment from Redis and upack it.
-    Raises KeyError if Conda enviorment is not in Redis.
+    Packages the generated Conda enviroment, compresses w/ zstd, and uploads it to the
+    environment artifact store.
+    Only one agent packs an environment at a time, others skip it while the lease is held.
     """
-    buff = r.hget("conda_envs", env_name)
-    if buff is None:
-        raise KeyError(f"No entry for '{env_name}' in Redis hash 'conda_envs'")
+    lease = store.pack_lease(env_name)
+    if not lease.acquire():
+        logger.info(f"Environment '{env_name}' is being packed by another agent")
+        return
+
+    out_path = mktemp(suffix=".tar.zst")
+    try:
+        if store.exists(env_name):
+            return
+        logger.info(f"Packing environment '{env_name}' into {out_path}")
+        start = time.perf_counter()
+        conda_pack.pack(prefix=prefix, output=out_path, n_threads=n_threads)
+        record_build_phase(store.r, "pack", time.perf_counter() - start)
+        logger.debug(
+            f"Resulting size of packed environment '{env_name}': {os.path.getsize(out_path)}"
+        )
+        store.put(env_name, out_path)
+    finally:
+        lease.release()
+        if os.path.exists(out_path):
+            os.remove(out_path)
 
-    logger.info(f"Getting environment {env_name} from Redis")
-    dctx = zstandard.ZstdDecompressor()
-    reader = dctx.stream_reader(BytesIO(buff))  # type: ignore
 
-    with tarfile.open(fileobj=reader, mode="r|*") as tar:
-        tar.extractall(path=target_path)
+def unpack_conda_env(env_name: str, store: EnvArtifactStore, target_path: str) -> None:
+    """
+    Stream a packaged Conda environment from the artifact store and unpack it.
+    Chunks are decompressed and extracted as they arrive, so memory use does not grow with
+    the size of the environment.
+    Raises KeyError if the Conda environment is not stored.
+    """
+    logger.info(f"Getting environment {env_name}")
+    dctx = zstandard.ZstdDecompressor()
+    with store.open(env_name) as f:
+        with dctx.stream_reader(f, read_size=1 << 20, closefd=False) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                tar.extractall(path=target_path)
 
     conda_unpack = os.path.join(target_path, "bin", "conda-unpack")
     subprocess.run([conda_unpack], cwd=target_path, check=True)
     logger.info(f"Unpacked environment {env_name}")
 
 
-async def pull_image(image: str, engine: Literal["docker", "podman"]):
-    cmd = [engine, "pull"]
+# Run container tools in one long-lived container per agent instead of a container per call
+PERSISTENT_CONTAINERS = os.environ.get("RHEA_PERSISTENT_CONTAINERS", "1") != "0"
+
+
+def engine_command(engine: Literal["docker", "podman"]) -> List[str]:
+    """Base command line of a container engine."""
+    cmd = [engine]
     if engine == "podman":
         cmd += ["--remote", "-H", "unix:///run/podman/podman.sock"]
+    return cmd
+
+
+async def pull_image(image: str, engine: Literal["docker", "podman"]):
+    cmd = engine_command(engine)
+    cmd.append("pull")
     cmd.append(image)
 
     proc = await asyncio.create_subprocess_exec(
@@ -200,10 +267,47 @@ async def pull_image(image: str, engine: Literal["docker", "podman"]):
     logger.info((out_b or err_b).decode(errors="replace").strip())
 
 
+async def inspect_image(
+    image: str, engine: Literal["docker", "podman"], format: str = "{{.Id}}"
+) -> str | None:
+    """
+    Inspect a local image.
+    Returns: The formatted inspect output, or None if the image is not present.
+    """
+    cmd = engine_command(engine) + ["image", "inspect", "--format", format, image]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return stdout.decode(errors="replace").strip()
+
+
+async def remote_image_digest(image: str) -> str | None:
+    """
+    Digest the registry currently serves for an image reference, without pulling it.
+    Returns: The digest, or None if the registry cannot be queried.
+    """
+    cmd = ["skopeo", "inspect", "--format", "{{.Digest}}", f"docker://{image}"]
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+    except FileNotFoundError:  # skopeo is not installed
+        return None
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        logger.debug(
+            f"Could not inspect {image} in its registry: "
+            f"{stderr.decode(errors='replace').strip()}"
+        )
+        return None
+    return stdout.decode(errors="replace").strip() or None
+
+
 async def remove_image(image: str, engine: Literal["docker", "podman"]):
-    cmd = [engine]
-    if engine == "podman":
-        cmd += ["--remote", "-H", "unix:///run/podman/podman.sock"]
+    cmd = engine_command(engine)
     cmd.append("rmi")
     cmd.append(image)
 
@@ -219,14 +323,67 @@ async def remove_image(image: str, engine: Literal["docker", "podman"]):
     logger.info((stdout or stderr).decode(errors="replace").strip())
 
 
+# Worker variables passed to tools run on the host, `conda run` needs the CONDA_ ones
+HOST_ENV_ALLOWLIST = {"PATH", "HOME", "USER", "LANG", "LC_ALL", "TZ", "TMPDIR"}
+HOST_ENV_PREFIXES = ("CONDA_", "MAMBA_", "GALAXY_")
+
+# Worker variables passed into tool containers, which keep their own PATH, HOME, etc.
+CONTAINER_ENV_ALLOWLIST = {"LANG", "LC_ALL", "TZ"}
+CONTAINER_ENV_PREFIXES = ("GALAXY_",)
+
+# Additional worker variables passed to every tool, comma-separated
+EXTRA_ENV_ALLOWLIST = set(filter(None, os.environ.get("RHEA_TOOL_ENV", "").split(",")))
+
+_ENV_REFERENCE = re.compile(r"(?<!\\)\$\{?([A-Za-z_]\w*)")
+
+
+def referenced_env_vars(text: str) -> Set[str]:
+    """Names of the shell variables referenced in a script."""
+    return set(_ENV_REFERENCE.findall(text))
+
+
+def tool_environment(
+    env: dict[str, str],
+    script_paths: List[str],
+    container: bool = False,
+    worker_env: dict[str, str] | None = None,
+) -> dict[str, str]:
+    """
+    Reduce the environment of a tool call to the tool variables its rendered scripts
+    reference, plus the allowlisted variables of the worker environment.
+    """
+    if worker_env is None:
+        worker_env = dict(os.environ)
+    referenced = {"__tool_directory__"}
+    for path in script_paths:
+        with open(path, "r") as f:
+            referenced |= referenced_env_vars(f.read())
+
+    if container:
+        allowlist, prefixes = CONTAINER_ENV_ALLOWLIST, CONTAINER_ENV_PREFIXES
+    else:
+        allowlist, prefixes = HOST_ENV_ALLOWLIST, HOST_ENV_PREFIXES
+    allowlist = allowlist | EXTRA_ENV_ALLOWLIST
+
+    result = {}
+    for key, value in env.items():
+        if key in worker_env and worker_env[key] == value:
+            # Worker variables are only passed when allowlisted
+            if key in allowlist or key.startswith(prefixes):
+                result[key] = value
+        elif key in referenced:
+            result[key] = value
+    return result
+
+
 async def run_command_w_conda(
-    tool_id: str, script_path: str, env: dict[str, str]
+    prefix: str, script_path: str, env: dict[str, str]
 ) -> CompletedProcess:
     cmd = [
         "conda",
         "run",
-        "-n",
-        tool_id,
+        "-p",
+        prefix,
         "--no-capture-output",
         "bash",
         script_path,
@@ -254,31 +411,118 @@ async def run_command_in_container(
     script_path: str,
     env: dict[str, str],
 ) -> CompletedProcess:
-    cmd = [engine]
-    if engine == "podman":
-        cmd += ["--remote", "-H", "unix:///run/podman/podman.sock"]
-    cmd += ["run", "--rm", "-v", "/tmp:/tmp"]
+    env_file, extra = write_env_file(env)
+    try:
+        cmd = engine_command(engine)
+        cmd += ["run", "--rm", "-v", "/tmp:/tmp", "--env-file", env_file]
+        for key, value in extra.items():
+            cmd += ["-e", f"{key}={value}"]
+        cmd += [image, "bash", script_path]
+
+        logger.debug(f"Starting container with command: {' '.join(cmd)}")
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
 
-    for key, value in env.items():
-        cmd += ["-e", f"{key}={value}"]
+        stdout, stderr = await process.communicate()
+    finally:
+        os.remove(env_file)
 
-    cmd += [image, "bash", script_path]
+    if process.returncode is None:
+        raise RuntimeError("No return code returned!")
+
+    result = CompletedProcess(
+        args=cmd, returncode=process.returncode, stdout=stdout, stderr=stderr
+    )
+
+    return result
 
-    logger.debug(f"Starting container with command: {' '.join(cmd)}")
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+async def start_container(
+    image: str, engine: Literal["docker", "podman"], name: str
+) -> str:
+    """
+    Start a long-lived container that tool invocations are executed in.
+    Returns: The container ID.
+    """
+    cmd = engine_command(engine)
+    cmd += ["run", "-d", "--rm", "--name", name, "-v", "/tmp:/tmp"]
+    cmd += ["--entrypoint", "sleep", image, "infinity"]
+
+    logger.debug(f"Starting container with command: {' '.join(cmd)}")
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"Failed to start container from {image}: "
+            f"{stderr.decode(errors='replace').strip()}"
+        )
+    return stdout.decode().strip()
+
+
+def write_env_file(env: dict[str, str]) -> tuple[str, dict[str, str]]:
+    """
+    Write an environment to an `--env-file`.
+    Returns: The file path, and the variables that cannot be stored in an env file
+    (multi-line values) and have to be passed with `-e`.
+    """
+    extra = {}
+    with NamedTemporaryFile("w", suffix=".env", delete=False) as f:
+        for key, value in env.items():
+            if "\n" in value or "\r" in value:
+                extra[key] = value
+            else:
+                f.write(f"{key}={value}\n")
+    return f.name, extra
+
 
-    stdout, stderr = await process.communicate()
+async def exec_in_container(
+    container: str,
+    engine: Literal["docker", "podman"],
+    script_path: str,
+    env: dict[str, str],
+) -> CompletedProcess:
+    env_file, extra = write_env_file(env)
+    try:
+        cmd = engine_command(engine)
+        cmd += ["exec", "--env-file", env_file]
+        for key, value in extra.items():
+            cmd += ["-e", f"{key}={value}"]
+        cmd += [container, "bash", script_path]
+
+        logger.debug(f"Executing in container {container}: bash {script_path}")
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+    finally:
+        os.remove(env_file)
 
     if process.returncode is None:
         raise RuntimeError("No return code returned!")
 
-    result = CompletedProcess(
+    return CompletedProcess(
         args=cmd, returncode=process.returncode, stdout=stdout, stderr=stderr
     )
 
-    return result
+
+async def stop_container(container: str, engine: Literal["docker", "podman"]):
+    cmd = engine_command(engine)
+    cmd += ["rm", "-f", container]
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    _, err_b = await proc.communicate()
+    if proc.returncode != 0:
+        logger.warning(
+            f"Failed to remove container {container}: "
+            f"{err_b.decode(errors='replace').strip()}"
+        )
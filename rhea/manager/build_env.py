@@ -0,0 +1,83 @@
+from parsl import python_app
+from rhea.utils.schema import Tool
+from typing import Dict, List
+
+
+@python_app(executors=["rhea-workers"])
+def build_env(
+    tool: Tool,
+    tool_ids: List[str],
+    redis_host: str,
+    redis_port: int,
+    minio_endpoint: str,
+    minio_access_key: str,
+    minio_secret_key: str,
+    minio_secure: bool,
+) -> Dict[str, str]:
+    """
+    Build, pack and store the Conda environment of `tool` on a worker, unless it is already
+    stored. The environment is shared by every tool in `tool_ids`.
+    Failures are recorded in the artifact store instead of raised.
+    """
+    import asyncio
+    import logging
+    import traceback
+    from minio import Minio
+    from redis import Redis
+    from rhea.agent.env_cache import NodeEnvCache
+    from rhea.agent.env_store import EnvArtifactStore
+    from rhea.agent.utils import (
+        PACK_WAIT_TIMEOUT,
+        conda_env_key,
+        install_conda_env,
+        pack_conda_env,
+    )
+
+    logger = logging.getLogger(__name__)
+
+    r = Redis(host=redis_host, port=redis_port)
+    minio = Minio(
+        endpoint=minio_endpoint,
+        access_key=minio_access_key,
+        secret_key=minio_secret_key,
+        secure=minio_secure,
+    )
+    store = EnvArtifactStore(r, minio)
+    cache = NodeEnvCache()
+    key = conda_env_key(tool.requirements.requirements)
+
+    async def _populate(path: str) -> None:
+        await install_conda_env(
+            env_name=key,
+            requirements=tool.requirements.requirements,
+            store=store,
+            target_path=path,
+            wait_for_pack=True,
+        )
+
+    async def _do_build() -> str:
+        if store.exists(key):
+            return "exists"
+        lease = await cache.acquire(key, _populate)
+        try:
+            # Already unpacked on this node, but never stored
+            if not store.exists(key):
+                await asyncio.to_thread(pack_conda_env, key, lease.path, store)
+        finally:
+            cache.release(lease)
+        # Another agent may hold the pack lease
+        if not await asyncio.to_thread(store.wait_for, key, PACK_WAIT_TIMEOUT):
+            raise RuntimeError(f"Environment {key} was built but never stored")
+        return "built"
+
+    try:
+        status = asyncio.run(_do_build())
+    except Exception as e:
+        logger.error(f"Failed to build environment {key} for {tool.id}: {e}")
+        store.record_failure(key, tool.id, traceback.format_exc())
+        return {"env": key, "tool_id": tool.id, "status": "failed", "error": str(e)}
+
+    store.clear_failure(key)
+    for tool_id in tool_ids:
+        store.set_tool_env(tool_id, key)
+    return {"env": key, "tool_id": tool.id, "status": status}
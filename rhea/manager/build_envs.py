@@ -0,0 +1,184 @@
+"""
+Pre-build the Conda environments of the tool catalog across Parsl workers, so the first
+call of a tool does not wait for `conda create`.
+
+Tools are grouped by environment key, so tools sharing requirements are built once.
+Environments already in the artifact store are skipped, as are environments that failed
+before unless `--retry-failed` is given.
+"""
+
+import asyncio
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import Future, as_completed
+from pathlib import Path
+from typing import Dict, List, cast
+
+import parsl
+from minio import Minio
+from pydantic import ValidationError
+from redis import Redis
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    AsyncEngine,
+    create_async_engine,
+    async_sessionmaker,
+)
+
+from rhea.agent.env_store import EnvArtifactStore
+from rhea.agent.utils import conda_env_key
+from rhea.manager.build_env import build_env
+from rhea.manager.parsl_config import generate_parsl_config
+from rhea.server.schema import Settings, PBSSettings, K8Settings
+from rhea.utils.models import get_all_tool_ids, get_galaxytool_by_id
+from rhea.utils.schema import Tool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def get_catalog(db_session: AsyncSession) -> List[Tool]:
+    tool_ids: List[str] = await get_all_tool_ids(db_session) or []
+    tools = []
+    for tool_id in tool_ids:
+        tool = await get_galaxytool_by_id(db_session, tool_id)
+        if tool is not None:
+            tools.append(tool)
+    return tools
+
+
+def group_by_env(tools: List[Tool]) -> Dict[str, List[Tool]]:
+    """Group the tools that run in a Conda environment by environment key."""
+    groups: Dict[str, List[Tool]] = {}
+    for tool in tools:
+        if tool.requirements.containers or not tool.requirements.requirements:
+            continue
+        try:
+            key = conda_env_key(tool.requirements.requirements)
+        except NotImplementedError as e:
+            logger.warning(f"Skipping {tool.id}: {e}")
+            continue
+        groups.setdefault(key, []).append(tool)
+    return groups
+
+
+async def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Rebuild environments that failed to build before",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Maximum number of environments to build",
+    )
+    args = parser.parse_args()
+
+    settings = Settings()
+    pbs_settings = k8_settings = None
+    if Path(".env_pbs").exists():
+        try:
+            pbs_settings = PBSSettings()  # type: ignore
+        except ValidationError:
+            pass
+    if Path(".env_k8").exists():
+        try:
+            k8_settings = K8Settings()
+        except ValidationError:
+            pass
+
+    engine: AsyncEngine = create_async_engine(
+        settings.database_url, echo=False, future=True
+    )
+    AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+        bind=engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=False,
+    )
+    async with AsyncSessionLocal() as db_session:
+        tools = await get_catalog(db_session)
+
+    store = EnvArtifactStore(
+        Redis(settings.redis_host, settings.redis_port),
+        Minio(
+            settings.minio_endpoint,
+            access_key=settings.minio_access_key,
+            secret_key=settings.minio_secret_key,
+            secure=False,
+        ),
+    )
+
+    groups = group_by_env(tools)
+    pending: Dict[str, List[Tool]] = {}
+    for key, group in groups.items():
+        if store.exists(key):
+            for tool in group:
+                store.set_tool_env(tool.id, key)
+            continue
+        if not args.retry_failed and store.get_failure(key) is not None:
+            continue
+        pending[key] = group
+    if args.limit is not None:
+        pending = dict(list(pending.items())[: args.limit])
+
+    logger.info(
+        f"{len(tools)} tools, {len(pending)} environments to build "
+        f"({len(groups) - len(pending)} stored, failed or over the limit)"
+    )
+    if not pending:
+        return
+
+    with parsl.load(
+        generate_parsl_config(
+            backend=settings.parsl_container_backend,
+            network=settings.parsl_container_network,
+            provider=settings.parsl_provider,
+            max_workers_per_node=settings.parsl_max_workers_per_node,
+            init_blocks=settings.parsl_init_blocks,
+            min_blocks=settings.parsl_min_blocks,
+            max_blocks=settings.parsl_max_blocks,
+            nodes_per_block=settings.parsl_nodes_per_block,
+            parallelism=settings.parsl_parallelism,
+            debug=settings.parsl_container_debug,
+            pbs_settings=pbs_settings,
+            k8_settings=k8_settings,
+        )
+    ):
+        # Parsl apps return AppFutures, though they are typed as returning their result
+        futures = [
+            cast(
+                Future,
+                build_env(
+                    group[0],
+                    [tool.id for tool in group],
+                    redis_host=settings.agent_redis_host,
+                    redis_port=settings.agent_redis_port,
+                    minio_endpoint=settings.minio_endpoint,
+                    minio_access_key=settings.minio_access_key,
+                    minio_secret_key=settings.minio_secret_key,
+                    minio_secure=False,
+                ),
+            )
+            for group in pending.values()
+        ]
+
+        counts: Dict[str, int] = {}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # Worker lost, etc.
+                logger.error(f"Environment build task failed: {e}")
+                counts["failed"] = counts.get("failed", 0) + 1
+                continue
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            logger.info(f"{result['env']} ({result['tool_id']}): {result['status']}")
+
+    logger.info(f"Environment builds finished: {counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,6 @@
 from parsl import python_app
 from rhea.utils.schema import Tool
+from rhea.utils.lifecycle import DEFAULT_FILE_TTL
 from typing import Literal
 
 
@@ -14,6 +15,7 @@ def launch_agent(
     minio_access_key: str,
     minio_secret_key: str,
     minio_secure: bool,
+    file_ttl: int = DEFAULT_FILE_TTL,
 ):
     import asyncio
     import pickle
@@ -46,6 +48,7 @@ def launch_agent(
                 minio_access_key=minio_access_key,
                 minio_secret_key=minio_secret_key,
                 minio_secure=minio_secure,
+                file_ttl=file_ttl,
             )
         )
 
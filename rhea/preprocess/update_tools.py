@@ -8,16 +8,23 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
 )
 from typing import List, Dict
+from minio import Minio
 
-from rhea.preprocess.utils.fetch import get_galaxy_repositories
+from rhea.preprocess.utils.fetch import (
+    get_galaxy_repositories,
+    store_repository_archives,
+)
 from rhea.utils.models import get_all_tool_ids
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def get_update_list(db_session: AsyncSession) -> set[str]:
-    upstream_tools: List[Dict] = get_galaxy_repositories()
+async def get_update_list(
+    db_session: AsyncSession, upstream_tools: List[Dict] | None = None
+) -> set[str]:
+    if upstream_tools is None:
+        upstream_tools = get_galaxy_repositories()
     deduped_tools = {}
     for tool in upstream_tools:
         if tool.get("type") == "repository_suite_definition" or tool.get("deprecated"):
@@ -52,8 +59,28 @@ async def main():
         expire_on_commit=False,
         autoflush=False,
     )
+    minio = Minio(
+        endpoint=os.environ.get("MINIO_ENDPOINT", "localhost:9000"),
+        access_key=os.environ.get("MINIO_ACCESS_KEY", "minioadmin"),
+        secret_key=os.environ.get("MINIO_SECRET_KEY", "minioadmin"),
+        secure=False,
+    )
+
+    repositories: List[Dict] = get_galaxy_repositories()
     async with AsyncSessionLocal() as db_session:
-        new_tool_set: set[str] = await get_update_list(db_session)
+        new_tool_set: set[str] = await get_update_list(db_session, repositories)
+
+    # Pack the tool directories of new repositories, so agents can pull them in one request
+    for repository in repositories:
+        if repository["id"] not in new_tool_set:
+            continue
+        await asyncio.to_thread(
+            store_repository_archives,
+            minio,
+            repository["id"],
+            repository["owner"],
+            repository["name"],
+        )
 
 
 if __name__ == "__main__":
@@ -1,9 +1,19 @@
 import requests
 import json
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import io
+import os
 import logging
 import tarfile
+import xml.etree.ElementTree as ET
+from minio import Minio
+
+from rhea.preprocess.utils.process_xml import classify_xml_type
+from rhea.utils.tool_archive import (
+    archive_object_name,
+    archive_index_name,
+    pack_tool_archive,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -107,3 +117,100 @@ def cleanup_hg_repo(buffer: io.BytesIO) -> io.BytesIO:
     except Exception as e:
         logger.error(f"Unexpected error during .hg cleanup: {e}")
         raise
+
+
+def get_repository_tools(buffer: io.BytesIO) -> List[Tuple[str, str]]:
+    """
+    Find the tools defined in a tar.gz repository archive.
+
+    Returns:
+        The ID and version of each tool.
+    """
+    buffer.seek(0)
+    tools: List[Tuple[str, str]] = []
+    with tarfile.open(fileobj=buffer, mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.endswith(".xml"):
+                continue
+            data = tar.extractfile(member)
+            if data is None:
+                continue
+            contents = data.read()
+            if classify_xml_type(contents) != "tool":
+                continue
+            root = ET.fromstring(contents)
+            tool_id, version = root.get("id"), root.get("version")
+            if tool_id and version:
+                tools.append((tool_id, version))
+    return tools
+
+
+def upload_tool_archive(
+    minio: Minio,
+    repository_id: str,
+    version: str,
+    packed: io.BytesIO,
+    index: Dict,
+    bucket: str = "dev",
+) -> str:
+    """
+    Store a packed repository archive (see `pack_tool_archive`), alongside its index, for a
+    tool version. Archives are keyed by the toolshed repository ID, like the per-file layout
+    agents pull tool directories from. The index is written after the archive, so its
+    presence implies a complete archive.
+
+    Returns:
+        Name of the archive object.
+    """
+    archive_name = archive_object_name(repository_id, version)
+    packed.seek(0)
+    minio.put_object(
+        bucket,
+        archive_name,
+        packed,
+        length=len(packed.getbuffer()),
+        content_type="application/zstd",
+    )
+
+    payload = json.dumps({**index, "archive": os.path.basename(archive_name)}).encode()
+    minio.put_object(
+        bucket,
+        archive_index_name(repository_id, version),
+        io.BytesIO(payload),
+        length=len(payload),
+        content_type="application/json",
+    )
+    logger.info(f"Uploaded tool archive {archive_name}")
+    return archive_name
+
+
+def store_repository_archives(
+    minio: Minio, repository_id: str, owner: str, name: str, bucket: str = "dev"
+) -> List[str]:
+    """
+    Download a repository, pack it once, and store the archive for every tool version it
+    defines. The index of each archive lists the (XML) IDs of the tools with that version.
+
+    Returns:
+        Names of the archive objects.
+    """
+    buffer = get_tool_repository_tar(owner, name)
+    if buffer is None:
+        return []
+    cleaned = cleanup_hg_repo(buffer)
+    tools = get_repository_tools(cleaned)
+    if not tools:
+        logger.info(f"No tools found in repository {owner}/{name}")
+        return []
+
+    versions: Dict[str, List[str]] = {}
+    for tool_id, version in tools:
+        versions.setdefault(version, []).append(tool_id)
+
+    packed, index = pack_tool_archive(cleaned)
+    return [
+        upload_tool_archive(
+            minio, repository_id, version, packed, {**index, "tools": ids}, bucket
+        )
+        for version, ids in versions.items()
+    ]
@@ -0,0 +1,120 @@
+"""
+Admission control for tool executions.
+
+Each execution holds a slot of its session, of its tool and of the server process for as
+long as it runs (including launching its agent). Calls beyond those limits wait in a bounded
+queue, and are turned away with a "busy" error when the queue is full or their wait times
+out, rather than piling up agents and Parsl blocks.
+
+Limits are enforced within each server process: with several uvicorn `workers`, each worker
+admits up to the configured limits on its own.
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from mcp.server.fastmcp.exceptions import ToolError
+
+import rhea.server.metrics as metrics
+
+
+class KeyedSemaphores:
+    """Semaphores by key (e.g. session ID), dropped once nobody holds or waits on them."""
+
+    def __init__(self, value: int):
+        self.value = value
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._users: dict[str, int] = {}
+
+    def checkout(self, key: str) -> asyncio.Semaphore:
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.value)
+            self._users[key] = 0
+        self._users[key] += 1
+        return self._semaphores[key]
+
+    def checkin(self, key: str) -> None:
+        self._users[key] -= 1
+        if self._users[key] == 0:
+            del self._semaphores[key]
+            del self._users[key]
+
+    def __len__(self) -> int:
+        return len(self._semaphores)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = 32,
+        max_per_session: int = 4,
+        max_per_tool: int = 8,
+        max_queued: int = 64,
+        queue_timeout: float = 30,
+    ):
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.queued = 0
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._sessions = KeyedSemaphores(max_per_session)
+        self._tools = KeyedSemaphores(max_per_tool)
+
+    @asynccontextmanager
+    async def admit(self, session_id: str, tool_id: str) -> AsyncIterator[None]:
+        """
+        Hold an execution slot for a tool call.
+        Raises: ToolError if the server is too busy to run it.
+        """
+        if self.queued >= self.max_queued:
+            metrics.tool_admission_rejections.labels(reason="queue_full").inc()
+            raise ToolError(
+                "Server is busy: too many tool executions are waiting. Try again later."
+            )
+
+        # Always acquired in this order, so waiters never hold a slot another one needs first
+        semaphores = [
+            self._sessions.checkout(session_id),
+            self._tools.checkout(tool_id),
+            self._global,
+        ]
+        acquired: list[asyncio.Semaphore] = []
+
+        async def acquire_all():
+            for semaphore in semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+
+        self.queued += 1
+        metrics.tool_admission_queued.inc()
+        start_time = time.time()
+        try:
+            await asyncio.wait_for(acquire_all(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.tool_admission_rejections.labels(reason="timeout").inc()
+            raise ToolError(
+                f"Server is busy: no execution slot freed up within {self.queue_timeout:g}s. "
+                "Try again later."
+            )
+        finally:
+            self.queued -= 1
+            metrics.tool_admission_queued.dec()
+            metrics.tool_admission_wait.observe(time.time() - start_time)
+            if len(acquired) < len(semaphores):
+                self._release(session_id, tool_id, acquired)
+
+        metrics.tool_admission_in_flight.inc()
+        try:
+            yield
+        finally:
+            metrics.tool_admission_in_flight.dec()
+            self._release(session_id, tool_id, acquired)
+
+    def _release(
+        self, session_id: str, tool_id: str, acquired: list[asyncio.Semaphore]
+    ) -> None:
+        for semaphore in acquired:
+            semaphore.release()
+        self._sessions.checkin(session_id)
+        self._tools.checkin(tool_id)
@@ -0,0 +1,58 @@
+"""
+Agent handles shared by all sessions of a server process.
+
+Agents are launched once per run (see `rhea.manager.launch_agent`) and publish their handle
+in Redis. A server process binds each handle to its Academy user client once, on first use
+by any session, and reuses it for every later call.
+"""
+
+import asyncio
+from weakref import WeakValueDictionary
+
+from academy.exchange import UserExchangeClient
+from academy.exchange.redis import RedisExchangeFactory
+from academy.handle import RemoteHandle, UnboundRemoteHandle
+
+from rhea.server.schema import AgentState
+
+
+class AgentRegistry:
+    def __init__(self):
+        self.academy_client: UserExchangeClient | None = None
+        self.agents: dict[str, AgentState] = {}
+        self._locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+
+    async def start(self, factory: RedisExchangeFactory, name: str) -> None:
+        """Create the process' Academy user client."""
+        self.academy_client = await factory.create_user_client(name=name)
+
+    async def close(self) -> None:
+        if self.academy_client is not None:
+            await self.academy_client.close()
+            self.academy_client = None
+        self.agents.clear()
+
+    def get(self, tool_id: str) -> RemoteHandle | None:
+        state = self.agents.get(tool_id)
+        return state.handle if state is not None else None
+
+    def bind(self, tool_id: str, unbound_handle: UnboundRemoteHandle) -> RemoteHandle:
+        if self.academy_client is None:
+            raise RuntimeError("Agent registry is not started")
+        handle: RemoteHandle = unbound_handle.bind_to_client(self.academy_client)
+        self.agents[tool_id] = AgentState(tool_id=tool_id, handle=handle)
+        return handle
+
+    def discard(self, tool_id: str) -> None:
+        """Forget the handle of an agent that is gone, so the next call looks it up again."""
+        self.agents.pop(tool_id, None)
+
+    def lock(self, tool_id: str) -> asyncio.Lock:
+        """
+        Serializes looking up (or launching) the agent of a tool within the process.
+        Locks are dropped once no caller holds them, so they do not pile up per tool.
+        """
+        lock = self._locks.get(tool_id)
+        if lock is None:
+            lock = self._locks[tool_id] = asyncio.Lock()
+        return lock
@@ -1,117 +1,230 @@
+"""
+Per-session state of MCP clients.
+
+Sessions only hold compact references: the Galaxy tool behind each session tool, and the
+metadata of each session resource. Live MCP tools and resources are rehydrated on demand
+(see `rhea.server.tool_cache.CompiledToolCache`), so that state can be kept in Redis and
+shared by every server replica behind a load balancer.
+"""
+
+import sys
+import json
+from typing import Literal, MutableMapping
+
 from cachetools import TTLCache
 from pydantic import BaseModel
-from redis import Redis
-from mcp.server.fastmcp.tools import Tool
-from mcp.server.fastmcp.resources.base import Resource
+from redis.asyncio import Redis
+
+import rhea.server.metrics as metrics
+
+# Memory budget of the local client state in bytes
+CLIENT_STATE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResourceRef(BaseModel):
+    uri: str
+    kind: Literal["documentation", "output"]
+    name: str | None = None
+    title: str | None = None
+    description: str | None = None
+    mime_type: str = "text/plain"
 
 
 class ClientState(BaseModel):
-    _tools: dict[str, Tool] = {}
-    _resources: dict[str, Resource] = {}
+    tools: dict[str, str] = {}  # MCP tool name -> Galaxy tool ID
+    resources: dict[str, ResourceRef] = {}  # URI -> resource reference
+
+
+class SessionRecord:
+    """
+    Compact in-memory state of a session. Records are replaced, never mutated, so readers
+    can hold on to one while the session's state is swapped.
+    """
+
+    __slots__ = ("tools", "resources", "size")
+
+    def __init__(
+        self,
+        tools: dict[str, str] | None = None,
+        resources: dict[str, ResourceRef] | None = None,
+    ):
+        self.tools: dict[str, str] = tools or {}
+        self.resources: dict[str, ResourceRef] = resources or {}
+        self.size = self._estimate_size()
+
+    def _estimate_size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.tools)
+        size += sys.getsizeof(self.resources)
+        for name, tool_id in self.tools.items():
+            size += sys.getsizeof(name) + sys.getsizeof(tool_id)
+        for uri, ref in self.resources.items():
+            size += sys.getsizeof(uri) + sys.getsizeof(ref)
+            size += sum(sys.getsizeof(v) for v in ref.__dict__.values())
+        return size
+
+
+class SessionCache(TTLCache):
+    """TTL cache of session records, bounded by their approximate size in bytes."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        super().__init__(maxsize=max_bytes, ttl=ttl, getsizeof=lambda r: r.size)
+        metrics.client_state_sessions.set_function(lambda: len(self))
+        metrics.client_state_bytes.set_function(lambda: self.currsize)
+
+    def popitem(self):
+        item = super().popitem()
+        metrics.client_state_evictions.labels(reason="capacity").inc()
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        if expired:
+            metrics.client_state_evictions.labels(reason="expired").inc(len(expired))
+        return expired
 
 
 class ClientManager:
     def __init__(self, client_ttl: int = 3600):
         self.client_ttl = client_ttl
-        self.client_states = {}
+        self.client_states: MutableMapping[str, SessionRecord] = {}
 
     def _get_key(self, client_id: str) -> str:
         return f"client_state:{client_id}"
 
-    def get_client_state(self, client_id: str) -> ClientState:
+    def _load(self, client_id: str) -> SessionRecord:
         key = self._get_key(client_id)
         try:
-            client_state: ClientState = self.client_states[key]
-            return client_state
-        except KeyError:
-            return ClientState()
-
-    def set_client_state(
-        self,
-        client_id: str,
-        tools: dict[str, Tool] | None,
-        resources: dict[str, Resource] | None,
-    ) -> None:
-        state = self.get_client_state(client_id)
-        key = self._get_key(client_id)
-
-        if tools is not None:
-            state._tools = tools
-        if resources is not None:
-            state._resources = resources
-
-        self.client_states[key] = state
-
-    def clear_client_tools(self, client_id: str) -> None:
-        state = self.get_client_state(client_id)
-        self.set_client_state(client_id, {}, state._resources)
+            record: SessionRecord = self.client_states[key]
+            self.client_states[key] = record  # Refresh TTL on access
+            return record
+        except KeyError:  # Expired or non-existent key
+            return SessionRecord()
+
+    def _store(self, client_id: str, record: SessionRecord) -> None:
+        self.client_states[self._get_key(client_id)] = record
+
+    async def get_client_state(self, client_id: str) -> ClientState:
+        record = self._load(client_id)
+        return ClientState(tools=record.tools, resources=record.resources)
+
+    async def get_client_tools(self, client_id: str) -> dict[str, str]:
+        """Returns: The tool set (MCP tool name -> Galaxy tool ID) of a session."""
+        return self._load(client_id).tools
+
+    async def get_client_tool(self, client_id: str, name: str) -> str | None:
+        """Returns: The Galaxy tool ID of a session tool."""
+        return (await self.get_client_tools(client_id)).get(name)
+
+    async def get_client_resource(self, client_id: str, uri: str) -> ResourceRef | None:
+        return self._load(client_id).resources.get(uri)
+
+    async def set_client_tools(self, client_id: str, tools: dict[str, str]) -> bool:
+        """
+        Swap the tool set (MCP tool name -> Galaxy tool ID) of a session.
+        Returns: Whether the tool set changed.
+        """
+        record = self._load(client_id)
+        self._store(client_id, SessionRecord(dict(tools), record.resources))
+        return record.tools != tools
+
+    async def add_client_resources(
+        self, client_id: str, resources: list[ResourceRef]
+    ) -> int:
+        """Returns: The number of resources new to the session."""
+        record = self._load(client_id)
+        added = len({r.uri for r in resources} - record.resources.keys())
+        self._store(
+            client_id,
+            SessionRecord(
+                record.tools, {**record.resources, **{r.uri: r for r in resources}}
+            ),
+        )
+        return added
 
 
 class LocalClientManager(ClientManager):
     def __init__(
         self,
         client_ttl: int = 3600,
-        max_clients: int = 100,
+        max_bytes: int = CLIENT_STATE_MAX_BYTES,
     ):
         super().__init__(client_ttl=client_ttl)
-        self.ttl_cache = TTLCache(maxsize=max_clients, ttl=client_ttl)
-
-    def get_client_state(self, client_id: str) -> ClientState:
-        key = self._get_key(client_id)
-        try:
-            client_state: ClientState = self.ttl_cache[key]
-            self.ttl_cache[key] = client_state  # Refresh TTL on access
-            return client_state
-        except KeyError:  # Expired or non-existent key
-            return ClientState()
-
-    def set_client_state(
-        self,
-        client_id: str,
-        tools: dict[str, Tool] | None,
-        resources: dict[str, Resource] | None,
-    ) -> None:
-        state = self.get_client_state(client_id)
-        key = self._get_key(client_id)
+        self.client_states = SessionCache(max_bytes=max_bytes, ttl=client_ttl)
 
-        if tools is not None:
-            state._tools = tools
-        if resources is not None:
-            state._resources = resources
 
-        self.ttl_cache[key] = state
+class RedisClientManager(ClientManager):
+    """
+    Client state shared by server replicas. Each session is a Redis hash with a `tools`
+    field holding the session's tool set, swapped as a whole, and a `resource:{uri}` field
+    per resource.
+    """
 
+    TOOLS_FIELD = "tools"
+    RESOURCE_PREFIX = "resource:"
 
-class RedisClientManager(ClientManager):
     def __init__(self, redis_client: Redis, client_ttl: int = 3600):
         super().__init__(client_ttl=client_ttl)
         self.redis_client = redis_client
 
-    def get_client_state(self, client_id: str) -> ClientState:
+    async def _hget(self, client_id: str, field: str) -> bytes | None:
         key = self._get_key(client_id)
-        raw = self.redis_client.get(key)
-        if raw is None:
-            return ClientState()
-
-        # Refresh TTL on access
-        self.redis_client.expire(key, self.client_ttl)
-
-        return ClientState.model_validate_json(raw)  # type: ignore
-
-    def set_client_state(
-        self,
-        client_id: str,
-        tools: dict[str, Tool] | None,
-        resources: dict[str, Resource] | None,
-    ) -> None:
-        state = self.get_client_state(client_id)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hget(key, field)
+            pipe.expire(key, self.client_ttl)  # Refresh TTL on access
+            raw, _ = await pipe.execute()
+        return raw
+
+    async def _hset(self, client_id: str, mapping: dict[str, str]) -> int:
+        if not mapping:
+            return 0
         key = self._get_key(client_id)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.client_ttl)
+            added, _ = await pipe.execute()
+        return added
 
-        if tools is not None:
-            state._tools = tools
-        if resources is not None:
-            state._resources = resources
-
-        payload = state.model_dump_json()
-
-        self.redis_client.set(key, payload, ex=self.client_ttl)
+    async def get_client_state(self, client_id: str) -> ClientState:
+        key = self._get_key(client_id)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.expire(key, self.client_ttl)  # Refresh TTL on access
+            raw, _ = await pipe.execute()
+
+        state = ClientState()
+        for field, value in raw.items():
+            field = field.decode()
+            if field == self.TOOLS_FIELD:
+                state.tools = json.loads(value)
+            elif field.startswith(self.RESOURCE_PREFIX):
+                ref = ResourceRef.model_validate_json(value)
+                state.resources[ref.uri] = ref
+        return state
+
+    async def get_client_tools(self, client_id: str) -> dict[str, str]:
+        raw = await self._hget(client_id, self.TOOLS_FIELD)
+        return json.loads(raw) if raw is not None else {}
+
+    async def get_client_resource(self, client_id: str, uri: str) -> ResourceRef | None:
+        raw = await self._hget(client_id, self.RESOURCE_PREFIX + uri)
+        return ResourceRef.model_validate_json(raw) if raw is not None else None
+
+    async def set_client_tools(self, client_id: str, tools: dict[str, str]) -> bool:
+        key = self._get_key(client_id)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hget(key, self.TOOLS_FIELD)
+            pipe.hset(key, self.TOOLS_FIELD, json.dumps(tools))
+            pipe.expire(key, self.client_ttl)
+            previous, _, _ = await pipe.execute()
+        return (json.loads(previous) if previous is not None else {}) != tools
+
+    async def add_client_resources(
+        self, client_id: str, resources: list[ResourceRef]
+    ) -> int:
+        return await self._hset(
+            client_id,
+            {
+                self.RESOURCE_PREFIX + ref.uri: ref.model_dump_json()
+                for ref in resources
+            },
+        )
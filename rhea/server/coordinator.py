@@ -0,0 +1,91 @@
+"""
+Agent launches in multi-process deployments.
+
+With several server workers (`Settings.workers`), a single coordinator process owns the
+Parsl DFK. Workers request agent launches through a Redis list, and find the launched
+agent's handle in Redis (see `rhea.manager.launch_agent`), like any other process of the run.
+"""
+
+import logging
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from rhea.utils.schema import Tool
+from rhea.utils.models import get_galaxytool_by_id
+from rhea.server.schema import Settings
+from rhea.manager.launch_agent import launch_agent
+
+logger = logging.getLogger(__name__)
+
+
+def launch_queue_key(run_id: str) -> str:
+    return f"agent_launches:{run_id}"
+
+
+def launch_lock_key(run_id: str, tool_id: str) -> str:
+    return f"agent_launch_lock:{run_id}-{tool_id}"
+
+
+def launch(tool: Tool, settings: Settings, run_id: str):
+    """Launch the agent of a tool on the process' Parsl DFK."""
+    return launch_agent(
+        tool,
+        run_id=run_id,
+        container_runtime=settings.parsl_container_backend,
+        redis_host=settings.agent_redis_host,
+        redis_port=settings.agent_redis_port,
+        minio_endpoint=settings.minio_endpoint,
+        minio_access_key=settings.minio_access_key,
+        minio_secret_key=settings.minio_secret_key,
+        minio_secure=False,
+        file_ttl=settings.file_ttl,
+    )
+
+
+def request_launch(r: Redis, run_id: str, tool_id: str, timeout: int) -> bool:
+    """
+    Ask the coordinator to launch the agent of a tool, unless another worker already did
+    in the last `timeout` seconds (the time an agent has to publish its handle).
+    Returns: Whether a launch was requested.
+    """
+    if not r.set(launch_lock_key(run_id, tool_id), 1, nx=True, ex=timeout):
+        return False
+    r.rpush(launch_queue_key(run_id), tool_id)
+    return True
+
+
+class AgentCoordinator:
+    def __init__(
+        self,
+        redis_client: AsyncRedis,
+        db_sessionmaker: async_sessionmaker[AsyncSession],
+        settings: Settings,
+        run_id: str,
+    ):
+        self.redis_client = redis_client
+        self.db_sessionmaker = db_sessionmaker
+        self.settings = settings
+        self.run_id = run_id
+
+    async def run(self) -> None:
+        """Launch agents as workers request them, until cancelled."""
+        queue = launch_queue_key(self.run_id)
+        while True:
+            _, raw = await self.redis_client.blpop([queue])  # type: ignore
+            tool_id = raw.decode()
+            try:
+                await self.launch(tool_id)
+            except Exception as e:
+                logger.exception(f"Failed to launch agent for {tool_id}: {e}")
+                # Let the next request retry
+                await self.redis_client.delete(launch_lock_key(self.run_id, tool_id))
+
+    async def launch(self, tool_id: str) -> None:
+        async with self.db_sessionmaker() as session:
+            tool: Tool | None = await get_galaxytool_by_id(session, tool_id)
+        if tool is None:
+            raise RuntimeError(f"No tool found with ID: {tool_id}")
+        logger.info(f"Launching agent for {tool_id}")
+        launch(tool, self.settings, self.run_id)
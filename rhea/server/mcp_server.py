@@ -1,24 +1,29 @@
+import os
+import sys
+import signal
+import multiprocessing
 import debugpy
 import logging
 import anyio
 import uuid
 import time
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import cache, partial
 from collections.abc import AsyncIterator
 from argparse import ArgumentParser
+from multiprocessing.context import SpawnProcess
 from pathlib import Path
-from typing import List, Optional, Any
+from typing import List
 
 
 # MCP SDK imports
 from mcp.server.fastmcp import Context
-from mcp.server.fastmcp.resources.types import TextResource
 from mcp.server.lowlevel import Server
 from mcp.server.stdio import stdio_server
-from mcp.server.sse import SseServerTransport
-from mcp.server.fastmcp.tools import Tool as FastMCPTool
 
 # Starlette imports
+import uvicorn
+from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse, StreamingResponse
 
@@ -27,7 +32,6 @@ import parsl
 from parsl import DataFlowKernel
 
 # Academy imports
-from academy.exchange import UserExchangeClient
 from academy.exchange.redis import RedisExchangeFactory
 from academy.logging import init_logging
 
@@ -36,13 +40,24 @@ from openai import OpenAI
 
 # Helper imports
 from rhea.server.rhea_fastmcp import RheaFastMCP
-from rhea.server.client_manager import LocalClientManager, ClientManager
+from rhea.server.agents import AgentRegistry
+from rhea.server.coordinator import AgentCoordinator
+from rhea.server.client_manager import (
+    ClientManager,
+    LocalClientManager,
+    RedisClientManager,
+)
+from rhea.server.tool_cache import CompiledToolCache, DocumentationStore
+from rhea.server.notifications import NotificationCoalescer
+from rhea.server.admission import AdmissionController
 from rhea.server.schema import AppContext, MCPTool, Settings, PBSSettings, K8Settings
-from rhea.server.utils import create_tool
+from rhea.server.utils import DOCUMENTATION_URI_TEMPLATE, documentation_resource_ref
 import rhea.server.metrics as metrics
 from rhea.utils.schema import Tool
-from rhea.utils.embedding import get_embedding, get_l2_distance
+from rhea.utils.embedding import get_embedding, get_hybrid_matches
 from rhea.utils.proxy import RheaFileHandle, RheaFileProxy
+from rhea.utils.lifecycle import collect_garbage, GCStats
+from rhea.utils.models import create_search_index
 from rhea.manager.parsl_config import generate_parsl_config
 
 # ProxyStore imports
@@ -51,9 +66,9 @@ from proxystore.store import StoreConfig, get_or_create_store
 from proxystore.store.config import ConnectorConfig
 from proxystore.store.exceptions import StoreExistsError
 import cloudpickle
+from redis.asyncio import Redis as AsyncRedis
 
 # Pydantic + SQLAlchemy imports
-from pydantic.networks import AnyUrl
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
@@ -66,6 +81,11 @@ from sqlalchemy.ext.asyncio import (
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from prometheus_client.core import REGISTRY
 
+# Under `python -m`, this module runs as `__main__` (`__mp_main__` in uvicorn workers), and is
+# then imported by name to find the app factory. Alias it, so module-level state is only
+# initialized once per process.
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault(__spec__.name, sys.modules[__name__])
 
 parser = ArgumentParser()
 parser.add_argument(
@@ -94,14 +114,15 @@ if Path(".env_k8").exists():
         k8_settings = None
 
 
-if settings.debug_port is not None:
+if settings.debug_port is not None and __name__ == "__main__":
     debugpy.listen(("0.0.0.0", int(settings.debug_port)))
     print(f"Waiting for VS Code to attach on port {int(settings.debug_port)}")
     debugpy.wait_for_client()
 
 
-# A 'run_id', generated on the begining of application startup, to keep track of which handles are stale
-run_id = str(uuid.uuid4())
+# A 'run_id', generated on the begining of application startup, to keep track of which handles are stale.
+# Passed to uvicorn workers through the environment, so they share it.
+run_id = os.environ.setdefault("RHEA_RUN_ID", str(uuid.uuid4()))
 
 connector = RedisConnector(settings.redis_host, settings.redis_port)
 
@@ -131,7 +152,16 @@ output_store = get_or_create_store(
     )
 )
 
-client_manager = LocalClientManager(client_ttl=settings.client_ttl)
+client_manager: ClientManager
+if settings.client_state_backend == "redis":
+    client_manager = RedisClientManager(
+        AsyncRedis(host=settings.redis_host, port=settings.redis_port),
+        client_ttl=settings.client_ttl,
+    )
+else:
+    client_manager = LocalClientManager(
+        client_ttl=settings.client_ttl, max_bytes=settings.client_state_max_bytes
+    )
 
 factory = RedisExchangeFactory(settings.redis_host, settings.redis_port)
 
@@ -145,45 +175,55 @@ AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
     autoflush=False,
 )
 
-REGISTRY.register(metrics.RedisHashCollector(connector._redis_client, "conda_envs"))
+tool_cache = CompiledToolCache(AsyncSessionLocal, maxsize=settings.tool_cache_size)
 
+documentation_store = DocumentationStore(
+    AsyncSessionLocal, maxsize=settings.documentation_cache_size
+)
 
-@asynccontextmanager
-async def app_lifespan(server: RheaFastMCP) -> AsyncIterator[AppContext]:
-    # Initialize on each new connection
-    logger = init_logging(logging.INFO)
+notifier = NotificationCoalescer(
+    window=settings.notification_debounce, stateless=settings.workers > 1
+)
 
-    academy_client: Optional[UserExchangeClient] = None
-    try:
-        embedding_client = OpenAI(
-            base_url=settings.embedding_url, api_key=settings.embedding_key
-        )
+admission = AdmissionController(
+    max_concurrent=settings.admission_max_concurrent,
+    max_per_session=settings.admission_max_per_session,
+    max_per_tool=settings.admission_max_per_tool,
+    max_queued=settings.admission_max_queued,
+    queue_timeout=settings.admission_queue_timeout,
+)
 
-        academy_client = await factory.create_user_client(
-            name=f"rhea-manager-{str(uuid.uuid4())}"
-        )
+logger = init_logging(logging.INFO)
 
-        yield AppContext(
-            settings=settings,
-            logger=logger,
-            embedding_client=embedding_client,
-            db_sessionmaker=AsyncSessionLocal,
-            factory=factory,
-            connector=connector,
-            output_store=output_store,
-            academy_client=academy_client,
-            agents={},
-            client_manager=client_manager,
-            resource_manager=mcp._resource_manager,
-            run_id=run_id,
-        )
 
-    except Exception as e:
-        logger.error(e)
+@cache
+def get_embedding_client() -> OpenAI:
+    return OpenAI(base_url=settings.embedding_url, api_key=settings.embedding_key)
+
 
-    finally:  # Application shutdown
-        if academy_client is not None:
-            await academy_client.close()
+# Agent handles shared by all sessions, bound to the Academy client started in `server_lifespan`
+agents = AgentRegistry()
+
+
+@asynccontextmanager
+async def app_lifespan(server: RheaFastMCP) -> AsyncIterator[AppContext]:
+    # Entered on each new connection: process-wide resources are only referenced here
+    yield AppContext(
+        settings=settings,
+        logger=logger,
+        embedding_client=get_embedding_client(),
+        db_sessionmaker=AsyncSessionLocal,
+        factory=factory,
+        connector=connector,
+        output_store=output_store,
+        agents=agents,
+        admission=admission,
+        client_manager=client_manager,
+        tool_cache=tool_cache,
+        notifier=notifier,
+        resource_manager=mcp._resource_manager,
+        run_id=run_id,
+    )
 
 
 mcp = RheaFastMCP(
@@ -191,6 +231,8 @@ mcp = RheaFastMCP(
     lifespan=app_lifespan,
     host=settings.host,
     port=settings.port,
+    # Sessions may hop between workers, so no worker can hold their transport
+    stateless_http=settings.workers > 1,
 )
 
 # Manually set notification options
@@ -206,77 +248,38 @@ async def find_tools(query: str, ctx: Context) -> List[MCPTool]:
 
     start_time = time.time()
 
-    # Get session ID (if exists)
-    session_id: str | None = None
-    request: Any | None = ctx.request_context.request
-
-    if request is not None:
-        headers: dict = request.headers
-        session_id: str | None = headers.get("mcp-session-id")
-
-    # Get ClientManager
-    client_manager: ClientManager = ctx.request_context.lifespan_context.client_manager
-
-    # Clear previous tools (except find_tools)
-    keep = "find_tools"
-    for t in list(mcp._tool_manager._tools.keys()):
-        if t != keep:
-            mcp._tool_manager._tools.pop(t)
-    if session_id is not None:
-        client_manager.clear_client_tools(session_id)
-
-    # Clear previous tool documentations
-    for r in list(mcp._resource_manager._resources.keys()):
-        if "Documentation" in r:
-            mcp._resource_manager._resources.pop(r)
-
     # Get embedding of user query
     query_vector: List[float] = get_embedding(
         query, ctx.request_context.lifespan_context.embedding_client, settings.model
     )
 
-    # Perform RAG
+    # Perform RAG, fusing embedding and full-text matches
     db_sessionmaker: async_sessionmaker[AsyncSession] = (
         ctx.request_context.lifespan_context.db_sessionmaker
     )
 
     async with db_sessionmaker() as session:
-        tools: List[Tool] = await get_l2_distance(query_vector, session, limit=10)
-
-    result = []
-
-    # Populate tools
-    for t in tools:
-        tool_function: FastMCPTool = create_tool(t, ctx)
-
-        # Add tool to MCP server
-        mcp.add_tool_to_context(
-            fn=tool_function.fn,
-            name=tool_function.name,
-            title=tool_function.title,
-            description=tool_function.description,
+        tools: List[Tool] = await get_hybrid_matches(
+            query,
+            query_vector,
+            session,
+            limit=settings.find_tools_limit,
+            candidates=settings.find_tools_candidates,
         )
 
-        # Add documentation resource to MCP server
-        mcp.add_resource_to_context(
-            resource=TextResource(
-                uri=AnyUrl(url=f"resource://documentation/{t.name}"),
-                name=f"{t.name} Documentation",
-                description=f"Full documentation for {t.name}",
-                text=(
-                    t.documentation
-                    if t.documentation is not None
-                    else f"Documentation for '{t.name}' is not available."
-                ),
-                mime_type="text/markdown",
-            )
-        )
+    # Swap the session's tools, and add their documentation resources
+    tools_changed = await mcp.set_tools_in_context(tools)
+    resources_changed = await mcp.add_resources_to_context(
+        [documentation_resource_ref(t) for t in tools]
+    )
 
-        # Add MCPTool to result
-        result.append(MCPTool.from_rhea(t))
+    result = [MCPTool.from_rhea(t) for t in tools]
 
-    await ctx.request_context.session.send_tool_list_changed()  # notifiactions/tools/list_changed
-    await ctx.request_context.session.send_resource_list_changed()  # notifications/resources/list_changed
+    # Only notify when the session's lists changed, coalescing bursts of updates
+    if tools_changed:
+        await notifier.notify(ctx, "tools")  # notifications/tools/list_changed
+    if resources_changed:
+        await notifier.notify(ctx, "resources")  # notifications/resources/list_changed
 
     metrics.find_tool_request_latency.observe(
         time.time() - start_time
@@ -285,6 +288,16 @@ async def find_tools(query: str, ctx: Context) -> List[MCPTool]:
     return result
 
 
+@mcp.resource(
+    DOCUMENTATION_URI_TEMPLATE,
+    name="Tool Documentation",
+    description="Full documentation for a tool",
+    mime_type="text/markdown",
+)
+async def tool_documentation(tool_id: str) -> str:
+    return await documentation_store.read(tool_id)
+
+
 @mcp.custom_route("/health", methods=["GET"])
 async def health_check(request: Request) -> JSONResponse:
     return JSONResponse({"status": "ok"})
@@ -299,11 +312,16 @@ async def metrics_endpoint(request: Request):
 async def upload(request: Request):
     metrics.upload_requests.inc()  # Update upload metric
 
-    file_handle: RheaFileHandle = RheaFileHandle(r=connector._redis_client)
+    file_handle: RheaFileHandle = RheaFileHandle(
+        r=connector._redis_client, ttl=settings.file_ttl
+    )
 
     async for chunk in request.stream():
         file_handle.append(chunk)
 
+    # Move to content-addressed key, reusing an identical blob if one exists
+    file_handle.finalize()
+
     format = file_handle.filetype()
     filename = request.headers.get("x-filename", file_handle.key)
 
@@ -317,7 +335,7 @@ async def upload(request: Request):
         file_key=file_handle.key,
     )
 
-    key = proxy.to_proxy(input_store)
+    key = proxy.to_proxy(input_store, ttl=settings.file_ttl)
 
     response = proxy.model_dump()
     response["key"] = key
@@ -337,14 +355,16 @@ async def download(request: Request):
 
     try:
         proxy: RheaFileProxy = RheaFileProxy.from_proxy(
-            RedisKey(redis_key=key), input_store
+            RedisKey(redis_key=key), input_store, ttl=settings.file_ttl
         )
     except ValueError:
         proxy: RheaFileProxy = RheaFileProxy.from_proxy(
-            RedisKey(redis_key=key), output_store
+            RedisKey(redis_key=key), output_store, ttl=settings.file_ttl
         )
 
-    file_handle: RheaFileHandle = proxy.open(connector._redis_client)
+    file_handle: RheaFileHandle = proxy.open(
+        connector._redis_client, ttl=settings.file_ttl
+    )
 
     metrics.download_size.observe(
         len(file_handle)
@@ -361,79 +381,166 @@ async def download(request: Request):
     )
 
 
-async def serve_stdio():
-    async with stdio_server() as (r, w):
-        init_opts = lowlevel_server.create_initialization_options(
-            lowlevel_server.notification_options, {}
-        )
-        await lowlevel_server.run(r, w, init_opts)
-
-
-async def serve_sse():
-    import uvicorn
-    from starlette.applications import Starlette
-    from starlette.routing import Route, Mount
-    from starlette.responses import Response
-
-    sse = SseServerTransport("/messages/")
-
-    async def handle_sse(request):
-        async with sse.connect_sse(
-            request.scope, request.receive, request._send
-        ) as streams:
-            await lowlevel_server.run(
-                streams[0],
-                streams[1],
-                lowlevel_server.create_initialization_options(
-                    lowlevel_server.notification_options
-                ),
+async def run_file_gc():
+    """
+    Periodically delete file blobs that are no longer referenced by any proxy or session.
+    """
+    while True:
+        await anyio.sleep(settings.file_gc_interval)
+        start_time = time.time()
+        try:
+            stats: GCStats = await anyio.to_thread.run_sync(
+                partial(
+                    collect_garbage,
+                    connector._redis_client,
+                    grace_period=settings.file_gc_grace_period,
+                    ttl=settings.file_ttl,
+                )
             )
-        return Response()
+        except Exception as e:
+            logging.exception(f"File garbage collection failed: {e}")
+            continue
 
-    app = Starlette(
-        routes=[
-            Route("/sse", endpoint=handle_sse, methods=["GET"]),
-            Mount("/messages/", app=sse.handle_post_message),
-        ]
+        metrics.file_gc_runs.inc()
+        metrics.file_gc_deleted_files.inc(stats.deleted)
+        metrics.file_gc_reclaimed_bytes.inc(stats.reclaimed_bytes)
+        metrics.file_gc_scanned_files.set(stats.scanned)
+        metrics.file_gc_duration.observe(time.time() - start_time)
+
+
+@asynccontextmanager
+async def dfk_lifespan() -> AsyncIterator[DataFlowKernel]:
+    """
+    Resources owned by a single process of the deployment (the coordinator, when there
+    are several workers): the Parsl DFK launching agents, and file GC.
+    """
+    dfk: DataFlowKernel = parsl.load(
+        generate_parsl_config(
+            backend=settings.parsl_container_backend,
+            network=settings.parsl_container_network,
+            provider=settings.parsl_provider,
+            max_workers_per_node=settings.parsl_max_workers_per_node,
+            init_blocks=settings.parsl_init_blocks,
+            min_blocks=settings.parsl_min_blocks,
+            max_blocks=settings.parsl_max_blocks,
+            nodes_per_block=settings.parsl_nodes_per_block,
+            parallelism=settings.parsl_parallelism,
+            debug=settings.parsl_container_debug,
+            pbs_settings=pbs_settings,
+            k8_settings=k8_settings,
+        )
     )
-    config = uvicorn.Config(app, host=settings.host, port=settings.port)
-    server = uvicorn.Server(config)
-    await server.serve()
+    try:
+        # Register Prometheus Parsl collector
+        REGISTRY.register(metrics.ParslCollector(dfk))
+
+        # Only `create_all` creates it, so databases populated earlier lack it
+        await create_search_index(engine)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(run_file_gc)
+            yield dfk
+            tg.cancel_scope.cancel()
+    finally:
+        dfk.cleanup()
 
 
-async def main():
+@asynccontextmanager
+async def server_lifespan() -> AsyncIterator[None]:
+    """Process-wide resources of each process serving MCP clients."""
     try:
-        dfk: DataFlowKernel = parsl.load(
-            generate_parsl_config(
-                backend=settings.parsl_container_backend,
-                network=settings.parsl_container_network,
-                provider=settings.parsl_provider,
-                max_workers_per_node=settings.parsl_max_workers_per_node,
-                init_blocks=settings.parsl_init_blocks,
-                min_blocks=settings.parsl_min_blocks,
-                max_blocks=settings.parsl_max_blocks,
-                nodes_per_block=settings.parsl_nodes_per_block,
-                parallelism=settings.parsl_parallelism,
-                debug=settings.parsl_container_debug,
-                pbs_settings=pbs_settings,
-                k8_settings=k8_settings,
+        async with AsyncExitStack() as stack:
+            if settings.workers == 1:
+                await stack.enter_async_context(dfk_lifespan())
+
+            await agents.start(factory, name=f"rhea-manager-{str(uuid.uuid4())}")
+            stack.push_async_callback(agents.close)
+
+            # Register Prometheus collectors
+            REGISTRY.register(
+                metrics.RedisHashCollector(connector._redis_client, "conda_envs")
+            )
+            REGISTRY.register(
+                metrics.RedisPhaseTimingCollector(
+                    connector._redis_client,
+                    "conda_env_build_stats",
+                    "conda_env_build_phase_seconds",
+                )
             )
+            REGISTRY.register(
+                metrics.RedisSizeHistogramCollector(
+                    connector._redis_client, "conda_env_sizes", "conda_env_packed_bytes"
+                )
+            )
+            yield
+    finally:
+        print("Application shutdown complete.")
+
+
+async def run_coordinator():
+    """Launch agents requested by the server workers (see `rhea.server.coordinator`)."""
+    async with dfk_lifespan():
+        coordinator = AgentCoordinator(
+            AsyncRedis(host=settings.redis_host, port=settings.redis_port),
+            AsyncSessionLocal,
+            settings,
+            run_id,
         )
+        await coordinator.run()
 
-        # Register Prometheus Parsl collector
-        REGISTRY.register(metrics.ParslCollector(dfk))
 
-        match args.transport:
-            case "stdio":
-                await serve_stdio()
-            case "sse":
-                await serve_sse()
-            case "streamable-http":
-                await mcp.run_streamable_http_async()  # TODO: Fix notification options
+def start_coordinator():
+    anyio.run(run_coordinator)
+
+
+def create_app() -> Starlette:
+    """ASGI app factory, called by each uvicorn worker."""
+    return mcp.asgi_app(lifespan=server_lifespan)
+
+
+async def serve_stdio():
+    async with server_lifespan():
+        async with stdio_server() as (r, w):
+            await lowlevel_server.run(r, w, mcp.initialization_options())
+
+
+def serve_http(transport: str = "streamable-http"):
+    """Serve the SSE and streamable HTTP transports, and REST routes, with uvicorn."""
+    if settings.workers > 1 and settings.client_state_backend != "redis":
+        raise ValueError(
+            "Serving with more than one worker requires `client_state_backend=redis`"
+        )
+    if settings.workers > 1 and transport == "sse":
+        # SSE sessions are bound to the worker that opened them
+        raise ValueError(
+            "The SSE transport only supports one worker, use `streamable-http` instead"
+        )
+
+    # Workers share the listening socket, while a single coordinator owns the Parsl DFK
+    coordinator: SpawnProcess | None = None
+    if settings.workers > 1:
+        coordinator = multiprocessing.get_context("spawn").Process(
+            target=start_coordinator, name="rhea-coordinator"
+        )
+        coordinator.start()
+
+    try:
+        uvicorn.run(
+            f"{__spec__.name}:create_app",
+            factory=True,
+            host=settings.host,
+            port=settings.port,
+            workers=settings.workers,
+        )
     finally:
-        parsl.dfk().cleanup()
-        print("Application shutdown complete.")
+        if coordinator is not None and coordinator.is_alive():
+            os.kill(coordinator.pid, signal.SIGINT)  # type: ignore
+            coordinator.join()
 
 
 if __name__ == "__main__":
-    anyio.run(main)
+    match args.transport:
+        case "stdio":
+            anyio.run(serve_stdio)
+        case "sse" | "streamable-http":
+            serve_http(args.transport)
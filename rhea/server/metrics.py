@@ -1,7 +1,11 @@
 from typing import Dict, Any
 
-from prometheus_client import Counter, Histogram
-from prometheus_client.core import GaugeMetricFamily
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import (
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+    SummaryMetricFamily,
+)
 from prometheus_client.registry import Collector
 
 from redis import Redis
@@ -73,6 +77,65 @@ download_size = Histogram(
     buckets=FILE_SIZE_BUCKETS,
 )
 
+file_gc_runs = Counter(
+    "file_gc_runs_total", "Total number of file garbage collection runs."
+)
+
+file_gc_deleted_files = Counter(
+    "file_gc_deleted_files_total", "Total number of unreferenced files deleted."
+)
+
+file_gc_reclaimed_bytes = Counter(
+    "file_gc_reclaimed_bytes_total", "Total number of bytes reclaimed by file GC."
+)
+
+file_gc_scanned_files = Gauge(
+    "file_gc_scanned_files", "Number of files scanned in the last GC run."
+)
+
+file_gc_duration = Histogram(
+    "file_gc_duration_seconds", "Histogram of file garbage collection run durations."
+)
+
+client_state_evictions = Counter(
+    "client_state_evictions_total",
+    "Total number of sessions dropped from the local client state.",
+    ["reason"],
+)
+
+client_state_sessions = Gauge(
+    "client_state_sessions", "Number of sessions held in the local client state."
+)
+
+client_state_bytes = Gauge(
+    "client_state_bytes", "Approximate size of the local client state in bytes."
+)
+
+list_changed_notifications = Counter(
+    "list_changed_notifications_total",
+    "Total number of `list_changed` notifications, sent or coalesced into a pending one.",
+    ["kind", "outcome"],
+)
+
+tool_admission_queued = Gauge(
+    "tool_admission_queued", "Number of tool executions waiting for an execution slot."
+)
+
+tool_admission_in_flight = Gauge(
+    "tool_admission_in_flight", "Number of tool executions holding an execution slot."
+)
+
+tool_admission_wait = Histogram(
+    "tool_admission_wait_seconds",
+    "Histogram of the time tool executions waited for an execution slot.",
+)
+
+tool_admission_rejections = Counter(
+    "tool_admission_rejections_total",
+    "Total number of tool executions turned away because the server was busy.",
+    ["reason"],
+)
+
 
 class RedisHashCollector(Collector):
     def __init__(self, redis_client: Redis, hash_key: str):
@@ -93,6 +156,79 @@ class RedisHashCollector(Collector):
         yield metric
 
 
+class RedisPhaseTimingCollector(Collector):
+    """
+    Exposes phase timings aggregated by agents in a Redis hash, stored as
+    `{phase}_seconds` and `{phase}_count` fields.
+    """
+
+    def __init__(self, redis_client: Redis, hash_key: str, name: str):
+        self.r = redis_client
+        self.hash_key = hash_key
+        self.name = name
+        super().__init__()
+
+    def collect(self):
+        try:
+            raw = self.r.hgetall(self.hash_key)
+        except ResponseError:
+            raw = {}
+        stats: Dict[str, Dict[str, float]] = {}
+        for field, value in raw.items():  # type: ignore
+            field = field.decode() if isinstance(field, bytes) else field
+            phase, _, kind = field.rpartition("_")
+            stats.setdefault(phase, {})[kind] = float(value)
+
+        metric = SummaryMetricFamily(
+            self.name,
+            "Duration of phases reported by agents.",
+            labels=["phase"],
+        )
+        for phase, values in sorted(stats.items()):
+            metric.add_metric(
+                [phase],
+                count_value=int(values.get("count", 0)),
+                sum_value=values.get("seconds", 0.0),
+            )
+        yield metric
+
+
+class RedisSizeHistogramCollector(Collector):
+    """
+    Exposes the sizes stored as values of a Redis hash (e.g. packed environments) as a histogram.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        hash_key: str,
+        name: str,
+        buckets=FILE_SIZE_BUCKETS,
+    ):
+        self.r = redis_client
+        self.hash_key = hash_key
+        self.name = name
+        self.buckets = buckets
+        super().__init__()
+
+    def collect(self):
+        try:
+            sizes = [int(v) for v in self.r.hvals(self.hash_key)]  # type: ignore
+        except ResponseError:
+            sizes = []
+
+        counts = []
+        for bound in self.buckets:
+            counts.append((str(float(bound)), sum(1 for s in sizes if s <= bound)))
+        counts.append(("+Inf", len(sizes)))
+
+        metric = HistogramMetricFamily(
+            self.name, f"Sizes in Redis hash {self.hash_key}."
+        )
+        metric.add_metric([], buckets=counts, sum_value=sum(sizes))
+        yield metric
+
+
 class ParslCollector(Collector):
     def __init__(self, dfk: DataFlowKernel):
         self.dfk = dfk
@@ -0,0 +1,92 @@
+"""
+Coalescing of `list_changed` notifications.
+
+Clients re-list tools or resources on every `list_changed` notification, so bursts of
+updates to a session (e.g. `find_tools` followed by several tool executions) are throttled
+to one notification per list and window: the first change schedules a notification at the
+end of the window, and later changes within the window are folded into it. Changes made once
+the window is over (even while its notification is being sent) schedule a new one. Callers
+only notify when the session's tool or resource set actually changed.
+
+Stateless sessions (see `Settings.workers`) have no transport left once a request returns,
+so their notifications are sent right away, on the response stream of the request that
+changed the session.
+"""
+
+import asyncio
+from typing import Literal
+
+from mcp import types
+from mcp.server.fastmcp import Context
+from mcp.server.fastmcp.utilities.logging import get_logger
+from mcp.server.session import ServerSession
+
+import rhea.server.metrics as metrics
+from rhea.server.utils import get_session_id
+
+logger = get_logger(__name__)
+
+ListKind = Literal["tools", "resources"]
+
+
+class NotificationCoalescer:
+    def __init__(self, window: float = 0.25, stateless: bool = False):
+        self.window = window
+        self.stateless = stateless
+        # Notifications whose window is still open, by session and list
+        self._pending: dict[tuple[str, ListKind], asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def notify(self, ctx: Context, kind: ListKind) -> None:
+        """Schedule a `notifications/{kind}/list_changed` for the client's session."""
+        if self.stateless:
+            await self._deliver(
+                ctx.request_context.session, kind, ctx.request_context.request_id
+            )
+            return
+
+        key = (get_session_id(ctx), kind)
+        if key in self._pending:
+            metrics.list_changed_notifications.labels(
+                kind=kind, outcome="coalesced"
+            ).inc()
+            return
+
+        task = asyncio.create_task(self._send(key, ctx.request_context.session))
+        self._pending[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: tuple[str, ListKind], session: ServerSession) -> None:
+        _, kind = key
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            # Changes from here on are not covered by this notification
+            del self._pending[key]
+        await self._deliver(session, kind)
+
+    async def _deliver(
+        self,
+        session: ServerSession,
+        kind: ListKind,
+        related_request_id: types.RequestId | None = None,
+    ) -> None:
+        notification = types.ServerNotification(
+            types.ToolListChangedNotification(method="notifications/tools/list_changed")
+            if kind == "tools"
+            else types.ResourceListChangedNotification(
+                method="notifications/resources/list_changed"
+            )
+        )
+        try:
+            await session.send_notification(notification, related_request_id)
+        except Exception as e:  # The client may have disconnected in the meantime
+            logger.debug(f"Could not send {kind} list_changed notification: {e}")
+            return
+        metrics.list_changed_notifications.labels(kind=kind, outcome="sent").inc()
+
+    async def flush(self) -> None:
+        """Wait for pending notifications to be sent, including those they schedule."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
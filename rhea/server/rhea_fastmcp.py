@@ -1,14 +1,29 @@
-from typing import Any, List
-from collections.abc import Callable, Iterable
+import uuid
+from typing import Any
+from collections.abc import Iterable
+from contextlib import AsyncExitStack, asynccontextmanager
+from cachetools import LRUCache
 from pydantic import AnyUrl
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
+# Starlette imports
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Mount, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
 # MCP SDK imports
 from mcp.server.fastmcp.tools import ToolManager
 from mcp.server.fastmcp.resources import ResourceManager
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.server import Context
 from mcp.server.lowlevel.helper_types import ReadResourceContents
+from mcp.server.models import InitializationOptions
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http import MCP_SESSION_ID_HEADER
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 from mcp.server.session import ServerSessionT
 from mcp.server.fastmcp.exceptions import ToolError, ResourceError
 from mcp.server.auth.provider import OAuthAuthorizationServerProvider, TokenVerifier
@@ -17,14 +32,15 @@ from mcp.server.fastmcp.tools import Tool
 from mcp.server.fastmcp.resources.base import Resource
 from mcp.server.fastmcp.utilities.logging import get_logger
 from mcp.shared.context import LifespanContextT, RequestT
-from mcp.types import AnyFunction, Resource as MCPResource, ToolAnnotations
+from mcp.types import Resource as MCPResource
 from mcp.types import Tool as MCPTool
 
 # Helper imports
 from rhea.utils.schema import Tool as GalaxyTool
 from rhea.utils.models import get_galaxytool_by_name
-from rhea.server.utils import create_tool
-from rhea.server.client_manager import ClientManager, ClientState
+from rhea.server.utils import create_proxystore_function_resource, get_session_id
+from rhea.server.client_manager import ClientManager, ClientState, ResourceRef
+from rhea.server.tool_cache import CompiledToolCache
 
 
 logger = get_logger(__name__)
@@ -62,72 +78,121 @@ class RheaFastMCP(FastMCP):
         self._mcp_server.notification_options.resources_changed = True
         self._mcp_server.notification_options.tools_changed = True
 
+        # Shared by all connections, including those set up by the SDK's session manager
+        self._initialization_options: InitializationOptions | None = None
+        self._mcp_server.create_initialization_options = self.initialization_options  # type: ignore
+
+    def initialization_options(
+        self, *args: Any, **kwargs: Any
+    ) -> InitializationOptions:
+        """
+        Initialization options (server capabilities, including list change notifications),
+        computed on first use, once every handler is registered.
+        """
+        if self._initialization_options is None:
+            server = self._mcp_server
+            self._initialization_options = type(server).create_initialization_options(
+                server, server.notification_options, {}
+            )
+        return self._initialization_options
+
+    def asgi_app(self, lifespan: Any = None) -> Starlette:
+        """
+        ASGI app serving the SSE and streamable HTTP transports along with the custom routes
+        (e.g. `/upload`, `/download`), so one process (or uvicorn worker) serves them all.
+        SSE sessions live in the process that opened them, so SSE is left out when
+        streamable HTTP is stateless (i.e. requests may land on any of several workers).
+
+        Args:
+            lifespan: Async context manager factory for process-wide resources, entered
+                before any connection is served.
+        """
+        sse = SseServerTransport(
+            self.settings.message_path,
+            security_settings=self.settings.transport_security,
+        )
+        session_manager = StreamableHTTPSessionManager(
+            app=self._mcp_server,
+            event_store=self._event_store,
+            json_response=self.settings.json_response,
+            stateless=self.settings.stateless_http,
+            security_settings=self.settings.transport_security,
+        )
+        self._session_manager = session_manager
+
+        async def handle_sse(request: Request) -> Response:
+            async with sse.connect_sse(
+                request.scope, request.receive, request._send  # type: ignore
+            ) as (read_stream, write_stream):
+                await self._mcp_server.run(
+                    read_stream, write_stream, self.initialization_options()
+                )
+            return Response()
+
+        handle_streamable_http: ASGIApp = session_manager.handle_request
+        if session_manager.stateless:
+            handle_streamable_http = issue_session_ids(handle_streamable_http)
+
+        @asynccontextmanager
+        async def app_lifespan(app: Starlette):
+            async with AsyncExitStack() as stack:
+                if lifespan is not None:
+                    await stack.enter_async_context(lifespan())
+                await stack.enter_async_context(session_manager.run())
+                yield
+
+        routes: list[BaseRoute] = []
+        if not session_manager.stateless:
+            routes += [
+                Route(self.settings.sse_path, endpoint=handle_sse, methods=["GET"]),
+                Mount(self.settings.message_path, app=sse.handle_post_message),
+            ]
+        routes += [
+            Mount(self.settings.streamable_http_path, app=handle_streamable_http),
+            *self._custom_starlette_routes,
+        ]
+        return Starlette(
+            debug=self.settings.debug, routes=routes, lifespan=app_lifespan
+        )
+
     def _setup_handlers(self) -> None:
         super()._setup_handlers()
         self._mcp_server.list_tools()(self.list_tools)  # Override list_tools
         self._mcp_server.list_resources()(self.list_resources)
         self._mcp_server.read_resource()(self.read_resource)
 
-    def add_tool_to_context(
-        self,
-        fn: AnyFunction,
-        name: str | None = None,
-        title: str | None = None,
-        description: str | None = None,
-        annotations: ToolAnnotations | None = None,
-        structured_output: bool | None = None,
-    ) -> None:
+    async def set_tools_in_context(self, tools: list[GalaxyTool]) -> bool:
         context = self.get_context()
         if context is None:
-            raise RuntimeError("Context is None in `add_tool_to_context()`")
-        else:
-            self._tool_manager.add_tool_to_context(
-                fn,
-                context=context,
-                name=name,
-                title=title,
-                description=description,
-                annotations=annotations,
-                structured_output=structured_output,
-            )
+            raise RuntimeError("Context is None in `set_tools_in_context()`")
+        return await self._tool_manager.set_tools_in_context(tools, context=context)
 
-    def add_resource_to_context(self, resource: Resource) -> None:
+    async def add_resources_to_context(self, resources: list[ResourceRef]) -> bool:
         context = self.get_context()
         if context is None:
-            raise RuntimeError("Context is None in `add_resource_to_context()`")
-        self._resource_manager.add_resource_to_context(resource, context)
+            raise RuntimeError("Context is None in `add_resources_to_context()`")
+        return await self._resource_manager.add_resources_to_context(resources, context)
 
     async def list_tools(self) -> list[MCPTool]:
         context = self.get_context()
         if context is None:
             raise RuntimeError("Context is None in `list_tools()`")
-        tools = self._tool_manager.list_tools(context=context)
-        return [
-            MCPTool(
-                name=info.name,
-                title=info.title,
-                description=info.description,
-                inputSchema=info.parameters,
-                outputSchema=info.output_schema,
-                annotations=info.annotations,
-            )
-            for info in tools
-        ]
+        return await self._tool_manager.list_tools_in_context(context=context)
 
     async def list_resources(self) -> list[MCPResource]:
         context = self.get_context()
         if context is None:
             raise RuntimeError("Context is None in `list_resources`")
-        resources = self._resource_manager.list_resources(context=context)
+        refs = await self._resource_manager.list_resources_in_context(context=context)
         return [
             MCPResource(
-                uri=resource.uri,
-                name=resource.name or "",
-                title=resource.title,
-                description=resource.description,
-                mimeType=resource.mime_type,
+                uri=AnyUrl(ref.uri),
+                name=ref.name or "",
+                title=ref.title,
+                description=ref.description,
+                mimeType=ref.mime_type,
             )
-            for resource in resources
+            for ref in refs
         ]
 
     async def read_resource(self, uri: AnyUrl | str) -> Iterable[ReadResourceContents]:
@@ -146,78 +211,100 @@ class RheaFastMCP(FastMCP):
             raise ResourceError(str(e))
 
 
+def issue_session_ids(app: ASGIApp) -> ASGIApp:
+    """
+    The SDK does not issue session IDs in stateless mode, yet client state is keyed by them
+    (see `get_session_id`). Issue one to requests without, so clients send it back on
+    subsequent requests, whichever worker serves them.
+    """
+
+    async def wrapper(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or MCP_SESSION_ID_HEADER in Headers(scope=scope):
+            await app(scope, receive, send)
+            return
+
+        session_id = uuid.uuid4().hex
+
+        async def send_with_session_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if MCP_SESSION_ID_HEADER not in headers:
+                    headers[MCP_SESSION_ID_HEADER] = session_id
+            await send(message)
+
+        await app(scope, receive, send_with_session_id)
+
+    return wrapper
+
+
+def to_mcp_tool(info: Tool) -> MCPTool:
+    return MCPTool(
+        name=info.name,
+        title=info.title,
+        description=info.description,
+        inputSchema=info.parameters,
+        outputSchema=info.output_schema,
+        annotations=info.annotations,
+    )
+
+
 class RheaToolManager(ToolManager):
-    def add_tool_to_context(
+    """
+    Tools registered on the server (e.g. `find_tools`) form a global registry shared by all
+    sessions, which is not modified while serving. Each session layers its own tool set on
+    top, which `find_tools` swaps as a whole.
+    """
+
+    def __init__(self, *args: Any, listing_cache_size: int = 1024, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # Precomputed listings (global + session tools), by session tool set
+        self._listings: LRUCache[tuple[str, ...], list[MCPTool]] = LRUCache(
+            listing_cache_size
+        )
+
+    def add_tool(self, *args: Any, **kwargs: Any) -> Tool:
+        self._listings.clear()  # The global registry changed
+        return super().add_tool(*args, **kwargs)
+
+    async def set_tools_in_context(
         self,
-        fn: Callable[..., Any],
-        context: Context[ServerSessionT, LifespanContextT, RequestT] | None = None,
-        name: str | None = None,
-        title: str | None = None,
-        description: str | None = None,
-        annotations: ToolAnnotations | None = None,
-        structured_output: bool | None = None,
-    ) -> Tool:
-        tool = Tool.from_function(
-            fn,
-            name=name,
-            title=title,
-            description=description,
-            annotations=annotations,
-            structured_output=structured_output,
+        tools: list[GalaxyTool],
+        context: Context[ServerSessionT, LifespanContextT, RequestT],
+    ) -> bool:
+        """
+        Swap the tool set of the client's session.
+        Returns: Whether the session's tool set changed.
+        """
+        tool_cache: CompiledToolCache = context.request_context.lifespan_context.tool_cache  # type: ignore
+        compiled = {t.id: tool_cache.put(t) for t in tools}
+
+        client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+        return await client_manager.set_client_tools(
+            get_session_id(context),
+            {tool.name: tool_id for tool_id, tool in compiled.items()},
         )
 
-        # If client context is available, add the tool only to that client's context.
-        if (
-            context is not None
-            and context.request_context.request is not None
-            and (request := context.request_context.request) is not None
-            and (headers := request.headers) is not None  # type: ignore
-            and (session_id := headers.get("mcp-session-id")) is not None
-        ):
-            client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
-            client_state: ClientState = client_manager.get_client_state(session_id)
-            existing = client_state._tools.get(tool.name)
-            if existing:
-                if self.warn_on_duplicate_tools:
-                    logger.warning(f"Tool already exists: {tool.name}")
-                return existing
-            client_state._tools[tool.name] = tool
-            client_manager.set_client_state(
-                session_id, tools=client_state._tools, resources=client_state._resources
-            )
-        else:
-            existing = self._tools.get(tool.name)
-            if existing:
-                if self.warn_on_duplicate_tools:
-                    logger.warning(f"Tool already exists: {tool.name}")
-                return existing
-            self._tools[tool.name] = tool
-
-        return tool
-
-    def list_tools(
-        self, context: Context[ServerSessionT, LifespanContextT, RequestT] | None = None
-    ) -> List[Tool]:
-        # Get tools available to all clients
-        tools: List[Tool] = list(self._tools.values())
-
-        # Get client specific tools
-        if context is not None:
-            request: Any | None = context.request_context.request
-
-            if request is not None:
-                # Get session ID (if exists)
-                headers: dict = request.headers
-                session_id: str | None = headers.get("mcp-session-id")
-
-                if session_id is not None:
-                    client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
-                    client_state: ClientState = client_manager.get_client_state(
-                        session_id
-                    )
-                    tools = tools + (list(client_state._tools.values()))
-
-        return tools
+    async def list_tools_in_context(
+        self, context: Context[ServerSessionT, LifespanContextT, RequestT]
+    ) -> list[MCPTool]:
+        client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+        session_tools = await client_manager.get_client_tools(get_session_id(context))
+
+        key = tuple(session_tools.values())
+        listing = self._listings.get(key)
+        if listing is None:
+            tool_cache: CompiledToolCache = context.request_context.lifespan_context.tool_cache  # type: ignore
+            listing = [to_mcp_tool(tool) for tool in self._tools.values()]
+            complete = True
+            for tool_id in key:
+                if (tool := await tool_cache.get(tool_id)) is not None:
+                    listing.append(to_mcp_tool(tool))
+                else:
+                    complete = False
+            # A tool that failed to load may load on the next listing
+            if complete:
+                self._listings[key] = listing
+        return listing
 
     async def call_tool(
         self,
@@ -228,7 +315,15 @@ class RheaToolManager(ToolManager):
     ):
         if context is None:
             raise RuntimeError(f"'context' is None")
+        tool_cache: CompiledToolCache = context.request_context.lifespan_context.tool_cache  # type: ignore
         tool = self.get_tool(name)
+        if not tool:
+            client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+            tool_id = await client_manager.get_client_tool(
+                get_session_id(context), name
+            )
+            if tool_id is not None:
+                tool = await tool_cache.get(tool_id)
         if not tool:
             db_sessionmaker: async_sessionmaker[AsyncSession] = (
                 context.request_context.lifespan_context.db_sessionmaker  # type: ignore
@@ -238,79 +333,36 @@ class RheaToolManager(ToolManager):
 
             if t is None:
                 raise ToolError(f"Unknown tool: { name }")
-            tool = create_tool(t, ctx=context)
+            tool = tool_cache.put(t)
         return await tool.run(arguments, context=context, convert_result=convert_result)
 
 
 class RheaResourceManager(ResourceManager):
-    def add_resource_to_context(
+    async def add_resources_to_context(
         self,
-        resource: Resource,
-        context: Context[ServerSessionT, LifespanContextT, RequestT] | None = None,
-    ) -> Resource:
-        # If client context is available, add the resource only to that client's context.
-        if (
-            context is not None
-            and context.request_context.request is not None
-            and (request := context.request_context.request) is not None
-            and (headers := request.headers) is not None  # type: ignore
-            and (session_id := headers.get("mcp-session-id")) is not None
-        ):
-            logger.debug(
-                f"Adding resource to user context {session_id}",
-                extra={
-                    "uri": resource.uri,
-                    "type": type(resource).__name__,
-                    "resource_name": resource.name,
-                },
-            )
-            client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
-            client_state: ClientState = client_manager.get_client_state(session_id)
-            existing = client_state._resources.get(str(resource.uri))
-            if existing:
-                if self.warn_on_duplicate_resources:
-                    logger.warning(f"Resource already exists: {resource.uri}")
-                return existing
-            client_state._resources[str(resource.uri)] = resource
-            client_manager.set_client_state(
-                session_id, tools=client_state._tools, resources=client_state._resources
-            )
-        else:
-            logger.debug(
-                "Adding resource to all contexts",
-                extra={
-                    "uri": resource.uri,
-                    "type": type(resource).__name__,
-                    "resource_name": resource.name,
-                },
-            )
-            existing = self._resources.get(str(resource.uri))
-            if existing:
-                if self.warn_on_duplicate_resources:
-                    logger.warning(f"Resource already exists: {resource.uri}")
-                return existing
-            self._resources[str(resource.uri)] = resource
-        return resource
-
-    def list_resources(
-        self, context: Context[ServerSessionT, LifespanContextT, RequestT] | None = None
-    ) -> list[Resource]:
-        resources: list[Resource] = []
-        if context is not None:
-            request: Any | None = context.request_context.request
-
-            if request is not None:
-                # Get session ID (if exists)
-                headers: dict = request.headers
-                session_id: str | None = headers.get("mcp-session-id")
-
-                if session_id is not None:
-                    client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
-                    client_state: ClientState = client_manager.get_client_state(
-                        session_id
-                    )
-                    resources = resources + (list(client_state._resources.values()))
-        return resources
+        resources: list[ResourceRef],
+        context: Context[ServerSessionT, LifespanContextT, RequestT],
+    ) -> bool:
+        """
+        Add resources to the client's session.
+        Returns: Whether any of the resources was new to the session.
+        """
+        session_id = get_session_id(context)
+        logger.debug(
+            f"Adding resources to user context {session_id}",
+            extra={"uris": [ref.uri for ref in resources]},
+        )
+        client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+        return await client_manager.add_client_resources(session_id, resources) > 0
+
+    async def list_resources_in_context(
+        self, context: Context[ServerSessionT, LifespanContextT, RequestT]
+    ) -> list[ResourceRef]:
+        client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+        client_state: ClientState = await client_manager.get_client_state(
+            get_session_id(context)
+        )
+        return list(client_state.resources.values())
 
     async def get_resource(
         self,
@@ -319,21 +371,16 @@ class RheaResourceManager(ResourceManager):
     ) -> Resource | None:
         uri_str = str(uri)
         logger.debug("Getting resource", extra={"uri": uri_str})
-        if context is not None:
-            request: Any | None = context.request_context.request
-
-            if request is not None:
-                # Get session ID (if exists)
-                headers: dict = request.headers
-                session_id: str | None = headers.get("mcp-session-id")
-
-                if session_id is not None:
-                    client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
-                    client_state: ClientState = client_manager.get_client_state(
-                        session_id
-                    )
-                    if resource := client_state._resources.get(uri_str):
-                        return resource
-                    # TODO: Check templates
-        else:
+        if context is None:
             raise RuntimeError("Context is None in `get_resource`")
+        client_manager: ClientManager = context.request_context.lifespan_context.client_manager  # type: ignore
+        ref = await client_manager.get_client_resource(get_session_id(context), uri_str)
+        if ref is not None and ref.kind == "output":
+            return create_proxystore_function_resource(ref, context)  # type: ignore
+
+        # Server resources and templates, e.g. `resource://documentation/{tool_id}`
+        try:
+            return await super().get_resource(uri_str)
+        except ValueError as e:
+            logger.debug(str(e))
+            return None
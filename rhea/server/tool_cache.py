@@ -0,0 +1,92 @@
+"""
+Process-wide caches shared by all sessions.
+
+Compiling a Galaxy tool into an MCP tool (`create_tool`) does not depend on the session, so
+compiled tools are shared by all sessions and rehydrated from the compact references kept
+in client state (see `rhea.server.client_manager`). Tool documentation is only loaded when
+a client reads it.
+"""
+
+import asyncio
+from urllib.parse import unquote
+
+from cachetools import LRUCache
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from mcp.server.fastmcp.tools import Tool as FastMCPTool
+
+from rhea.utils.schema import Tool
+from rhea.utils.models import get_documentation_by_id, get_galaxytool_by_id
+from rhea.server.utils import create_tool
+
+
+class CompiledToolCache:
+    def __init__(
+        self, db_sessionmaker: async_sessionmaker[AsyncSession], maxsize: int = 1024
+    ):
+        self.db_sessionmaker = db_sessionmaker
+        self.entries: LRUCache[str, FastMCPTool] = LRUCache(maxsize)
+        self._loading: dict[str, asyncio.Future] = {}
+
+    def put(self, tool: Tool) -> FastMCPTool:
+        """Compile a Galaxy tool (unless already cached) and cache it."""
+        compiled = self.entries.get(tool.id)
+        if compiled is None:
+            compiled = create_tool(tool)
+            self.entries[tool.id] = compiled
+        return compiled
+
+    async def get(self, tool_id: str) -> FastMCPTool | None:
+        entry = self.entries.get(tool_id)
+        if entry is not None:
+            return entry
+
+        # Concurrent misses for the same tool share one database lookup
+        if (pending := self._loading.get(tool_id)) is not None:
+            return await pending
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[tool_id] = future
+        try:
+            async with self.db_sessionmaker() as session:
+                tool: Tool | None = await get_galaxytool_by_id(session, tool_id)
+            if tool is not None:
+                self.put(tool)
+            entry = self.entries.get(tool_id)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._loading.pop(tool_id, None)
+
+
+class DocumentationStore:
+    """LRU cache of tool documentation by tool ID, loaded on first read."""
+
+    def __init__(
+        self, db_sessionmaker: async_sessionmaker[AsyncSession], maxsize: int = 256
+    ):
+        self.db_sessionmaker = db_sessionmaker
+        self.entries: LRUCache[str, str] = LRUCache(maxsize)
+
+    async def get(self, tool_id: str) -> str:
+        text = self.entries.get(tool_id)
+        if text is None:
+            async with self.db_sessionmaker() as session:
+                documentation = await get_documentation_by_id(session, tool_id)
+            text = (
+                documentation
+                if documentation is not None
+                else f"Documentation for '{tool_id}' is not available."
+            )
+            self.entries[tool_id] = text
+        return text
+
+    async def read(self, tool_id: str) -> str:
+        """Handler of `DOCUMENTATION_URI_TEMPLATE`, the tool ID is percent-encoded."""
+        return await self.get(unquote(tool_id))
@@ -3,6 +3,7 @@ import unicodedata
 import time
 import copy
 from typing import List
+from urllib.parse import quote
 from inspect import Signature, Parameter
 
 from pydantic import AnyUrl
@@ -15,11 +16,18 @@ from mcp.server.fastmcp.resources import FunctionResource
 
 # Helper imports
 from rhea.utils.schema import Tool, Inputs
-from rhea.server.schema import MCPOutput, MCPDataOutput, Settings, AgentState
+from rhea.server.schema import MCPOutput, MCPDataOutput, Settings
+from rhea.server.agents import AgentRegistry
+from rhea.server.admission import AdmissionController
+from rhea.server.client_manager import ResourceRef
 from rhea.agent.schema import RheaParam, RheaOutput
+from rhea.utils.proxy import RheaFileProxy
+from rhea.utils.lifecycle import add_file_ref, session_ref
 from rhea.utils.models import get_galaxytool_by_id
 from rhea.manager.utils import get_handle_from_redis
-from rhea.manager.launch_agent import launch_agent
+from rhea.server.coordinator import launch, request_launch
+from rhea.agent.env_store import get_env_failure
+from rhea.agent.utils import conda_env_key
 import rhea.server.metrics as metrics
 
 # ProxyStore imports
@@ -28,6 +36,7 @@ from proxystore.store import Store
 from redis import Redis
 
 # Academy imports
+from academy.exception import AgentTerminatedError
 from academy.handle import UnboundRemoteHandle, RemoteHandle
 
 
@@ -103,30 +112,135 @@ def sanitize_tool_name(text: str, repl: str = "_") -> str:
     return text.strip(repl + "-")
 
 
+def get_session_id(ctx: Context) -> str:
+    """
+    ID of the client session behind a request: the `mcp-session-id` header of streamable HTTP,
+    or an ID of the connection's server session for transports without one (stdio, SSE).
+    """
+    request = ctx.request_context.request
+    if request is not None:
+        session_id: str | None = request.headers.get("mcp-session-id")  # type: ignore
+        if session_id is not None:
+            return session_id
+    return f"local-{id(ctx.request_context.session):x}"
+
+
+def output_resource_ref(file: MCPDataOutput) -> ResourceRef:
+    return ResourceRef(
+        uri=f"proxystore://{file.key}",
+        kind="output",
+        name=file.filename,
+        title=file.name,
+        description=f"Output file {file.filename} from tool call",
+        mime_type="text/plain",
+    )
+
+
+DOCUMENTATION_URI_TEMPLATE = "resource://documentation/{tool_id}"
+
+
+def documentation_uri(tool_id: str) -> str:
+    # Encoded, since a template parameter cannot hold a "/" (and URIs no spaces)
+    return DOCUMENTATION_URI_TEMPLATE.format(tool_id=quote(tool_id, safe=""))
+
+
+def documentation_resource_ref(tool: Tool) -> ResourceRef:
+    name = tool.name or tool.user_provided_name or tool.id
+    return ResourceRef(
+        uri=documentation_uri(tool.id),
+        kind="documentation",
+        name=f"{name} Documentation",
+        description=f"Full documentation for {name}",
+        mime_type="text/markdown",
+    )
+
+
 def create_proxystore_function_resource(
-    file: MCPDataOutput, ctx: Context
+    ref: ResourceRef, ctx: Context
 ) -> FunctionResource:
+    key = ref.uri.removeprefix("proxystore://")
+
     async def _fetch() -> bytes:
-        redis_key = RedisKey(redis_key=file.key)
+        redis_key = RedisKey(redis_key=key)
         output_store: Store = ctx.request_context.lifespan_context.output_store
 
         res = output_store.get(redis_key)
         if res is None:
-            raise ValueError(f"Key {file.key} not in ProxyStore")
+            raise ValueError(f"Key {key} not in ProxyStore")
 
         return res
 
     return FunctionResource(
-        uri=AnyUrl(f"proxystore://{file.key}"),
-        name=file.filename,
-        title=file.name,
-        description=f"Output file {file.filename} from tool call",
-        mime_type="text/plain",
+        uri=AnyUrl(ref.uri),
+        name=ref.name or key,
+        title=ref.title,
+        description=ref.description,
+        mime_type=ref.mime_type,
         fn=_fetch,
     )
 
 
-def create_tool(tool: Tool, ctx: Context) -> FastMCPTool:
+async def get_agent_handle(tool: Tool, ctx: Context) -> RemoteHandle:
+    """
+    Handle of the agent running a tool, bound once per server process. Agents launched by
+    other processes (or replicas) of this run are found through Redis; otherwise one is
+    launched.
+    """
+    agents: AgentRegistry = ctx.request_context.lifespan_context.agents
+    if (handle := agents.get(tool.id)) is not None:
+        return handle
+
+    settings: Settings = ctx.request_context.lifespan_context.settings
+    run_id: str = ctx.request_context.lifespan_context.run_id
+    r = Redis(settings.redis_host, settings.redis_port)
+
+    # Concurrent calls for the same tool share one lookup (or launch)
+    async with agents.lock(tool.id):
+        if (handle := agents.get(tool.id)) is not None:
+            return handle
+
+        # First, quickly check if the agent exists in other processes
+        unbound_handle: UnboundRemoteHandle | None = await get_handle_from_redis(
+            tool.id, run_id, r, timeout=1
+        )
+
+        if unbound_handle is None:
+            # Don't retry environments that are known to fail to build
+            if not tool.requirements.containers and tool.requirements.requirements:
+                failure = get_env_failure(
+                    r, conda_env_key(tool.requirements.requirements)
+                )
+                if failure is not None:
+                    reason = failure["error"].strip().splitlines()
+                    raise RuntimeError(
+                        f"Conda environment for tool {tool.id} failed to build"
+                        + (f": {reason[-1]}" if reason else "")
+                    )
+
+            # Launch agent, through the coordinator process when there are several workers
+            if settings.workers > 1:
+                request_launch(r, run_id, tool.id, settings.agent_handle_timeout)
+            else:
+                launch(tool, settings, run_id)
+
+            unbound_handle = await get_handle_from_redis(
+                tool.id,
+                run_id,
+                r,
+                timeout=settings.agent_handle_timeout,
+            )
+
+            if unbound_handle is None:
+                raise RuntimeError("Never received handle from Parsl worker.")
+
+            handle = agents.bind(tool.id, unbound_handle)
+            await ctx.info(f"Lanched agent {handle.agent_id}")
+            return handle
+
+        return agents.bind(tool.id, unbound_handle)
+
+
+def create_tool(tool: Tool, ctx: Context | None = None) -> FastMCPTool:
     params: List[Parameter] = []
 
     # Add Context to tool params
@@ -153,11 +267,9 @@ def create_tool(tool: Tool, ctx: Context) -> FastMCPTool:
                 # Get settings from app context
                 settings: Settings = ctx.request_context.lifespan_context.settings
 
-                # Configure Redis client to get handle
+                # Configure Redis client to reference output files
                 r = Redis(settings.redis_host, settings.redis_port)
 
-                run_id = ctx.request_context.lifespan_context.run_id
-
                 db_sessionmaker: async_sessionmaker[AsyncSession] = (
                     ctx.request_context.lifespan_context.db_sessionmaker
                 )
@@ -178,69 +290,26 @@ def create_tool(tool: Tool, ctx: Context) -> FastMCPTool:
 
                 await ctx.report_progress(0.05, 1)
 
-                if tool_id not in ctx.request_context.lifespan_context.agents:
-                    # First, quickly check if the agent exists in other contexts
-                    unbound_handle: UnboundRemoteHandle | None = (
-                        await get_handle_from_redis(tool.id, run_id, r, timeout=1)
-                    )
-
-                    # Another context already initialized this tool, bind it to this Academy client:
-                    if unbound_handle is not None:
-                        handle: RemoteHandle = unbound_handle.bind_to_client(
-                            ctx.request_context.lifespan_context.academy_client
-                        )
-                        ctx.request_context.lifespan_context.agents[tool_id] = (
-                            AgentState(tool_id=tool_id, handle=handle)
-                        )
-
-                    else:
-                        # Launch agent
-                        launch_agent(
-                            tool,
-                            run_id=run_id,
-                            container_runtime=settings.parsl_container_backend,
-                            redis_host=settings.agent_redis_host,
-                            redis_port=settings.agent_redis_port,
-                            minio_endpoint=settings.minio_endpoint,
-                            minio_access_key=settings.minio_access_key,
-                            minio_secret_key=settings.minio_secret_key,
-                            minio_secure=False,
-                        )
-
-                        unbound_handle: UnboundRemoteHandle | None = (
-                            await get_handle_from_redis(
-                                tool.id,
-                                run_id,
-                                r,
-                                timeout=settings.agent_handle_timeout,
-                            )
-                        )
-
-                        if unbound_handle is None:
-                            raise RuntimeError(
-                                "Never received handle from Parsl worker."
-                            )
+                agents: AgentRegistry = ctx.request_context.lifespan_context.agents
+                admission: AdmissionController = (
+                    ctx.request_context.lifespan_context.admission
+                )
 
-                        handle: RemoteHandle = unbound_handle.bind_to_client(
-                            ctx.request_context.lifespan_context.academy_client
-                        )
+                # Wait for an execution slot, or fail as busy
+                async with admission.admit(get_session_id(ctx), tool_id):
+                    handle: RemoteHandle = await get_agent_handle(tool, ctx)
 
-                        await ctx.info(f"Lanched agent {handle.agent_id}")
+                    await ctx.info(f"Executing tool {tool_id} in {handle.agent_id}")
+                    await ctx.report_progress(0.1, 1)
 
-                        ctx.request_context.lifespan_context.agents[tool_id] = (
-                            AgentState(tool_id=tool_id, handle=handle)
+                    # Execute tool
+                    try:
+                        tool_result: RheaOutput = await (
+                            await handle.run_tool(rhea_params)
                         )
-
-                # Get handle from dictionary
-                handle: RemoteHandle = ctx.request_context.lifespan_context.agents[
-                    tool_id
-                ].handle
-
-                await ctx.info(f"Executing tool {tool_id} in {handle.agent_id}")
-                await ctx.report_progress(0.1, 1)
-
-                # Execute tool
-                tool_result: RheaOutput = await (await handle.run_tool(rhea_params))
+                    except AgentTerminatedError:
+                        agents.discard(tool_id)
+                        raise
 
                 await ctx.info(f"Tool {tool_id} finished in {handle.agent_id}")
                 await ctx.report_progress(1, 1)
@@ -249,13 +318,32 @@ def create_tool(tool: Tool, ctx: Context) -> FastMCPTool:
 
                 # Add ProxyStore resource
                 if result.files is not None:
+                    output_store: Store = (
+                        ctx.request_context.lifespan_context.output_store
+                    )
+                    session_id = get_session_id(ctx)
+                    added = await ctx.request_context.lifespan_context.resource_manager.add_resources_to_context(
+                        [output_resource_ref(file) for file in result.files],
+                        context=ctx,
+                    )
+                    if added:
+                        # Notify the client that we have new output resources
+                        await ctx.request_context.lifespan_context.notifier.notify(
+                            ctx, "resources"
+                        )
                     for file in result.files:
-                        ctx.request_context.lifespan_context.resource_manager.add_resource_to_context(
-                            resource=create_proxystore_function_resource(file, ctx)
+                        # Keep the output alive for as long as the session may read it
+                        proxy = RheaFileProxy.from_proxy(
+                            RedisKey(redis_key=file.key),
+                            output_store,
+                            ttl=settings.file_ttl,
+                        )
+                        add_file_ref(
+                            r,
+                            proxy.file_key,
+                            session_ref(session_id),
+                            ttl=settings.client_ttl,
                         )
-
-                # Notify the client that we have new output resources
-                await ctx.request_context.session.send_resource_list_changed()
 
                 # Log execution time
                 metrics.tool_execution_runtime.observe(time.time() - start_time)
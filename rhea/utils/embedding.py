@@ -2,9 +2,10 @@ from openai import OpenAI
 from typing import List
 
 from rhea.utils.schema import Tool
-from rhea.utils.models import GalaxyTool
+from rhea.utils.models import GalaxyTool, SEARCH_CONFIG, search_document
 
-from sqlalchemy import select
+from sqlalchemy import Text, func, literal, select, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
 template = """# {name}
@@ -47,14 +48,74 @@ def generate_tool_documentation_embedding(
     )
 
 
-async def get_l2_distance(
-    query_vec: List[float], session: AsyncSession, limit: int = 10
+# Rank constant of reciprocal rank fusion, damping the weight of top ranks
+RRF_K = 60
+
+
+def _definition_without_documentation():
+    # Only load definitions, without their documentation (served lazily as a resource)
+    return (
+        type_coerce(GalaxyTool._definition, JSONB)
+        .op("-", return_type=JSONB)(literal("documentation", Text))
+        .label("definition")
+    )
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """
+    Fuse rankings of IDs: each ID scores the sum of `1 / (k + rank)` over the rankings it
+    appears in. Ties keep the order in which IDs were first ranked.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def lexical_query(query: str):
+    """Full-text query matching any of the query's terms (rather than all of them)."""
+    terms = func.plainto_tsquery(SEARCH_CONFIG, query).cast(Text)
+    return func.to_tsquery(SEARCH_CONFIG, func.replace(terms, " & ", " | "))
+
+
+async def get_hybrid_matches(
+    query: str,
+    query_vec: List[float],
+    session: AsyncSession,
+    limit: int = 10,
+    candidates: int = 50,
 ) -> List[Tool]:
-    dist_col = GalaxyTool.embedding.l2_distance(query_vec).label("distance")
+    """
+    Tools matching a query, by reciprocal rank fusion of their embedding distance and their
+    full-text rank. Full-text search catches exact tool names and formats (e.g. "bam to
+    fastq") that embeddings miss.
+
+    Args:
+        candidates: Number of tools ranked by each retriever before fusion.
+    """
+    dist_col = GalaxyTool.embedding.l2_distance(query_vec)
+    result = await session.execute(
+        select(GalaxyTool.id).order_by(dist_col).limit(candidates)
+    )
+    vector_ids = list(result.scalars().all())
+
+    ts_query = lexical_query(query)
+    result = await session.execute(
+        select(GalaxyTool.id)
+        .where(search_document.op("@@")(ts_query))
+        .order_by(func.ts_rank_cd(search_document, ts_query).desc())
+        .limit(candidates)
+    )
+    lexical_ids = list(result.scalars().all())
+
+    ids = reciprocal_rank_fusion([vector_ids, lexical_ids])[:limit]
 
     result = await session.execute(
-        (select(GalaxyTool, dist_col).order_by(dist_col).limit(limit))
+        select(GalaxyTool.id, _definition_without_documentation()).where(
+            GalaxyTool.id.in_(ids)
+        )
     )
+    definitions = {row.id: row.definition for row in result.all()}
 
-    rows = result.all()
-    return [orm_obj.definition for orm_obj, _dist in rows]
+    return [Tool.model_validate(definitions[i]) for i in ids if i in definitions]
@@ -0,0 +1,179 @@
+"""
+Lifecycle management for file blobs stored in Redis.
+
+Every `file:{id}` blob written by `RheaFileHandle` carries a TTL that is extended (never
+shortened) whenever the blob is written, opened or referenced. Holders of a blob register
+a reference in the sorted set `file_refs:{id}`, scored by the time the reference expires:
+
+- `proxy:{redis_key}` for ProxyStore keys in `rhea-input`/`rhea-output`.
+- `session:{session_id}` for MCP session resources pointing at the blob.
+
+`collect_garbage` periodically removes blobs without any live reference, which covers
+blobs whose upload never produced a proxy. Blobs written before TTLs were introduced have
+no references yet, so they are given a TTL instead: proxies still pointing at them
+register a reference on next access, and the rest expire.
+"""
+
+from __future__ import annotations
+
+import time
+import logging
+from dataclasses import dataclass
+from typing import Iterable
+
+from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import ResponseError, WatchError
+
+logger = logging.getLogger(__name__)
+
+FILE_KEY_PREFIX = "file:"
+FILE_REFS_PREFIX = "file_refs:"
+
+# Default lifetime of blobs, proxies and references in seconds. The server passes
+# `Settings.file_ttl` explicitly, and forwards it to the agents it launches.
+DEFAULT_FILE_TTL = 24 * 3600
+
+
+def _decode(key: str | bytes) -> str:
+    return key.decode() if isinstance(key, bytes) else key
+
+
+def refs_key(file_key: str) -> str:
+    """Name of the reference set belonging to `file_key`."""
+    return f"{FILE_REFS_PREFIX}{file_key.removeprefix(FILE_KEY_PREFIX)}"
+
+
+def proxy_ref(redis_key: str) -> str:
+    return f"proxy:{redis_key}"
+
+
+def session_ref(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def extend_ttl(pipe: Pipeline, keys: Iterable[str], ttl: int) -> None:
+    """
+    Queue commands ensuring every key lives for at least `ttl` seconds.
+    NX covers keys without an expiry, GT only ever raises an existing one.
+    """
+    for key in keys:
+        pipe.expire(key, ttl, nx=True)
+        pipe.expire(key, ttl, gt=True)
+
+
+def touch_file(r: Redis, file_key: str, ttl: int = DEFAULT_FILE_TTL) -> None:
+    """Refresh the TTL of a blob (and its reference set) on access."""
+    pipe = r.pipeline(transaction=False)
+    extend_ttl(pipe, (file_key, refs_key(file_key)), ttl)
+    pipe.execute()
+
+
+def add_file_ref(
+    r: Redis, file_key: str, ref: str, ttl: int = DEFAULT_FILE_TTL
+) -> None:
+    """
+    Register (or renew) a reference to `file_key` that is valid for `ttl` seconds.
+    The blob is kept alive for at least as long as the reference.
+    """
+    pipe = r.pipeline(transaction=False)
+    pipe.zadd(refs_key(file_key), {ref: time.time() + ttl}, gt=True)
+    extend_ttl(pipe, (file_key, refs_key(file_key)), ttl)
+    pipe.execute()
+
+
+def remove_file_ref(r: Redis, file_key: str, ref: str) -> None:
+    r.zrem(refs_key(file_key), ref)
+
+
+def count_file_refs(r: Redis, file_key: str) -> int:
+    """Number of references to `file_key` that have not yet expired."""
+    return r.zcount(refs_key(file_key), time.time(), "+inf")  # type: ignore
+
+
+def refresh_proxy(
+    r: Redis, redis_key: str, file_key: str, ttl: int = DEFAULT_FILE_TTL
+) -> None:
+    """Extend the TTL of a ProxyStore key and renew its reference on the blob."""
+    pipe = r.pipeline(transaction=False)
+    extend_ttl(pipe, (redis_key,), ttl)
+    pipe.zadd(refs_key(file_key), {proxy_ref(redis_key): time.time() + ttl}, gt=True)
+    extend_ttl(pipe, (file_key, refs_key(file_key)), ttl)
+    pipe.execute()
+
+
+@dataclass
+class GCStats:
+    scanned: int = 0
+    deleted: int = 0
+    adopted: int = 0
+    reclaimed_bytes: int = 0
+
+
+def _idle_time(r: Redis, key: str) -> int | None:
+    try:
+        return r.object("idletime", key)  # type: ignore
+    except ResponseError:  # Not available under LFU eviction policies
+        return None
+
+
+def collect_garbage(
+    r: Redis,
+    grace_period: int = 600,
+    count: int = 500,
+    ttl: int = DEFAULT_FILE_TTL,
+) -> GCStats:
+    """
+    Delete `file:*` blobs that have no live references.
+
+    Expired references are pruned first. A blob without references is only deleted once it
+    has been idle for `grace_period` seconds, so uploads that have not been wrapped in a
+    proxy yet are left alone. The final check runs under WATCH, so a reference added
+    concurrently (e.g. a deduplicated upload) always wins over the collector.
+
+    Args:
+        r: Redis client holding the blobs.
+        grace_period: Minimum idle time in seconds before an unreferenced blob is deleted.
+        count: SCAN batch size.
+        ttl: Lifetime given to blobs written without one.
+
+    Returns:
+        Counts of scanned, deleted and adopted blobs, and the number of bytes reclaimed.
+    """
+    stats = GCStats()
+
+    for raw_key in r.scan_iter(match=f"{FILE_KEY_PREFIX}*", count=count):
+        file_key = _decode(raw_key)
+        stats.scanned += 1
+
+        # Written before blobs carried a TTL, and possibly still used by a proxy
+        if r.expire(file_key, ttl, nx=True):
+            stats.adopted += 1
+            continue
+
+        rk = refs_key(file_key)
+        now = time.time()
+
+        r.zremrangebyscore(rk, "-inf", now)
+
+        idle = _idle_time(r, file_key)
+        if idle is not None and idle < grace_period:
+            continue
+
+        with r.pipeline() as pipe:
+            try:
+                pipe.watch(rk, file_key)
+                if pipe.zcount(rk, now, "+inf") > 0:  # type: ignore
+                    continue
+                size: int = pipe.strlen(file_key)  # type: ignore
+                pipe.multi()
+                pipe.delete(file_key, rk)
+                pipe.execute()
+            except WatchError:
+                continue
+
+        stats.deleted += 1
+        stats.reclaimed_bytes += size
+        logger.debug(f"Collected unreferenced blob {file_key} ({size} bytes)")
+
+    return stats
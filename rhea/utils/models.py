@@ -1,7 +1,16 @@
-from sqlalchemy import Column, String, Index, Text, select
+from sqlalchemy import (
+    Column,
+    String,
+    Index,
+    Text,
+    func,
+    text,
+    select,
+)
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.schema import CreateIndex
 from pgvector.sqlalchemy import Vector
 from typing import List
 from .schema import Tool
@@ -40,6 +49,35 @@ class GalaxyTool(Base):
             self._definition = Tool.model_validate(t).model_dump()
 
 
+# Full-text search configuration. SQL literals (rather than bound parameters) keep queries
+# rendering the exact expression of the search index, so the planner can use it.
+SEARCH_CONFIG = text("'english'::regconfig")
+
+
+def _weighted_search_vector(column, weight: str):
+    return func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, text("''"))),
+        text(f"'{weight}'"),
+    )
+
+
+# Searchable text of a tool: its names rank above its description, above its long description
+search_document = (
+    _weighted_search_vector(GalaxyTool.name, "A")
+    .op("||")(_weighted_search_vector(GalaxyTool.user_provided_name, "A"))
+    .op("||")(_weighted_search_vector(GalaxyTool.description, "B"))
+    .op("||")(_weighted_search_vector(GalaxyTool.long_description, "C"))
+)
+
+search_index = Index("ix_galaxytools_search", search_document, postgresql_using="gin")
+
+
+async def create_search_index(engine: AsyncEngine) -> None:
+    """Create the full-text search index on databases created before it was introduced."""
+    async with engine.begin() as conn:
+        await conn.execute(CreateIndex(search_index, if_not_exists=True))
+
+
 async def get_galaxytool_by_id(session: AsyncSession, tool_id: str) -> Tool | None:
     statement = select(GalaxyTool).where(GalaxyTool.id == tool_id)
     result = await session.execute(statement)
@@ -58,6 +96,12 @@ async def get_galaxytool_by_name(session: AsyncSession, tool_name: str) -> Tool
     return row.definition
 
 
+async def get_documentation_by_id(session: AsyncSession, tool_id: str) -> str | None:
+    statement = select(GalaxyTool.documentation).where(GalaxyTool.id == tool_id)
+    result = await session.execute(statement)
+    return result.scalars().first()
+
+
 async def get_all_tool_ids(session: AsyncSession) -> List[str] | None:
     statement = select(GalaxyTool.id)
     result = await session.execute(statement)
@@ -4,6 +4,7 @@ from typing import List, Any
 
 from rhea.utils.schema import Tool, Test, Param, Conditional, Section
 from rhea.utils.proxy import RheaFileProxy, RheaFileHandle
+from rhea.utils.lifecycle import DEFAULT_FILE_TTL
 from rhea.agent.schema import (
     RheaParam,
     RheaOutput,
@@ -17,16 +18,56 @@ from proxystore.store import Store
 from proxystore.store.utils import get_key
 
 from minio import Minio
+from redis import Redis
 
 
 class FileConnector:
     def __init__(
-        self, tool_id: str, connector: RedisConnector, minio_client: Minio, bucket: str
+        self,
+        tool_id: str,
+        connector: RedisConnector,
+        minio_client: Minio,
+        bucket: str,
+        file_ttl: int = DEFAULT_FILE_TTL,
     ):
         self.tool_id = tool_id
         self.connector = connector
         self.minio_client = minio_client
         self.bucket = bucket
+        self.file_ttl = file_ttl
+
+
+def get_object_proxy(
+    fc: FileConnector, object_name: str, etag: str | None
+) -> RheaFileProxy:
+    """
+    Get a RheaFileProxy for an object in MinIO.
+    Objects are indexed by ETag, so an unchanged object that is already stored in Redis
+    is reused without downloading it again. The index expires with the blob it points at.
+    """
+    r: Redis = fc.connector._redis_client
+    name = os.path.basename(object_name)
+    etag_key = f"file_etag:{fc.bucket}/{object_name}:{etag}"
+
+    if etag is not None and (file_key := r.get(etag_key)) is not None:
+        try:
+            proxy = RheaFileProxy.from_key(name, file_key.decode(), r, fc.file_ttl)  # type: ignore
+        except KeyError:  # Blob was collected, fetch it again
+            r.delete(etag_key)
+        else:
+            r.expire(etag_key, fc.file_ttl)
+            return proxy
+
+    resp = fc.minio_client.get_object(fc.bucket, object_name)
+    try:
+        proxy = RheaFileProxy.from_stream(name, resp.stream(1 << 20), r, fc.file_ttl)
+    finally:
+        resp.close()
+        resp.release_conn()
+
+    if etag is not None:
+        r.set(etag_key, proxy.file_key, ex=fc.file_ttl)
+    return proxy
 
 
 def get_test_file_from_store(
@@ -55,12 +96,8 @@ def get_test_file_from_store(
                 serializer=cloudpickle.dumps,
                 deserializer=cloudpickle.loads,
             ) as input_store:
-                resp = fc.minio_client.get_object(fc.bucket, object_name)
-                content = resp.read()
-                proxy: RheaFileProxy = RheaFileProxy.from_buffer(
-                    os.path.basename(object_name), content, r=fc.connector._redis_client
-                )
-                key = RedisKey(redis_key=proxy.to_proxy(input_store))
+                proxy: RheaFileProxy = get_object_proxy(fc, object_name, obj.etag)
+                key = RedisKey(redis_key=proxy.to_proxy(input_store, fc.file_ttl))
                 p = RheaParam.from_param(input_param, key)
                 if isinstance(p, RheaFileParam):
                     p.filename = object_name.split("/")[-1]
@@ -148,13 +185,14 @@ def process_inputs(
     connector: RedisConnector,
     minio_client: Minio,
     minio_bucket: str,
+    file_ttl: int = DEFAULT_FILE_TTL,
 ) -> List[RheaParam]:
     tool_params: List[RheaParam] = []
     if test.params is None:
         return tool_params
 
     # Initialize FileConnector
-    fc = FileConnector(tool.id, connector, minio_client, minio_bucket)
+    fc = FileConnector(tool.id, connector, minio_client, minio_bucket, file_ttl)
 
     # Params
     # The old way of doing repeats is with a "|" split, where LHS is the index and RHS is the actual param name
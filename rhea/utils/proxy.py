@@ -10,8 +10,17 @@ import cloudpickle
 import os
 import logging
 import filetype
+import hashlib
 import uuid
 import io
+from typing import Iterable
+
+from rhea.utils.lifecycle import (
+    DEFAULT_FILE_TTL,
+    extend_ttl,
+    touch_file,
+    refresh_proxy,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,17 +40,59 @@ def get_file_format(buffer: bytes) -> str:
     return format
 
 
+def content_key(digest: str) -> str:
+    """Content-addressed key of a blob with the given SHA-256 digest."""
+    return f"file:sha256:{digest}"
+
+
 class RheaFileHandle:
-    def __init__(self, r: Redis, key: str | None = None):
+    def __init__(self, r: Redis, key: str | None = None, ttl: int = DEFAULT_FILE_TTL):
         if key is None:
             self.key: str = f"file:{uuid.uuid4()}"
         else:
             self.key = key
         self._r: Redis = r
         self._pos: int = 0
+        self.ttl = ttl
+        self._hasher = hashlib.sha256()
 
     def append(self, chunk: bytes) -> None:
-        self._r.append(self.key, chunk)
+        pipe = self._r.pipeline(transaction=False)
+        pipe.append(self.key, chunk)
+        extend_ttl(pipe, (self.key,), self.ttl)
+        pipe.execute()
+        self._hasher.update(chunk)
+
+    def touch(self) -> None:
+        """Refresh the TTL of the underlying blob."""
+        touch_file(self._r, self.key, self.ttl)
+
+    def exists(self) -> bool:
+        return self._r.exists(self.key) > 0  # type: ignore
+
+    def finalize(self) -> str:
+        """
+        Move a blob written through `append` to its content-addressed key.
+        If an identical blob already exists, it is reused and the new copy is dropped.
+
+        Returns:
+            The content-addressed key, which is also assigned to `self.key`.
+        """
+        target = content_key(self._hasher.hexdigest())
+        if self.key == target or not self.exists():
+            return self.key
+
+        while True:
+            if self._r.renamenx(self.key, target):
+                break
+            # Refresh before re-checking, so the collector can't remove it underneath us
+            touch_file(self._r, target, self.ttl)
+            if self._r.exists(target):
+                self._r.delete(self.key)
+                break
+
+        self.key = target
+        return self.key
 
     def __len__(self) -> int:
         return self._r.strlen(self.key)  # type: ignore
@@ -104,36 +155,49 @@ class RheaFileProxy(BaseModel):
     _key: RedisKey | None = PrivateAttr()
 
     @classmethod
-    def from_proxy(cls, key: RedisKey, store: Store) -> RheaFileProxy:
+    def from_proxy(
+        cls, key: RedisKey, store: Store, ttl: int = DEFAULT_FILE_TTL
+    ) -> RheaFileProxy:
         data = store.get(key, deserializer=cloudpickle.loads)
         if data is None:
             raise ValueError(f"Key '{key}' not in store")
-        return cls.model_validate(data)
+        proxy = cls.model_validate(data)
+        # Accessing a proxy keeps both the proxy and its blob alive
+        refresh_proxy(store.connector._redis_client, key.redis_key, proxy.file_key, ttl)
+        return proxy
 
     @classmethod
-    def from_file(cls, path: str, r: Redis) -> RheaFileProxy:
+    def from_key(
+        cls, name: str, file_key: str, r: Redis, ttl: int = DEFAULT_FILE_TTL
+    ) -> RheaFileProxy:
         """
-        Constructs a RheaFileProxy object from local file.
-        *Does not put in proxy!* Must add to proxy using .to_proxy()
+        Constructs a RheaFileProxy object for a blob that is already in Redis.
+        Raises KeyError if the blob does not exist.
         """
-        file_handle = RheaFileHandle(r=r)
-
-        with open(path, "rb") as f:
-            while chunk := f.read(1 << 20):
-                file_handle.append(chunk)
-
+        file_handle = RheaFileHandle(r=r, key=file_key, ttl=ttl)
+        file_handle.touch()
+        if not file_handle.exists():
+            raise KeyError(f"No blob stored under '{file_key}'")
         return cls(
-            name=os.path.basename(path),
+            name=name,
             format=file_handle.filetype(),
-            filename=os.path.basename(path),
+            filename=name,
             filesize=len(file_handle),
             file_key=file_handle.key,
         )
 
     @classmethod
-    def from_buffer(cls, name: str, contents: bytes, r: Redis) -> RheaFileProxy:
-        file_handle = RheaFileHandle(r=r)
-        file_handle.append(contents)
+    def from_stream(
+        cls, name: str, chunks: Iterable[bytes], r: Redis, ttl: int = DEFAULT_FILE_TTL
+    ) -> RheaFileProxy:
+        """
+        Constructs a RheaFileProxy object from an iterable of chunks, hashing the content
+        while it is written and reusing an existing identical blob.
+        """
+        file_handle = RheaFileHandle(r=r, ttl=ttl)
+        for chunk in chunks:
+            file_handle.append(chunk)
+        file_handle.finalize()
         return cls(
             name=name,
             format=file_handle.filetype(),
@@ -142,10 +206,49 @@ class RheaFileProxy(BaseModel):
             file_key=file_handle.key,
         )
 
-    def to_proxy(self, store: Store) -> str:
+    @classmethod
+    def from_file(cls, path: str, r: Redis) -> RheaFileProxy:
+        """
+        Constructs a RheaFileProxy object from local file.
+        The file is hashed locally first and only uploaded if no identical blob exists.
+        *Does not put in proxy!* Must add to proxy using .to_proxy()
+        """
+        name = os.path.basename(path)
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                hasher.update(chunk)
+
+        try:
+            return cls.from_key(name, content_key(hasher.hexdigest()), r)
+        except KeyError:
+            pass
+
+        def _read_chunks():
+            with open(path, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    yield chunk
+
+        return cls.from_stream(name, _read_chunks(), r)
+
+    @classmethod
+    def from_buffer(cls, name: str, contents: bytes, r: Redis) -> RheaFileProxy:
+        try:
+            return cls.from_key(
+                name, content_key(hashlib.sha256(contents).hexdigest()), r
+            )
+        except KeyError:
+            return cls.from_stream(name, (contents,), r)
+
+    def to_proxy(self, store: Store, ttl: int = DEFAULT_FILE_TTL) -> str:
         proxy = store.proxy(self.model_dump(), serializer=cloudpickle.dumps)
         key = get_key(proxy)
+        # Expire the proxy with its blob and register it as a reference to the blob
+        refresh_proxy(store.connector._redis_client, key.redis_key, self.file_key, ttl)  # type: ignore
         return key.redis_key  # type: ignore
 
-    def open(self, r: Redis) -> RheaFileHandle:
-        return RheaFileHandle(key=self.file_key, r=r)
+    def open(self, r: Redis, ttl: int = DEFAULT_FILE_TTL) -> RheaFileHandle:
+        file_handle = RheaFileHandle(key=self.file_key, r=r, ttl=ttl)
+        file_handle.touch()
+        return file_handle
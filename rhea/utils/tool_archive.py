@@ -0,0 +1,135 @@
+"""
+Packed tool directories.
+
+The preprocess pipeline repacks each tool repository into a zstd compressed tar, stored with
+a JSON index under `_archives/{tool_id}/{version}`. Agents extract it into their tool
+directory with a single request, instead of pulling the per-file `{tool_id}/` layout.
+"""
+
+import io
+import os
+import hashlib
+import logging
+import tarfile
+import zstandard
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Packed tool directories live under this prefix, outside of the per-file `{tool_id}/` layout
+ARCHIVE_PREFIX = "_archives"
+
+
+def archive_object_name(tool_id: str, version: str) -> str:
+    return f"{ARCHIVE_PREFIX}/{tool_id}/{version}.tar.zst"
+
+
+def archive_index_name(tool_id: str, version: str) -> str:
+    return f"{ARCHIVE_PREFIX}/{tool_id}/{version}.index.json"
+
+
+def is_hg_path(relpath: str) -> bool:
+    return any(part in (".hg", ".hg_archival.txt") for part in relpath.split("/"))
+
+
+def is_test_data_path(relpath: str) -> bool:
+    return relpath.split("/", 1)[0] == "test-data"
+
+
+def _repository_root(members: List[tarfile.TarInfo]) -> str | None:
+    """
+    Toolshed archives wrap the repository in a single `{name}-{revision}/` directory.
+    """
+    roots = {m.name.split("/", 1)[0] for m in members}
+    if len(roots) == 1 and any("/" in m.name for m in members):
+        return roots.pop()
+    return None
+
+
+def pack_tool_archive(buffer: io.BytesIO, level: int = 10) -> Tuple[io.BytesIO, Dict]:
+    """
+    Repack a (cleaned) tar.gz repository archive into a zstd compressed tar that can be
+    extracted directly into a tool directory.
+
+    Paths are made relative to the repository root. Mercurial metadata and `test-data/`
+    are left out, agents fetch test data from the per-file layout when a tool needs it.
+
+    Args:
+        buffer: BytesIO containing the tar.gz archive
+        level: zstd compression level
+
+    Returns:
+        BytesIO containing the tar.zst archive, and an index of the packed files
+    """
+    buffer.seek(0)
+    packed = io.BytesIO()
+    files: Dict[str, Dict] = {}
+
+    with tarfile.open(fileobj=buffer, mode="r:gz") as original_tar:
+        members = original_tar.getmembers()
+        root = _repository_root(members)
+
+        cctx = zstandard.ZstdCompressor(level=level)
+        with cctx.stream_writer(packed, closefd=False) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as packed_tar:
+                for member in members:
+                    name = member.name
+                    if root is not None:
+                        if name == root:
+                            continue
+                        name = name[len(root) + 1 :]
+                    if not name or is_hg_path(name) or is_test_data_path(name):
+                        continue
+
+                    member.name = name
+                    if member.isfile():
+                        data = original_tar.extractfile(member)
+                        if data is None:
+                            continue
+                        contents = data.read()
+                        files[name] = {
+                            "size": len(contents),
+                            "sha256": hashlib.sha256(contents).hexdigest(),
+                        }
+                        packed_tar.addfile(member, io.BytesIO(contents))
+                    else:
+                        packed_tar.addfile(member)
+
+    packed.seek(0)
+    index = {"format": "tar.zst", "root": root, "files": files}
+    logger.info(
+        f"Packed {len(files)} files into tool archive ({len(packed.getbuffer())} bytes)"
+    )
+    return packed, index
+
+
+def _is_safe_member(member: tarfile.TarInfo) -> bool:
+    name = os.path.normpath(member.name)
+    if os.path.isabs(name) or name.startswith(".."):
+        return False
+    if member.issym() or member.islnk():
+        target = os.path.normpath(os.path.join(os.path.dirname(name), member.linkname))
+        return not (os.path.isabs(member.linkname) or target.startswith(".."))
+    return member.isfile() or member.isdir()
+
+
+def extract_archive(fileobj, dest_dir: str) -> int:
+    """
+    Extract a zstd compressed tar archive from a (non-seekable) stream into `dest_dir`.
+    Returns: Number of members extracted.
+    """
+    # Extraction filters are only available on recent patch releases
+    has_filters = hasattr(tarfile, "data_filter")
+    extracted = 0
+    reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+    with tarfile.open(fileobj=reader, mode="r|") as tar:
+        for member in tar:
+            if not _is_safe_member(member):
+                logger.warning(f"Skipping unsafe archive member {member.name}")
+                continue
+            if has_filters:
+                tar.extract(member, dest_dir, filter="data")
+            else:
+                tar.extract(member, dest_dir)
+            extracted += 1
+    return extracted
@@ -0,0 +1,45 @@
+import pytest
+
+from rhea.agent.env_builder import EnvBuilder
+
+
+class RecordingBuilder(EnvBuilder):
+    def __init__(self, unsolvable: list[str], **kwargs):
+        super().__init__(**kwargs)
+        self.unsolvable = unsolvable
+        self.commands: list[list[str]] = []
+
+    async def _run(self, cmd):
+        self.commands.append(cmd)
+        if "--dry-run" in cmd and any(p in cmd for p in self.unsolvable):
+            return 1, "", "unsatisfiable"
+        return 0, "", ""
+
+
+@pytest.mark.parametrize(
+    "backend, expected",
+    [
+        ("conda", ["conda", "create"]),
+        ("libmamba", ["conda", "create", "--solver=libmamba"]),
+        ("micromamba", ["micromamba", "create"]),
+    ],
+)
+def test_command(backend, expected):
+    cmd = EnvBuilder(backend=backend).command("/envs/a", ["samtools=1.9"], "--offline")
+    assert cmd == [*expected, "-p", "/envs/a", "-y", "--offline", "samtools=1.9"]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        EnvBuilder(backend="pip")  # type: ignore
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_build_falls_back_to_relaxed_specs(anyio_backend, tmp_path):
+    builder = RecordingBuilder(["samtools=1.9"], pkgs_dir=str(tmp_path))
+    packages = await builder.build("/envs/a", [["samtools=1.9"], ["samtools>=1.9"]])
+
+    assert packages == ["samtools>=1.9"]
+    flags = [c[c.index("-y") + 1] for c in builder.commands]
+    assert flags == ["--dry-run", "--dry-run", "--download-only", "--offline"]
@@ -0,0 +1,48 @@
+import os
+import anyio
+import pytest
+
+from rhea.agent.env_cache import NodeEnvCache
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_concurrent_acquire_populates_once(anyio_backend, tmp_path):
+    cache = NodeEnvCache(root=str(tmp_path), max_bytes=1 << 30)
+    calls = []
+
+    async def populate(path: str):
+        calls.append(path)
+        os.makedirs(os.path.join(path, "bin"))
+        await anyio.sleep(0.1)
+
+    leases = []
+
+    async def acquire():
+        leases.append(await cache.acquire("env", populate))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(4):
+            tg.start_soon(acquire)
+
+    assert len(calls) == 1
+    assert len({lease.lease_path for lease in leases}) == 4
+    assert cache.is_ready("env")
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_evict_skips_leased_environments(anyio_backend, tmp_path):
+    cache = NodeEnvCache(root=str(tmp_path), max_bytes=0)
+
+    async def populate(path: str):
+        os.makedirs(path)
+        with open(os.path.join(path, "data"), "wb") as f:
+            f.write(b"x" * 8192)
+
+    lease = await cache.acquire("env", populate)
+    assert cache.is_ready("env")
+
+    cache.release(lease)
+    cache.evict()
+    assert not os.path.exists(cache.path("env"))
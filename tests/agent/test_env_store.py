@@ -0,0 +1,92 @@
+import os
+import uuid
+import pytest
+
+from redis import Redis
+
+from rhea.agent.env_store import (
+    EnvArtifact,
+    LocalArtifactCache,
+    PackLease,
+    PrefetchReader,
+)
+
+
+def artifact(name: str, size: int) -> EnvArtifact:
+    return EnvArtifact(
+        name=name, object_name=f"{name}.tar.zst", size=size, sha256="", created=0.0
+    )
+
+
+def test_env_artifact_json_roundtrip():
+    a = artifact("bwa", 1024)
+    assert EnvArtifact.from_json(a.to_json()) == a
+
+
+def test_local_cache_rejects_incomplete_artifacts(tmp_path):
+    cache = LocalArtifactCache(root=str(tmp_path), max_bytes=1024)
+    a = artifact("bwa", 4)
+    cache.put(a, iter([b"ab", b"cd"]))
+    assert cache.get(a) == cache.path(a.object_name)
+    assert cache.get(artifact("bwa", 5)) is None
+
+
+def test_local_cache_evicts_least_recently_used(tmp_path):
+    cache = LocalArtifactCache(root=str(tmp_path), max_bytes=8)
+    old, new = artifact("old", 4), artifact("new", 4)
+    cache.put(old, iter([b"aaaa"]))
+    os.utime(cache.path(old.object_name), (0, 0))
+    cache.put(new, iter([b"bbbb"]))
+
+    cache.put(artifact("next", 4), iter([b"cccc"]))
+    assert cache.get(old) is None
+    assert cache.get(new) is not None
+
+
+def test_prefetch_reader_streams_chunks():
+    chunks = [bytes([i]) * 1000 for i in range(20)]
+    reader = PrefetchReader(iter(chunks), max_chunks=2)
+    assert reader.read() == b"".join(chunks)
+    reader.close()
+
+
+def test_prefetch_reader_propagates_errors():
+    def chunks():
+        yield b"abc"
+        raise ConnectionError("connection reset")
+
+    reader = PrefetchReader(chunks())
+    with pytest.raises(ConnectionError):
+        reader.read()
+    reader.close()
+
+
+def test_local_cache_tee_only_keeps_complete_streams(tmp_path):
+    cache = LocalArtifactCache(root=str(tmp_path), max_bytes=1024)
+    a = artifact("bwa", 6)
+
+    partial = cache.tee(a, iter([b"abc", b"def"]))
+    next(partial)
+    partial.close()
+    assert cache.get(a) is None
+    assert os.listdir(tmp_path) == []
+
+    assert b"".join(cache.tee(a, iter([b"abc", b"def"]))) == b"abcdef"
+    assert cache.get(a) is not None
+
+
+def test_pack_lease_is_exclusive(r: Redis):
+    env_name = f"env-{uuid.uuid4().hex}"
+    first, second = PackLease(r, env_name), PackLease(r, env_name)
+
+    assert first.acquire()
+    assert not second.acquire()
+
+    # Releasing a lease that is not held leaves the holder's lease alone
+    second.release()
+    assert r.exists(first.key)
+
+    first.release()
+    assert not r.exists(first.key)
+    assert second.acquire()
+    second.release()
@@ -0,0 +1,100 @@
+import json
+import anyio
+import pytest
+
+from rhea.agent import image_cache
+from rhea.agent.image_cache import ImageCache
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """
+    Fake container engine tracking the images present on the node (by their digest), and
+    a fake registry tracking the digest each tag points at.
+    """
+    images: dict[str, str] = {}
+    registry: dict[str, str] = {}
+    calls: list[tuple[str, str]] = []
+
+    async def inspect_image(image, engine, format="{{.Id}}"):
+        if image not in images:
+            return None
+        if format == "{{.Size}}":
+            return "1024"
+        if format == "{{json .RepoDigests}}":
+            return json.dumps([f"{image.partition(':')[0]}@{images[image]}"])
+        return f"sha256:{image}"
+
+    async def remote_image_digest(image):
+        return registry.setdefault(image, "sha256:1")
+
+    async def pull_image(image, engine):
+        calls.append(("pull", image))
+        await anyio.sleep(0.1)
+        images[image] = registry.setdefault(image, "sha256:1")
+
+    async def remove_image(image, engine):
+        calls.append(("rmi", image))
+        images.pop(image)
+
+    monkeypatch.setattr(image_cache, "inspect_image", inspect_image)
+    monkeypatch.setattr(image_cache, "remote_image_digest", remote_image_digest)
+    monkeypatch.setattr(image_cache, "pull_image", pull_image)
+    monkeypatch.setattr(image_cache, "remove_image", remove_image)
+    return images, registry, calls
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_concurrent_acquire_pulls_once(anyio_backend, tmp_path, engine):
+    images, _, calls = engine
+    cache = ImageCache("docker", root=str(tmp_path), max_bytes=1 << 30)
+    leases = []
+
+    async def acquire():
+        leases.append(await cache.acquire("busybox:1.36"))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(4):
+            tg.start_soon(acquire)
+
+    assert calls == [("pull", "busybox:1.36")]
+    assert len({lease.lease_path for lease in leases}) == 4
+
+    # Present images are not pulled again
+    await cache.acquire("busybox:1.36")
+    assert calls == [("pull", "busybox:1.36")]
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_evict_skips_leased_images(anyio_backend, tmp_path, engine):
+    images, _, calls = engine
+    cache = ImageCache("docker", root=str(tmp_path), max_bytes=1024)
+
+    first = await cache.acquire("first:1")
+    await cache.acquire("second:1")
+    assert set(images) == {"first:1", "second:1"}
+
+    # Over budget, but both images are leased
+    await cache.evict()
+    assert set(images) == {"first:1", "second:1"}
+
+    cache.release(first)
+    await cache.evict()
+    assert set(images) == {"second:1"}
+    assert ("rmi", "first:1") in calls
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_acquire_pulls_moved_tags(anyio_backend, tmp_path, engine):
+    images, registry, calls = engine
+    cache = ImageCache("docker", root=str(tmp_path), max_bytes=1 << 30)
+
+    await cache.acquire("busybox:latest")
+    registry["busybox:latest"] = "sha256:2"
+    await cache.acquire("busybox:latest")
+
+    assert calls == [("pull", "busybox:latest")] * 2
+    assert images["busybox:latest"] == "sha256:2"
@@ -0,0 +1,79 @@
+import os
+import pytest
+from types import SimpleNamespace
+from typing import cast
+from minio.datatypes import Object
+
+from rhea.agent.tool_directory import (
+    directory_version,
+    clone_directory,
+    referenced_tool_paths,
+    select_objects,
+)
+
+
+def obj(name: str, etag: str) -> Object:
+    return cast(Object, SimpleNamespace(object_name=name, etag=etag))
+
+
+def test_directory_version_is_order_independent():
+    a = [obj("tool/a.py", "1"), obj("tool/b.xml", "2")]
+    assert directory_version(a) == directory_version(list(reversed(a)))
+
+
+def test_directory_version_tracks_etags():
+    a = [obj("tool/a.py", "1"), obj("tool/b.xml", "2")]
+    b = [obj("tool/a.py", "1"), obj("tool/b.xml", "3")]
+    assert directory_version(a) != directory_version(b)
+
+
+def test_clone_directory_leaves_the_cache_untouched(tmp_path):
+    src = tmp_path / "cache"
+    (src / "scripts").mkdir(parents=True)
+    cached = src / "scripts" / "run.py"
+    cached.write_text("print('hello')")
+    os.chmod(cached, 0o644)
+
+    dst = tmp_path / "work"
+    clone_directory(str(src), str(dst))
+
+    cloned = dst / "scripts" / "run.py"
+    assert cloned.read_text() == "print('hello')"
+
+    # Tools may modify their working copy in place
+    with open(cloned, "w") as f:
+        f.write("print('bye')")
+    os.chmod(cloned, 0o755)
+    assert cached.read_text() == "print('hello')"
+    assert os.stat(cached).st_mode & 0o777 == 0o644
+
+
+def test_referenced_tool_paths():
+    cmd = (
+        "python '$__tool_directory__/scripts/run.py' "
+        '--ref "${__tool_directory__}/test-data/ref.fa" > out.txt; '
+        "cat /tmp/work/macros.xml"
+    )
+    assert referenced_tool_paths(cmd) == {"scripts/run.py", "test-data/ref.fa"}
+    assert referenced_tool_paths(cmd, "/tmp/work") == {
+        "scripts/run.py",
+        "test-data/ref.fa",
+        "macros.xml",
+    }
+
+
+def test_select_objects_skips_unreferenced_payloads():
+    objs = [
+        obj("tool/run.py", "1"),
+        obj("tool/macros.xml", "2"),
+        obj("tool/.hg_archival.txt", "3"),
+        obj("tool/.hg/store/data", "4"),
+        obj("tool/test-data/input.fa", "5"),
+        obj("tool/test-data/ref/genome.fa", "6"),
+    ]
+    selected = select_objects(objs, "tool/", {"test-data/ref"})
+    assert [o.object_name for o in selected] == [
+        "tool/run.py",
+        "tool/macros.xml",
+        "tool/test-data/ref/genome.fa",
+    ]
@@ -0,0 +1,62 @@
+import os
+
+from rhea.agent.utils import conda_env_key, tool_environment, write_env_file
+from rhea.utils.schema import Requirement
+
+
+def requirement(name: str, version: str) -> Requirement:
+    return Requirement(type="package", value=name, version=version)
+
+
+def test_conda_env_key_is_canonical():
+    a = [requirement("samtools", "1.9"), requirement("bedtools", "2.30.0")]
+    b = [requirement("BEDTools", "2.30.0"), requirement("samtools", "1.9")]
+    assert conda_env_key(a) == conda_env_key(b)
+    assert conda_env_key(a) == conda_env_key(a + a[:1])
+
+
+def test_conda_env_key_tracks_versions():
+    a = [requirement("samtools", "1.9")]
+    b = [requirement("samtools", "1.10")]
+    assert conda_env_key(a) != conda_env_key(b)
+
+
+def test_write_env_file_passes_multiline_values_separately():
+    path, extra = write_env_file({"input": "/tmp/a.fa", "script": "a\nb"})
+    try:
+        with open(path) as f:
+            assert f.read() == "input=/tmp/a.fa\n"
+    finally:
+        os.remove(path)
+    assert extra == {"script": "a\nb"}
+
+
+def test_tool_environment_keeps_referenced_and_allowlisted(tmp_path):
+    script = tmp_path / "run.sh"
+    script.write_text('samtools sort "$input" -o "${output}" --threads \\$NOPE\n')
+    worker_env = {"PATH": "/usr/bin", "SECRET_KEY": "s", "CONDA_EXE": "/opt/conda"}
+    env = {
+        **worker_env,
+        "__tool_directory__": "/tmp/tool",
+        "input": "/tmp/in.bam",
+        "output": "/tmp/out.bam",
+        "unused": "x",
+    }
+
+    host = tool_environment(env, [str(script)], worker_env=worker_env)
+    assert host == {
+        "PATH": "/usr/bin",
+        "CONDA_EXE": "/opt/conda",
+        "__tool_directory__": "/tmp/tool",
+        "input": "/tmp/in.bam",
+        "output": "/tmp/out.bam",
+    }
+
+    container = tool_environment(
+        env, [str(script)], container=True, worker_env=worker_env
+    )
+    assert container == {
+        "__tool_directory__": "/tmp/tool",
+        "input": "/tmp/in.bam",
+        "output": "/tmp/out.bam",
+    }
@@ -0,0 +1,20 @@
+import os
+import pytest
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+
+
+@pytest.fixture
+def r():
+    client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def async_r():
+    return AsyncRedis(host=REDIS_HOST, port=REDIS_PORT)
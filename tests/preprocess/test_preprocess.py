@@ -1,7 +1,15 @@
 import pytest
 
 import io
+import json
+import tarfile
+from types import SimpleNamespace
+
+from minio.error import S3Error
+
+from rhea.agent.tool_directory import ToolDirectoryCache
 from rhea.preprocess.utils.fetch import *
+from rhea.utils.tool_archive import archive_index_name
 
 
 @pytest.fixture
@@ -38,3 +46,55 @@ def test_remove_hg(tool_repo):
     assert cleaned_buffer is not None
 
     assert len(cleaned_buffer.getbuffer()) < len(buffer.getbuffer())
+
+
+def repository_tar() -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, contents in [
+            ("repo-abc123/tool.xml", b'<tool id="cat1" version="1.0.0"></tool>'),
+            ("repo-abc123/macros.xml", b"<macros/>"),
+            ("repo-abc123/tool_data_table_conf.xml", b"<tables/>"),
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+            tar.addfile(info, io.BytesIO(contents))
+    return buffer
+
+
+class FakeMinio:
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+
+    def put_object(self, bucket, name, data, length, content_type=None):
+        self.objects[f"{bucket}/{name}"] = data.read(length)
+
+    def stat_object(self, bucket, name):
+        if f"{bucket}/{name}" not in self.objects:
+            raise S3Error(None, "NoSuchKey", None, None, None, None)  # type: ignore
+        return SimpleNamespace(object_name=name)
+
+
+def test_get_repository_tools():
+    assert get_repository_tools(repository_tar()) == [("cat1", "1.0.0")]
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_stored_archives_are_found_by_agents(anyio_backend, monkeypatch):
+    from rhea.preprocess.utils import fetch
+
+    monkeypatch.setattr(fetch, "get_tool_repository_tar", lambda *_: repository_tar())
+    minio = FakeMinio()
+    names = store_repository_archives(minio, "c198b9ec43cfbe0e", "owner", "cat")  # type: ignore
+    assert len(names) == 1
+
+    # Agents look archives up by the repository ID and version of their tool
+    cache = ToolDirectoryCache(minio)  # type: ignore
+    archive = await cache.stat_archive("c198b9ec43cfbe0e", "1.0.0")
+    assert archive is not None and archive.object_name == names[0]
+
+    index = json.loads(
+        minio.objects[f"dev/{archive_index_name('c198b9ec43cfbe0e', '1.0.0')}"]
+    )
+    assert index["tools"] == ["cat1"]
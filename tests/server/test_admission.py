@@ -0,0 +1,70 @@
+import anyio
+import pytest
+
+from mcp.server.fastmcp.exceptions import ToolError
+
+from rhea.server.admission import AdmissionController
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_executions_are_limited_per_session_and_tool(anyio_backend):
+    admission = AdmissionController(
+        max_concurrent=3, max_per_session=1, max_per_tool=2, queue_timeout=0.05
+    )
+    release = anyio.Event()
+
+    async def run(session_id: str, tool_id: str):
+        async with admission.admit(session_id, tool_id):
+            await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(run, "a", "cat1")
+        tg.start_soon(run, "b", "cat1")
+        await anyio.sleep(0.01)
+
+        # Session `a` already has an execution in flight, and `cat1` is at its cap
+        with pytest.raises(ToolError, match="busy"):
+            async with admission.admit("a", "cut1"):
+                pass
+        with pytest.raises(ToolError, match="busy"):
+            async with admission.admit("c", "cat1"):
+                pass
+
+        async with admission.admit("c", "cut1"):
+            pass
+
+        release.set()
+
+    # Slots and per-key semaphores are released
+    assert admission.queued == 0
+    assert len(admission._sessions) == 0 and len(admission._tools) == 0
+    async with admission.admit("a", "cat1"):
+        pass
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_waiting_executions_are_bounded(anyio_backend):
+    admission = AdmissionController(max_concurrent=1, max_queued=1, queue_timeout=5)
+    release = anyio.Event()
+    admitted = []
+
+    async def run(session_id: str):
+        async with admission.admit(session_id, "cat1"):
+            admitted.append(session_id)
+            await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(run, "a")
+        await anyio.sleep(0.01)
+        tg.start_soon(run, "b")  # Waits for `a`
+        await anyio.sleep(0.01)
+
+        with pytest.raises(ToolError, match="busy"):
+            async with admission.admit("c", "cat1"):
+                pass
+
+        release.set()
+
+    assert admitted == ["a", "b"]
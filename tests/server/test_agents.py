@@ -0,0 +1,82 @@
+import os
+import pickle
+import uuid
+from types import SimpleNamespace
+from typing import cast
+
+import anyio
+import pytest
+from academy.exchange.redis import RedisExchangeFactory
+from redis import Redis
+
+from rhea.server.agents import AgentRegistry
+from rhea.server.utils import get_agent_handle
+
+
+class FakeUnboundHandle:
+    def __init__(self, agent_id: str):
+        self.agent_id = agent_id
+
+    def bind_to_client(self, client):
+        return SimpleNamespace(agent_id=self.agent_id, client=client)
+
+
+class FakeFactory:
+    def __init__(self):
+        self.clients = 0
+
+    async def create_user_client(self, name: str):
+        self.clients += 1
+        return FakeClient()
+
+
+class FakeClient:
+    async def close(self):
+        pass
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_handles_are_bound_once_per_process(anyio_backend):
+    settings = SimpleNamespace(
+        redis_host=os.environ.get("REDIS_HOST", "localhost"),
+        redis_port=int(os.environ.get("REDIS_PORT", "6379")),
+    )
+    run_id = str(uuid.uuid4())
+    tool = SimpleNamespace(id="cat1")
+    r = Redis(settings.redis_host, settings.redis_port)
+    r.set(f"agent_handle:{run_id}-{tool.id}", pickle.dumps(FakeUnboundHandle("a1")))
+
+    factory = FakeFactory()
+    agents = AgentRegistry()
+    await agents.start(cast(RedisExchangeFactory, factory), name="rhea-manager-test")
+
+    # Each connection gets its own context, sharing the process' registry
+    def context():
+        return SimpleNamespace(
+            request_context=SimpleNamespace(
+                lifespan_context=SimpleNamespace(
+                    agents=agents, settings=settings, run_id=run_id
+                )
+            )
+        )
+
+    handles = []
+
+    async def call():
+        handles.append(await get_agent_handle(tool, context()))  # type: ignore
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(4):
+            tg.start_soon(call)
+
+    assert factory.clients == 1
+    assert all(handle is handles[0] for handle in handles)
+    assert len(agents._locks) == 0  # Released with their last holder
+    assert handles[0].client is agents.academy_client
+
+    agents.discard(tool.id)
+    assert agents.get(tool.id) is None
+
+    await agents.close()
+    assert agents.academy_client is None
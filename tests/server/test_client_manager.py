@@ -0,0 +1,92 @@
+import uuid
+import pytest
+
+import rhea.server.metrics as metrics
+from rhea.server.client_manager import (
+    LocalClientManager,
+    RedisClientManager,
+    ResourceRef,
+    SessionCache,
+)
+
+
+@pytest.fixture(params=["local", "redis"])
+def client_manager(request):
+    if request.param == "local":
+        return LocalClientManager(client_ttl=60)
+    return RedisClientManager(request.getfixturevalue("async_r"), client_ttl=60)
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_client_state_round_trips(anyio_backend, client_manager):
+    session_id = str(uuid.uuid4())
+    doc = ResourceRef(
+        uri="resource://documentation/cat1",
+        kind="documentation",
+        name="cat1 Documentation",
+        mime_type="text/markdown",
+    )
+    tool_id = "toolshed.g2.bx.psu.edu/repos/bgruening/text_processing/cat1/1.0"
+
+    await client_manager.set_client_tools(session_id, {"cat1": tool_id})
+    await client_manager.add_client_resources(session_id, [doc])
+
+    assert await client_manager.get_client_tool(session_id, "cat1") == tool_id
+    assert await client_manager.get_client_resource(session_id, doc.uri) == doc
+
+    state = await client_manager.get_client_state(session_id)
+    assert state.tools == {"cat1": tool_id}
+    assert state.resources == {doc.uri: doc}
+
+    # Swapping tools keeps the session's resources
+    await client_manager.set_client_tools(session_id, {"cut1": "cut1"})
+    state = await client_manager.get_client_state(session_id)
+    assert state.tools == {"cut1": "cut1"}
+    assert state.resources == {doc.uri: doc}
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_client_state_reports_changes(anyio_backend, client_manager):
+    session_id = str(uuid.uuid4())
+    doc = ResourceRef(uri="resource://documentation/cat1", kind="documentation")
+
+    assert await client_manager.set_client_tools(session_id, {"cat1": "cat1"})
+    assert not await client_manager.set_client_tools(session_id, {"cat1": "cat1"})
+    assert await client_manager.set_client_tools(session_id, {"cut1": "cut1"})
+
+    assert await client_manager.add_client_resources(session_id, [doc]) == 1
+    assert await client_manager.add_client_resources(session_id, [doc]) == 0
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_redis_client_state_expires(anyio_backend, async_r):
+    client_manager = RedisClientManager(async_r, client_ttl=60)
+    session_id = str(uuid.uuid4())
+    await client_manager.set_client_tools(session_id, {"cat1": "cat1"})
+    assert 0 < await async_r.ttl(client_manager._get_key(session_id)) <= 60
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_local_client_state_is_bounded_by_memory(anyio_backend):
+    tools = {f"tool_{i}": f"toolshed/repos/owner/tool_{i}/1.0" for i in range(10)}
+    client_manager = LocalClientManager(client_ttl=60, max_bytes=64 * 1024)
+    evictions = metrics.client_state_evictions.labels(reason="capacity")
+    before = evictions._value.get()
+
+    for i in range(100):
+        await client_manager.set_client_tools(f"session-{i}", tools)
+
+    states = client_manager.client_states
+    assert isinstance(states, SessionCache)
+    sessions = len(states)
+    assert 0 < sessions < 100
+    assert states.currsize <= 64 * 1024
+    assert evictions._value.get() - before == 100 - sessions
+
+    # Least recently used sessions go first
+    assert await client_manager.get_client_tools("session-99") == tools
+    assert await client_manager.get_client_tools("session-0") == {}
@@ -0,0 +1,82 @@
+import uuid
+from types import SimpleNamespace
+
+import anyio
+import pytest
+
+import rhea.server.coordinator as coordinator
+from rhea.server.coordinator import (
+    AgentCoordinator,
+    launch_lock_key,
+    launch_queue_key,
+    request_launch,
+)
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        tool = SimpleNamespace(id="cat1")
+        return SimpleNamespace(
+            scalar_one_or_none=lambda: SimpleNamespace(definition=tool)
+        )
+
+
+def test_launches_are_requested_once_per_run(r):
+    run_id = str(uuid.uuid4())
+
+    assert request_launch(r, run_id, "cat1", timeout=30)
+    assert not request_launch(r, run_id, "cat1", timeout=30)  # e.g. another worker
+    assert request_launch(r, run_id, "cut1", timeout=30)
+
+    assert r.lrange(launch_queue_key(run_id), 0, -1) == [b"cat1", b"cut1"]
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_coordinator_launches_requested_agents(
+    anyio_backend, r, async_r, monkeypatch
+):
+    run_id = str(uuid.uuid4())
+    launched = []
+
+    def launch(tool, settings, run_id):
+        launched.append(tool.id)
+        if tool.id == "cat1" and launched.count("cat1") == 1:
+            raise RuntimeError("Parsl is unavailable")
+
+    monkeypatch.setattr(coordinator, "launch", launch)
+
+    agent_coordinator = AgentCoordinator(
+        async_r,
+        lambda: FakeSession(),  # type: ignore
+        SimpleNamespace(),  # type: ignore
+        run_id,
+    )
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(agent_coordinator.run)
+
+        request_launch(r, run_id, "cat1", timeout=30)
+        with anyio.fail_after(5):
+            while not launched:
+                await anyio.sleep(0.01)
+
+        # Failed launches can be requested again
+        with anyio.fail_after(5):
+            while r.exists(launch_lock_key(run_id, "cat1")):
+                await anyio.sleep(0.01)
+        assert request_launch(r, run_id, "cat1", timeout=30)
+        with anyio.fail_after(5):
+            while len(launched) < 2:
+                await anyio.sleep(0.01)
+
+        tg.cancel_scope.cancel()
+
+    assert launched == ["cat1", "cat1"]
+    assert r.exists(launch_lock_key(run_id, "cat1"))
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+
+from mcp.server.fastmcp import Context
+
+from rhea.server.notifications import NotificationCoalescer
+
+
+class FakeSession:
+    def __init__(self):
+        self.sent: list[str] = []
+        self.related_request_ids: list[str | int | None] = []
+
+    async def send_notification(self, notification, related_request_id=None):
+        self.sent.append(notification.root.method.split("/")[1])
+        self.related_request_ids.append(related_request_id)
+
+
+def context(session, request_id=1) -> Context:
+    return cast(
+        Context,
+        SimpleNamespace(
+            request_context=SimpleNamespace(
+                request=None, session=session, request_id=request_id
+            )
+        ),
+    )
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_notifications_are_coalesced_per_session(anyio_backend):
+    notifier = NotificationCoalescer(window=0.01)
+    a, b = FakeSession(), FakeSession()
+
+    for _ in range(3):
+        await notifier.notify(context(a), "resources")
+    await notifier.notify(context(a), "tools")
+    await notifier.notify(context(b), "resources")
+    assert a.sent == []  # Sent once the window has passed
+
+    await notifier.flush()
+    assert sorted(a.sent) == ["resources", "tools"]
+    assert b.sent == ["resources"]
+
+    # Later updates are notified again
+    await notifier.notify(context(a), "resources")
+    await notifier.flush()
+    assert a.sent.count("resources") == 2
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_changes_during_send_are_notified(anyio_backend):
+    notifier = NotificationCoalescer(window=0.01)
+    session = FakeSession()
+    ctx = context(session)
+
+    async def send_notification(notification, related_request_id=None):
+        # The session changes again while the notification is in flight
+        if not session.sent:
+            await notifier.notify(ctx, "tools")
+        session.sent.append("tools")
+
+    session.send_notification = send_notification
+
+    await notifier.notify(ctx, "tools")
+    await notifier.flush()
+    assert session.sent == ["tools", "tools"]
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_stateless_notifications_are_sent_with_the_request(anyio_backend):
+    notifier = NotificationCoalescer(window=60, stateless=True)
+    session = FakeSession()
+
+    await notifier.notify(context(session, request_id=7), "tools")
+    assert session.sent == ["tools"]
+    assert session.related_request_ids == [7]
@@ -0,0 +1,202 @@
+from types import SimpleNamespace
+from typing import cast
+
+import httpx
+import pytest
+from pydantic import AnyUrl
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from mcp.server.fastmcp import Context
+from mcp.server.fastmcp.tools import Tool
+from mcp.server.streamable_http import MCP_SESSION_ID_HEADER
+
+from rhea.server.client_manager import LocalClientManager
+from rhea.server.rhea_fastmcp import (
+    RheaFastMCP,
+    RheaResourceManager,
+    RheaToolManager,
+    issue_session_ids,
+)
+from rhea.server.tool_cache import DocumentationStore
+from rhea.server.utils import (
+    DOCUMENTATION_URI_TEMPLATE,
+    documentation_resource_ref,
+    documentation_uri,
+    get_session_id,
+)
+
+
+def find_tools(query: str) -> str:
+    return query
+
+
+class FakeToolCache:
+    def __init__(self, missing: set[str] | None = None):
+        self.lookups = 0
+        self.missing = missing or set()
+
+    async def get(self, tool_id: str) -> Tool | None:
+        self.lookups += 1
+        if tool_id in self.missing:
+            return None
+        return Tool.from_function(find_tools, name=tool_id)
+
+
+def context(session, client_manager, tool_cache) -> Context:
+    return cast(
+        Context,
+        SimpleNamespace(
+            request_context=SimpleNamespace(
+                request=None,
+                session=session,
+                lifespan_context=SimpleNamespace(
+                    client_manager=client_manager, tool_cache=tool_cache
+                ),
+            )
+        ),
+    )
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_session_tools_are_layered_over_global_tools(anyio_backend):
+    manager = RheaToolManager()
+    manager.add_tool(find_tools, name="find_tools")
+    client_manager = LocalClientManager()
+    tool_cache = FakeToolCache()
+    a = context(object(), client_manager, tool_cache)
+    b = context(object(), client_manager, tool_cache)
+
+    await client_manager.set_client_tools(get_session_id(a), {"cat1": "cat1"})
+
+    listing = await manager.list_tools_in_context(a)
+    assert [tool.name for tool in listing] == ["find_tools", "cat1"]
+    assert [tool.name for tool in await manager.list_tools_in_context(b)] == [
+        "find_tools"
+    ]
+
+    # Listings are precomputed per tool set
+    assert await manager.list_tools_in_context(a) is listing
+    assert tool_cache.lookups == 1
+    assert manager._tools.keys() == {"find_tools"}
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_partial_listings_are_not_cached(anyio_backend):
+    manager = RheaToolManager()
+    client_manager = LocalClientManager()
+    tool_cache = FakeToolCache(missing={"cut1"})
+    ctx = context(object(), client_manager, tool_cache)
+    await client_manager.set_client_tools(
+        get_session_id(ctx), {"cat1": "cat1", "cut1": "cut1"}
+    )
+
+    assert [tool.name for tool in await manager.list_tools_in_context(ctx)] == ["cat1"]
+
+    tool_cache.missing.clear()
+    assert [tool.name for tool in await manager.list_tools_in_context(ctx)] == [
+        "cat1",
+        "cut1",
+    ]
+
+
+class FakeSession:
+    def __init__(self, documentation: str | None):
+        self.documentation = documentation
+        self.queries = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.queries += 1
+        documentation = self.documentation
+        return SimpleNamespace(
+            scalars=lambda: SimpleNamespace(first=lambda: documentation)
+        )
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_documentation_is_read_lazily_through_template(anyio_backend):
+    session = FakeSession("# samtools view\nView BAM files")
+    store = DocumentationStore(
+        cast(async_sessionmaker[AsyncSession], lambda: session), maxsize=8
+    )
+    manager = RheaResourceManager()
+    manager.add_template(
+        store.read, DOCUMENTATION_URI_TEMPLATE, mime_type="text/markdown"
+    )
+    ctx = context(object(), LocalClientManager(), FakeToolCache())
+
+    # Names may hold spaces, and IDs slashes, neither of which fits in a template parameter
+    tool = SimpleNamespace(
+        id="toolshed/repos/devteam/samtools_view",
+        name="samtools view",
+        user_provided_name="samtools view",
+    )
+    ref = documentation_resource_ref(tool)  # type: ignore
+    assert ref.name == "samtools view Documentation"
+    uri = str(AnyUrl(ref.uri))
+
+    resource = await manager.get_resource(uri, ctx)
+    assert resource is not None
+    assert await resource.read() == "# samtools view\nView BAM files"
+
+    # Documentation is cached across reads
+    resource = await manager.get_resource(uri, ctx)
+    assert resource is not None
+    await resource.read()
+    assert session.queries == 1
+
+    assert await manager.get_resource("resource://unknown", ctx) is None
+
+
+def test_documentation_falls_back_to_the_tool_id():
+    tool = SimpleNamespace(id="cat1", name=None, user_provided_name="")
+    ref = documentation_resource_ref(tool)  # type: ignore
+    assert ref.name == "cat1 Documentation"
+    assert ref.uri == documentation_uri("cat1")
+
+
+def test_asgi_app_serves_transports_and_custom_routes():
+    mcp = RheaFastMCP("Rhea")
+
+    @mcp.custom_route("/health", methods=["GET"])
+    async def health_check(request: Request) -> JSONResponse:
+        return JSONResponse({"status": "ok"})
+
+    paths = {getattr(route, "path", None) for route in mcp.asgi_app().routes}
+    assert {"/sse", "/messages", "/mcp", "/health"} <= paths
+
+    # SSE sessions cannot hop between workers
+    mcp.settings.stateless_http = True
+    paths = {getattr(route, "path", None) for route in mcp.asgi_app().routes}
+    assert "/sse" not in paths and {"/mcp", "/health"} <= paths
+
+    # Computed once, with list change notifications enabled
+    options = mcp._mcp_server.create_initialization_options()
+    assert options is mcp.initialization_options()
+    tools, resources = options.capabilities.tools, options.capabilities.resources
+    assert tools is not None and tools.listChanged
+    assert resources is not None and resources.listChanged
+
+
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.anyio
+async def test_session_ids_are_issued_to_stateless_requests(anyio_backend):
+    async def app(scope, receive, send):
+        await Response()(scope, receive, send)
+
+    transport = httpx.ASGITransport(app=issue_session_ids(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://rhea") as client:
+        issued = (await client.post("/mcp")).headers[MCP_SESSION_ID_HEADER]
+        response = await client.post("/mcp", headers={MCP_SESSION_ID_HEADER: issued})
+        assert MCP_SESSION_ID_HEADER not in response.headers
+        assert (await client.post("/mcp")).headers[MCP_SESSION_ID_HEADER] != issued
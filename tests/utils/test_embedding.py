@@ -0,0 +1,29 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from rhea.utils.embedding import reciprocal_rank_fusion
+from rhea.utils.models import GalaxyTool, search_index
+
+
+def test_reciprocal_rank_fusion():
+    vector = ["samtools_view", "bam_to_sam", "fastqc"]
+    lexical = ["bamtofastq", "samtools_fastx", "bam_to_sam"]
+
+    fused = reciprocal_rank_fusion([vector, lexical])
+
+    # Tools found by both retrievers come first, then ties keep their first ranking's order
+    assert fused[0] == "bam_to_sam"
+    assert fused[1:] == ["samtools_view", "bamtofastq", "samtools_fastx", "fastqc"]
+    assert reciprocal_rank_fusion([[], lexical]) == lexical
+
+
+def test_search_index_is_created_with_table():
+    indexes = {ix.name: ix for ix in GalaxyTool.__table__.indexes}
+    assert indexes["ix_galaxytools_search"] is search_index
+    ddl = str(
+        CreateIndex(search_index, if_not_exists=True).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert ddl.startswith("CREATE INDEX IF NOT EXISTS ix_galaxytools_search")
+    assert "USING gin" in ddl and "%(" not in ddl  # Literals only, no bound parameters
@@ -0,0 +1,69 @@
+import pytest
+
+import fakeredis
+from redis import Redis
+
+from rhea.utils.proxy import RheaFileHandle
+from rhea.utils.lifecycle import (
+    add_file_ref,
+    remove_file_ref,
+    count_file_refs,
+    collect_garbage,
+    refs_key,
+    proxy_ref,
+    session_ref,
+)
+
+
+@pytest.fixture
+def fake_r():
+    # Garbage collection scans every blob, so it never runs against a real instance
+    client = fakeredis.FakeRedis()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def blob(r: Redis):
+    file_handle = RheaFileHandle(r=r, ttl=60)
+    file_handle.append(b"col1,col2\n1,2\n")
+    yield file_handle
+    r.delete(file_handle.key, refs_key(file_handle.key))
+
+
+def test_append_sets_ttl(r, blob):
+    ttl = r.ttl(blob.key)
+    assert 0 < ttl <= 60
+
+
+def test_ref_extends_ttl(r, blob):
+    add_file_ref(r, blob.key, session_ref("abc"), ttl=3600)
+    assert r.ttl(blob.key) > 60
+    assert count_file_refs(r, blob.key) == 1
+
+
+def test_gc_keeps_referenced_blob(fake_r):
+    blob = RheaFileHandle(r=fake_r, ttl=60)
+    blob.append(b"col1,col2\n1,2\n")
+    add_file_ref(fake_r, blob.key, proxy_ref("abc"), ttl=3600)
+    collect_garbage(fake_r, grace_period=0)
+    assert fake_r.exists(blob.key)
+
+
+def test_gc_deletes_orphaned_blob(fake_r):
+    blob = RheaFileHandle(r=fake_r, ttl=60)
+    blob.append(b"col1,col2\n1,2\n")
+    add_file_ref(fake_r, blob.key, proxy_ref("abc"), ttl=3600)
+    remove_file_ref(fake_r, blob.key, proxy_ref("abc"))
+    stats = collect_garbage(fake_r, grace_period=0)
+    assert not fake_r.exists(blob.key)
+    assert stats.deleted == 1
+    assert stats.reclaimed_bytes == len(b"col1,col2\n1,2\n")
+
+
+def test_gc_adopts_blobs_without_ttl(fake_r):
+    # Written before blobs carried a TTL and references
+    fake_r.set("file:legacy", b"col1,col2\n1,2\n")
+    stats = collect_garbage(fake_r, grace_period=0, ttl=3600)
+    assert stats.adopted == 1 and stats.deleted == 0
+    assert 0 < fake_r.ttl("file:legacy") <= 3600
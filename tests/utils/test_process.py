@@ -0,0 +1,56 @@
+import os
+from types import SimpleNamespace
+from typing import cast
+
+from minio import Minio
+from proxystore.connectors.redis import RedisConnector
+
+from rhea.utils.lifecycle import refs_key
+from rhea.utils.process import FileConnector, get_object_proxy
+
+
+class FakeResponse:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def stream(self, amt: int):
+        yield self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.downloads = 0
+
+    def get_object(self, bucket: str, object_name: str) -> FakeResponse:
+        self.downloads += 1
+        return FakeResponse(self.data)
+
+
+def test_object_proxies_are_reused_while_their_blob_exists(r):
+    minio = FakeMinio(os.urandom(1 << 10))
+    connector = cast(RedisConnector, SimpleNamespace(_redis_client=r))
+    fc = FileConnector("cat1", connector, cast(Minio, minio), "dev", file_ttl=60)
+    object_name = f"cat1/test-data/{os.urandom(8).hex()}.txt"
+    etag_key = f"file_etag:dev/{object_name}:1"
+
+    first = get_object_proxy(fc, object_name, "1")
+    assert 0 < r.ttl(etag_key) <= 60
+    assert 0 < r.ttl(first.file_key) <= 60
+
+    assert get_object_proxy(fc, object_name, "1").file_key == first.file_key
+    assert minio.downloads == 1
+
+    # A collected blob is fetched again rather than handed out
+    r.delete(first.file_key, refs_key(first.file_key))
+    second = get_object_proxy(fc, object_name, "1")
+    assert minio.downloads == 2
+    assert r.exists(second.file_key)
+
+    r.delete(etag_key, second.file_key, refs_key(second.file_key))
@@ -0,0 +1,44 @@
+import os
+import pytest
+
+from redis import Redis
+
+from rhea.utils.proxy import RheaFileHandle, RheaFileProxy, content_key
+from rhea.utils.lifecycle import refs_key
+
+
+@pytest.fixture
+def contents(r: Redis):
+    data = os.urandom(1 << 16)
+    yield data
+    proxy = RheaFileProxy.from_buffer("data.bin", data, r)
+    r.delete(proxy.file_key, refs_key(proxy.file_key))
+
+
+def test_buffer_is_content_addressed(r, contents):
+    first = RheaFileProxy.from_buffer("a.bin", contents, r)
+    second = RheaFileProxy.from_buffer("b.bin", contents, r)
+    assert first.file_key == second.file_key
+    assert first.file_key.startswith("file:sha256:")
+    assert first.filesize == len(contents)
+
+
+def test_file_reuses_buffer_blob(r, contents, tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(contents)
+    from_buffer = RheaFileProxy.from_buffer("data.bin", contents, r)
+    from_file = RheaFileProxy.from_file(str(path), r)
+    assert from_file.file_key == from_buffer.file_key
+
+
+def test_finalize_drops_duplicate_upload(r, contents):
+    existing = RheaFileProxy.from_buffer("a.bin", contents, r)
+
+    file_handle = RheaFileHandle(r=r)
+    temp_key = file_handle.key
+    for i in range(0, len(contents), 4096):
+        file_handle.append(contents[i : i + 4096])
+
+    assert file_handle.finalize() == existing.file_key
+    assert not r.exists(temp_key)
+    assert file_handle.key == content_key(file_handle._hasher.hexdigest())
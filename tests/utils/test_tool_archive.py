@@ -0,0 +1,26 @@
+import io
+import tarfile
+
+from rhea.utils.tool_archive import extract_archive, pack_tool_archive
+
+
+def test_packed_archive_roundtrip(tmp_path):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, contents in [
+            ("repo-abc123/run.py", b"print('hello')"),
+            ("repo-abc123/macros/macros.xml", b"<macros/>"),
+            ("repo-abc123/test-data/input.fa", b">seq"),
+            ("repo-abc123/.hg_archival.txt", b"repo: abc123"),
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+            tar.addfile(info, io.BytesIO(contents))
+
+    packed, index = pack_tool_archive(buffer)
+    assert set(index["files"]) == {"run.py", "macros/macros.xml"}
+
+    assert extract_archive(packed, str(tmp_path)) == 2
+    assert (tmp_path / "run.py").read_text() == "print('hello')"
+    assert (tmp_path / "macros" / "macros.xml").exists()
+    assert not (tmp_path / "test-data").exists()